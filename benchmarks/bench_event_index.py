@@ -0,0 +1,97 @@
+"""
+EventIndex 範圍查詢微基準測試
+
+比較「逐筆過濾所有活動」與 EventIndex 二分搜尋在 10k / 100k / 1M 筆活動下的查詢時間
+
+執行方式: python benchmarks/bench_event_index.py [筆數 ...]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_index import EventIndex, to_timestamp  # noqa: E402
+
+BASE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SPAN_DAYS = 730
+
+
+def make_events(count, seed=42):
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        start = BASE + timedelta(minutes=rng.randrange(SPAN_DAYS * 24 * 60))
+        events.append({
+            "id": f"page-{i:08d}",
+            "name": f"活動 {i}",
+            "time": start.isoformat(),
+            "category": rng.choice(["會議", "活動", "提醒", "任務"]),
+            "importance": rng.choice(["高", "中", "低"]),
+            "notes": "",
+            "reminder_status": rng.choice(["已提醒", "未提醒"])
+        })
+    return events
+
+
+def linear_range(events, start_date, end_date):
+    """目前的做法：每次查詢都解析並比較所有活動"""
+    start_ts, end_ts = start_date.timestamp(), end_date.timestamp()
+    matched = [event for event in events if start_ts <= to_timestamp(event["time"]) <= end_ts]
+    matched.sort(key=lambda event: to_timestamp(event["time"]))
+    return matched
+
+
+def make_windows(count, seed=7):
+    """模擬查詢預設：今天、後7天、本月、本年"""
+    rng = random.Random(seed)
+    windows = []
+    for _ in range(count):
+        start = BASE + timedelta(days=rng.randrange(SPAN_DAYS - 366))
+        length = rng.choice([timedelta(days=1), timedelta(days=8), timedelta(days=31), timedelta(days=365)])
+        windows.append((start, start + length - timedelta(seconds=1)))
+    return windows
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def run(count):
+    events = make_events(count)
+    windows = make_windows(20)
+
+    index, build_seconds = timed(EventIndex, events)
+
+    # 1M 筆時逐筆過濾非常慢，只取少量查詢估算
+    linear_windows = windows if count <= 100_000 else windows[:3]
+    linear_total = 0.0
+    for start_date, end_date in linear_windows:
+        expected, elapsed = timed(linear_range, events, start_date, end_date)
+        linear_total += elapsed
+        assert [event["id"] for event in index.range(start_date, end_date)] == [event["id"] for event in expected]
+
+    index_total = 0.0
+    matched = 0
+    for start_date, end_date in windows:
+        result, elapsed = timed(index.range, start_date, end_date)
+        index_total += elapsed
+        matched += len(result)
+
+    linear_avg = linear_total / len(linear_windows) * 1000
+    index_avg = index_total / len(windows) * 1000
+    print(
+        f"{count:>9,} 筆 | 建立索引 {build_seconds:7.2f}s | "
+        f"逐筆過濾 {linear_avg:9.2f} ms/次 | 索引 {index_avg:7.3f} ms/次 | "
+        f"平均命中 {matched // len(windows):,} 筆 | 加速 {linear_avg / index_avg:,.0f}x"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,145 @@
+"""
+Event 資料模型微基準測試
+
+比較「以 dict 保存活動、使用時才解析時間字串」與 Event (__slots__，建立時解析一次)
+在記憶體用量、建立時間，以及每日提醒掃描 (計算距離活動天數並依重要性篩選) 的時間
+
+執行方式: python benchmarks/bench_event_model.py [筆數 ...]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_model import Event, Importance  # noqa: E402
+
+BASE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SPAN_DAYS = 730
+
+
+def make_pages(count, seed=42):
+    """產生 _parse_event 取得的原始欄位"""
+    rng = random.Random(seed)
+    pages = []
+    for i in range(count):
+        start = BASE + timedelta(minutes=rng.randrange(SPAN_DAYS * 24 * 60))
+        pages.append((
+            f"page-{i:08d}",
+            f"活動 {i}",
+            start.isoformat(),
+            rng.choice(["會議", "活動", "提醒", "任務"]),
+            rng.choice(["高", "中", "低"]),
+            "",
+            rng.choice(["已提醒", "未提醒"])
+        ))
+    return pages
+
+
+def build_dicts(pages):
+    return [
+        {
+            "id": page_id,
+            "name": name,
+            "time": event_time,
+            "category": category,
+            "importance": importance,
+            "notes": notes,
+            "reminder_status": reminder_status
+        }
+        for page_id, name, event_time, category, importance, notes, reminder_status in pages
+    ]
+
+
+def build_events(pages):
+    return [Event(*page) for page in pages]
+
+
+def scan_dicts(events, today):
+    """原本 check_and_remind 的做法：每筆活動解析兩次時間字串"""
+    matched = 0
+    for event in events:
+        event_time = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
+        event_date = event_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        days_until_event = (event_date - today).days
+        importance = event["importance"]
+        if importance == "高" and 0 <= days_until_event <= 7:
+            matched += 1
+        elif importance == "中" and days_until_event in (3, 0):
+            matched += 1
+        elif importance == "低" and days_until_event == 0:
+            matched += 1
+    for event in events:
+        event_time = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
+        event_date = event_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        if (event_date - today).days == 0:
+            matched += 1
+    return matched
+
+
+def scan_events(events, today):
+    """Event 已預先解析 UTC 日期與重要性"""
+    matched = 0
+    today = today.date()
+    for event in events:
+        days_until_event = (event.day - today).days
+        importance = event.importance
+        if importance == Importance.HIGH and 0 <= days_until_event <= 7:
+            matched += 1
+        elif importance == Importance.MEDIUM and days_until_event in (3, 0):
+            matched += 1
+        elif importance == Importance.LOW and days_until_event == 0:
+            matched += 1
+    for event in events:
+        if event.day == today:
+            matched += 1
+    return matched
+
+
+def measure(build, pages):
+    """返回 (結果, 建立秒數, 佔用位元組)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(pages)
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, size
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def run(count):
+    pages = make_pages(count)
+    today = BASE + timedelta(days=SPAN_DAYS // 2)
+
+    dicts, dict_build, dict_bytes = measure(build_dicts, pages)
+    events, event_build, event_bytes = measure(build_events, pages)
+
+    # 建立時間另外量測，避免 tracemalloc 的額外負擔
+    _, dict_build = timed(build_dicts, pages)
+    _, event_build = timed(build_events, pages)
+
+    expected, dict_scan = timed(scan_dicts, dicts, today)
+    result, event_scan = timed(scan_events, events, today)
+    assert result == expected
+
+    print(
+        f"{count:>9,} 筆 | dict {dict_bytes / count:6.0f} B/筆, 建立 {dict_build * 1000:7.1f} ms, "
+        f"掃描 {dict_scan * 1000:7.1f} ms | Event {event_bytes / count:6.0f} B/筆, "
+        f"建立 {event_build * 1000:7.1f} ms, 掃描 {event_scan * 1000:7.1f} ms | "
+        f"掃描加速 {dict_scan / event_scan:,.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000]
+    for size in sizes:
+        run(size)
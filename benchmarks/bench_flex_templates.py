@@ -0,0 +1,68 @@
+"""
+Flex / 快速回覆範本微基準測試
+
+比較每次回覆都重新建立 SDK 模型 (原本的做法) 與 FlexTemplates 預先建立的範本，
+回報每則回覆的 CPU 時間；「含序列化」另外計入 ReplyMessageRequest 轉為 JSON 的時間
+
+執行方式: python benchmarks/bench_flex_templates.py [次數]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linebot.v3.messaging import FlexContainer, FlexMessage, ReplyMessageRequest, TextMessage  # noqa: E402
+
+from flex_templates import (  # noqa: E402
+    FlexTemplates,
+    build_category_quick_reply,
+    build_event_creation_bubble,
+    build_importance_selector,
+    build_query_form
+)
+
+NOW = datetime(2025, 1, 1, 9, 30)
+
+
+def cpu_per_call(func, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def serialized(build):
+    return lambda: ReplyMessageRequest(reply_token="x" * 32, messages=[build()]).to_json()
+
+
+def run(iterations):
+    templates = FlexTemplates()
+    cases = {
+        "活動設定 Flex 表單": (
+            lambda: FlexMessage(alt_text="活動設定表單", contents=FlexContainer.from_dict(build_event_creation_bubble(NOW))),
+            lambda: templates.event_creation_flex(NOW)
+        ),
+        "重要性選擇": (build_importance_selector, lambda: templates.importance_selector),
+        "分類選擇": (
+            lambda: TextMessage(text="📅 設定活動 (步驟 3/4)\n請選擇活動分類", quick_reply=build_category_quick_reply()),
+            lambda: templates.category_selector
+        ),
+        "查詢選單": (build_query_form, lambda: templates.query_form),
+    }
+
+    print(f"每則回覆的 CPU 時間 (µs)，{iterations:,} 次平均")
+    print(f"{'範本':<14} | {'重建':>9} | {'範本':>9} | {'重建+序列化':>11} | {'範本+序列化':>11}")
+    for name, (before, after) in cases.items():
+        # 兩種做法產生的內容必須相同
+        assert before().to_dict() == after().to_dict(), name
+        rebuild = cpu_per_call(before, iterations)
+        cached = cpu_per_call(after, iterations)
+        rebuild_json = cpu_per_call(serialized(before), iterations)
+        cached_json = cpu_per_call(serialized(after), iterations)
+        print(f"{name:<14} | {rebuild:9.1f} | {cached:9.1f} | {rebuild_json:11.1f} | {cached_json:11.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
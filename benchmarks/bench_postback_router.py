@@ -0,0 +1,137 @@
+"""
+postback 分派基準測試
+
+從 main.py、flex_templates.py 與 query_results.py 的 Flex / QuickReply / Template 建構函數收集所有 postback data，
+確認每個 action 都已在 main.postback_router 註冊，並比較舊版 if/elif 字串比對鏈與 PostbackRouter 的分派時間。
+兩者每次分派都只要 1-2 微秒，與 Notion / LINE 呼叫相比可忽略；改用分派表是為了維護 (不必在意比對順序、
+新 action 不會被前綴比對攔截)，並不會更快
+
+main.py 在載入時需要 Notion / LINE，因此以 webhook_replay.py 的本地替身啟動
+
+執行方式: python benchmarks/bench_postback_router.py [重複次數]
+"""
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from routing import PostbackRouter  # noqa: E402
+from webhook_replay import LineStandIn, NotionStandIn  # noqa: E402
+
+# 產生 postback data 的模組
+SOURCES = ("main.py", "flex_templates.py", "query_results.py")
+
+# 舊版 handle_postback 的比對順序：("==" 完全相等 / "^" 前綴)
+LEGACY_CHAIN = [
+    ("==", "action=confirm_event"),
+    ("==", "action=confirm_event_flex"),
+    ("==", "action=cancel_event"),
+    ("==", "action=cancel_event_flex"),
+    ("==", "action=open_event_form_flex"),
+    ("==", "action=select_custom_time"),
+    ("==", "action=select_date"),
+    ("==", "action=select_start_date"),
+    ("==", "action=select_end_date"),
+    ("==", "action=select_event_date"),
+    ("==", "action=query_date"),
+    ("==", "action=query_today"),
+    ("==", "action=query_next7days"),
+    ("==", "action=query_month"),
+    ("==", "action=query_year"),
+    ("==", "action=open_query_form"),
+    ("==", "action=select_date_range"),
+    ("==", "action=open_event_form"),
+    ("==", "action=select_datetime_flex"),
+    ("^", "action=select_importance_flex"),
+    ("^", "action=select_category_flex"),
+    ("^", "action=need_notes_flex"),
+    ("==", "action=set_importance"),
+    ("^", "action=set_importance"),
+]
+
+
+def collect_postback_data():
+    """掃描產生 postback data 的模組中所有寫死的 postback data，f-string 的欄位以 0 代入"""
+    found = set()
+    for name in SOURCES:
+        with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+            source = f.read()
+
+        found.update(re.findall(r'(?<!f)"(action=[A-Za-z0-9_]+(?:&[^"{}]*)?)"', source))
+        # send_confirmation_message 以 f-string 產生 _flex 版本
+        for base in re.findall(r'f"(action=[A-Za-z0-9_]+)\{', source):
+            found.update({base, base + "_flex"})
+        # 帶參數的 f-string，例如 f"action=select_importance_flex&value={importance}"
+        for template in re.findall(r'f"(action=[A-Za-z0-9_]+&[^"]*)"', source):
+            found.add(re.sub(r"\{[^}]*\}", "0", template))
+    return sorted(found)
+
+
+def load_postback_router():
+    """以本地 Notion / LINE 替身載入 main.py，取得實際註冊的 postback_router"""
+    notion = NotionStandIn(events=0).start()
+    line = LineStandIn().start()
+    os.environ.update({
+        "NOTION_BASE_URL": notion.url,
+        "LINE_API_HOST": line.url,
+        "NOTION_TOKEN": "benchmark",
+        "NOTION_DATABASE_ID": "benchmark-db",
+        "LINE_CHANNEL_ACCESS_TOKEN": "benchmark",
+        "LINE_CHANNEL_SECRET": "benchmark",
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+    return main.postback_router
+
+
+def legacy_dispatch(data):
+    """模擬舊版 if/elif 鏈並以 split 取出 value 參數"""
+    for position, (kind, pattern) in enumerate(LEGACY_CHAIN):
+        if (kind == "==" and data == pattern) or (kind == "^" and data.startswith(pattern)):
+            value = data.split("value=")[1] if "value=" in data else None
+            return position, value
+    return None, None
+
+
+def bench(func, payloads, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for data in payloads:
+            func(data)
+    elapsed = time.perf_counter() - started
+    return elapsed / (repeat * len(payloads)) * 1e9
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    payloads = collect_postback_data()
+    actions = sorted({PostbackRouter.parse(data)["action"] for data in payloads})
+    router = load_postback_router()
+
+    unregistered = [action for action in actions if action not in router.actions]
+    assert not unregistered, f"建構函數產生了未註冊的 postback action: {unregistered}"
+    unused = sorted(set(router.actions) - set(actions))
+    if unused:
+        print(f"注意：以下已註冊的 action 沒有在建構函數中找到: {unused}")
+
+    print(f"收集到 {len(payloads)} 種 postback data，{len(actions)} 個 action，皆已在 main.postback_router 註冊\n")
+    print(f"{'postback data':<48} {'if/elif (ns)':>12} {'router (ns)':>12}")
+    for data in payloads:
+        legacy_ns = bench(legacy_dispatch, [data], repeat)
+        router_ns = bench(router.resolve, [data], repeat)
+        print(f"{data:<48} {legacy_ns:>12.0f} {router_ns:>12.0f}")
+
+    legacy_avg = bench(legacy_dispatch, payloads, repeat)
+    router_avg = bench(router.resolve, payloads, repeat)
+    print(f"\n{'平均':<48} {legacy_avg:>12.0f} {router_avg:>12.0f}")
+    print(f"router / if/elif = {router_avg / legacy_avg:.2f}；兩者都在微秒等級，分派時間沒有明顯差異")
+    # 舊版鏈沒有 query_page / query_cards，這兩種 data 在舊版中找不到分支
+    missing = [data for data in payloads if legacy_dispatch(data)[0] is None]
+    if missing:
+        print(f"舊版 if/elif 鏈沒有對應分支: {missing}")
@@ -0,0 +1,587 @@
+"""
+Webhook 重播基準測試
+
+在本機啟動 Notion API 與 LINE Messaging API 的替身伺服器 (可設定延遲與錯誤率)，
+以 LINE_CHANNEL_SECRET 簽署合成 (或錄製) 的 webhook 內容，依目標速率送到 /callback，
+並針對每個情境回報：
+
+- ack: /callback 回覆 200 的延遲
+- e2e: 從送出 webhook 到替身收到對應 replyToken 的 reply 的延遲
+- p50 / p95 / p99、吞吐量，以及每個上游端點被呼叫的次數
+
+情境：create_event (Flex 表單建立活動的完整流程)、query_today、query_next7days、
+query_month、query_year、manual_remind，另可用 --payloads 重播錄製的 webhook (recorded)
+
+預設在同一個行程內載入 main.py 並以 werkzeug 提供服務 (NOTION_BASE_URL / LINE_API_HOST 指向替身)；
+若要測試已部署的行程，使用 --target 並以 --notion-port / --line-port 固定替身的埠號，
+再讓目標行程設定對應的 NOTION_BASE_URL 與 LINE_API_HOST。
+注意替身與 bot 在同一個行程時會共用 GIL，數據適合前後比較而非絕對容量。
+
+執行方式: python benchmarks/webhook_replay.py [--rate 5] [--duration 10] [--scenarios query_today,manual_remind]
+"""
+import argparse
+import base64
+import contextlib
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CATEGORIES = ["工作", "會議", "活動", "個人"]
+IMPORTANCE = ["高", "中", "低"]
+PROPERTY_TYPES = [
+    ("活動名稱", "title"), ("日期時間", "date"), ("分類", "select"),
+    ("重要性", "select"), ("備註", "rich_text"), ("提醒狀態", "select")
+]
+
+
+class StandIn:
+    """
+    上游 API 替身：每個請求先等待設定的延遲，依錯誤率回傳錯誤，並依路由計數
+
+    子類別實作 route(method, path) 與 respond(method, path, body, params)
+    """
+
+    def __init__(self, name, latency_ms=0, jitter_ms=0, error_rate=0.0, port=0):
+        self.name = name
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def handle(self, method, path, body, params=None):
+        with self._lock:
+            self.counts[f"{method} {self.route(method, path)}"] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_response()
+        return self.respond(method, path, body, params or {})
+
+    def route(self, method, path):
+        return path
+
+    def respond(self, method, path, body, params):
+        raise NotImplementedError
+
+    def error_response(self):
+        return 503, {"message": "injected error"}
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 標頭與內容分開寫出，keep-alive 連線上若不關閉 Nagle 會與用戶端的 delayed ACK 互等約 40ms
+            disable_nagle_algorithm = True
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+                url = urlsplit(self.path)
+                status, payload = stand_in.handle(self.command, url.path, body, parse_qs(url.query))
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class NotionStandIn(StandIn):
+    """
+    Notion 資料庫替身：依日期過濾條件回傳分頁結果，支援建立與更新頁面
+
+    extra_properties 為 bot 不會讀取的額外屬性數量，用來模擬實際資料庫中較大的頁面；
+    查詢帶有 filter_properties 時只回傳指定 ID 的屬性
+    """
+
+    def __init__(self, events=200, extra_properties=0, **kwargs):
+        super().__init__("notion", **kwargs)
+        self.schema = {
+            name: {"id": f"p{index}", "name": name, "type": prop_type}
+            for index, (name, prop_type) in enumerate(PROPERTY_TYPES + [
+                (f"額外屬性 {i}", "rich_text") for i in range(extra_properties)
+            ])
+        }
+        self.pages = [self._make_page(i) for i in range(events)]
+        self._pages_lock = threading.Lock()
+
+    def route(self, method, path):
+        return re.sub(r"/(databases|pages)/[^/]+", r"/\1/{id}", path)
+
+    def respond(self, method, path, body, params):
+        if method == "POST" and path.endswith("/query"):
+            return 200, self._query(body, params.get("filter_properties"))
+        if method == "GET" and path.startswith("/v1/databases/"):
+            return 200, {"object": "database", "id": path.rsplit("/", 1)[-1], "properties": self.schema}
+        if method == "POST" and path == "/v1/pages":
+            page = self._new_page(f"bench-{uuid.uuid4()}", body.get("properties", {}))
+            with self._pages_lock:
+                self.pages.append(page)
+            return 200, page
+        if method == "PATCH" and path.startswith("/v1/pages/"):
+            page_id = path.rsplit("/", 1)[-1]
+            with self._pages_lock:
+                page = next((page for page in self.pages if page["id"] == page_id), None)
+                if page is None:
+                    page = self._new_page(page_id, {})
+                page["properties"].update(body.get("properties", {}))
+                page["last_edited_time"] = _now_iso()
+            return 200, page
+        return 404, {"object": "error", "status": 404, "code": "object_not_found", "message": path}
+
+    def error_response(self):
+        return 503, {"object": "error", "status": 503, "code": "service_unavailable", "message": "injected error"}
+
+    def _query(self, body, filter_properties=None):
+        start, end = _date_bounds(body.get("filter"))
+        with self._pages_lock:
+            matched = [
+                page for page in self.pages
+                if (start is None or page["properties"]["日期時間"]["date"]["start"] >= start)
+                and (end is None or page["properties"]["日期時間"]["date"]["start"] <= end)
+            ]
+        matched.sort(key=lambda page: page["properties"]["日期時間"]["date"]["start"])
+        offset = int(body.get("start_cursor") or 0)
+        page_size = int(body.get("page_size") or 100)
+        results = matched[offset:offset + page_size]
+        if filter_properties:
+            wanted = {name for name, prop in self.schema.items() if prop["id"] in filter_properties}
+            results = [
+                dict(page, properties={name: value for name, value in page["properties"].items() if name in wanted})
+                for page in results
+            ]
+        has_more = offset + page_size < len(matched)
+        return {
+            "object": "list",
+            "results": results,
+            "has_more": has_more,
+            "next_cursor": str(offset + page_size) if has_more else None
+        }
+
+    def _make_page(self, index):
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today + timedelta(days=random.randrange(-30, 365), hours=random.randrange(7, 22))
+        extras = {
+            name: {"rich_text": [{"text": {"content": "x" * 80}, "plain_text": "x" * 80}]}
+            for name in list(self.schema)[len(PROPERTY_TYPES):]
+        }
+        return self._new_page(f"bench-{index:06d}", {
+            **extras,
+            "活動名稱": {"title": [{"text": {"content": f"活動 {index}"}}]},
+            "日期時間": {"date": {"start": start.isoformat()}},
+            "分類": {"select": {"name": random.choice(CATEGORIES)}},
+            "重要性": {"select": {"name": random.choice(IMPORTANCE)}},
+            "備註": {"rich_text": []},
+            "提醒狀態": {"select": {"name": "未提醒"}}
+        })
+
+    @staticmethod
+    def _new_page(page_id, properties):
+        defaults = {
+            "活動名稱": {"title": []},
+            "日期時間": {"date": None},
+            "分類": {"select": None},
+            "重要性": {"select": None},
+            "備註": {"rich_text": []},
+            "提醒狀態": {"select": None}
+        }
+        defaults.update(properties)
+        return {"object": "page", "id": page_id, "last_edited_time": _now_iso(), "properties": defaults}
+
+
+class LineStandIn(StandIn):
+    """LINE Messaging API 替身：記錄每個 replyToken 的回覆時間，供計算端到端延遲"""
+
+    def __init__(self, **kwargs):
+        super().__init__("line", **kwargs)
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
+
+    def expect(self, reply_token):
+        """登記等待 reply_token 的回覆，返回 threading.Event 與結果 dict"""
+        waiter = (threading.Event(), {})
+        with self._waiters_lock:
+            self._waiters[reply_token] = waiter
+        return waiter
+
+    def forget(self, reply_token):
+        with self._waiters_lock:
+            self._waiters.pop(reply_token, None)
+
+    def route(self, method, path):
+        return re.sub(r"/(richmenu-[0-9a-f]+|U[0-9a-f]{32})", "/{id}", path)
+
+    def handle(self, method, path, body, params=None):
+        status, payload = super().handle(method, path, body, params)
+        if path == "/v2/bot/message/reply":
+            with self._waiters_lock:
+                waiter = self._waiters.pop(body.get("replyToken"), None)
+            if waiter:
+                waiter[1].update(at=time.perf_counter(), status=status)
+                waiter[0].set()
+        return status, payload
+
+    def respond(self, method, path, body, params):
+        if path in ("/v2/bot/message/reply", "/v2/bot/message/push"):
+            messages = body.get("messages", [])
+            return 200, {"sentMessages": [{"id": str(uuid.uuid4().int)[:18]} for _ in messages]}
+        return 200, {}
+
+    def error_response(self):
+        return 500, {"message": "injected error"}
+
+
+# 合成的 webhook 事件
+def _base_event(event_type, user_id):
+    return {
+        "type": event_type,
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex
+    }
+
+
+def message(text):
+    def build(user_id):
+        event = _base_event("message", user_id)
+        event["message"] = {"id": str(random.randrange(10 ** 17, 10 ** 18)), "type": "text", "quoteToken": uuid.uuid4().hex, "text": text}
+        return event
+    return build
+
+
+def postback(data, params=None):
+    def build(user_id):
+        event = _base_event("postback", user_id)
+        event["postback"] = {"data": data}
+        if params:
+            event["postback"]["params"] = params(user_id) if callable(params) else params
+        return event
+    return build
+
+
+def _tomorrow_at_ten(user_id):
+    return {"datetime": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%dT10:00")}
+
+
+SCENARIOS = {
+    "create_event": [
+        postback("action=open_event_form_flex"),
+        postback("action=select_datetime_flex", _tomorrow_at_ten),
+        postback("action=select_importance_flex&value=高"),
+        postback("action=select_category_flex&value=工作"),
+        message("壓力測試活動"),
+        postback("action=need_notes_flex&value=no"),
+        postback("action=confirm_event_flex"),
+    ],
+    "query_today": [postback("action=query_today")],
+    "query_next7days": [postback("action=query_next7days")],
+    "query_month": [postback("action=query_month")],
+    "query_year": [postback("action=query_year")],
+    "manual_remind": [message("手動提醒")],
+}
+
+
+def load_recorded(path):
+    """每行一個錄製的 webhook 內容 (JSON)，重播時每個事件換上新的 replyToken 與 webhookEventId"""
+    steps = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            for recorded in json.loads(line).get("events", []):
+                def build(user_id, recorded=recorded):
+                    event = json.loads(json.dumps(recorded))
+                    event["replyToken"] = uuid.uuid4().hex
+                    event["webhookEventId"] = uuid.uuid4().hex.upper()[:26]
+                    event["timestamp"] = int(time.time() * 1000)
+                    return event
+                steps.append(build)
+    return steps
+
+
+class WebhookClient:
+    """以 keep-alive 連線送出已簽署的 webhook，每個執行緒各自一條連線"""
+
+    def __init__(self, target, secret):
+        parts = urlsplit(target)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = parts.path or "/callback"
+        self.secret = secret.encode("utf-8")
+        self._local = threading.local()
+
+    def send(self, event):
+        body = json.dumps({"destination": "Ubenchmark", "events": [event]}, ensure_ascii=False).encode("utf-8")
+        signature = base64.b64encode(hmac.new(self.secret, body, hashlib.sha256).digest()).decode("ascii")
+        headers = {"Content-Type": "application/json", "X-Line-Signature": signature}
+        for retry in (False, True):
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                connection.request("POST", self.path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self._local.connection = None
+                if retry:
+                    raise
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def run_scenario(name, steps, client, line, notion, rate, duration, concurrency, reply_timeout):
+    """以每秒 rate 個新使用者開始情境，每位使用者依序送出各步驟並等待 reply 後才送下一步"""
+    samples = []
+    samples_lock = threading.Lock()
+    notion_before, line_before = notion.snapshot(), line.snapshot()
+    sessions = max(1, int(rate * duration))
+
+    def session(index):
+        user_id = "U" + hashlib.md5(f"{name}-{index}-{time.time()}".encode()).hexdigest()
+        for build in steps:
+            event = build(user_id)
+            reply_token = event["replyToken"]
+            done, result = line.expect(reply_token)
+            sent = time.perf_counter()
+            try:
+                status = client.send(event)
+            except Exception:
+                status = None
+            acked = time.perf_counter()
+            replied = status == 200 and done.wait(reply_timeout)
+            line.forget(reply_token)
+            ok = replied and result.get("status") == 200
+            with samples_lock:
+                samples.append({
+                    "ack": acked - sent,
+                    "e2e": result["at"] - sent if replied else None,
+                    "ok": ok
+                })
+            if not ok:
+                return
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in range(sessions):
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(session, index)
+    elapsed = time.perf_counter() - started
+
+    acks = [sample["ack"] for sample in samples]
+    e2es = [sample["e2e"] for sample in samples if sample["e2e"] is not None]
+    notion_after, line_after = notion.snapshot(), line.snapshot()
+    return {
+        "scenario": name,
+        "sessions": sessions,
+        "steps": len(samples),
+        "errors": sum(1 for sample in samples if not sample["ok"]),
+        "elapsed": elapsed,
+        "throughput": len(e2es) / elapsed if elapsed else 0.0,
+        "ack_ms": {f"p{pct}": _ms(percentile(acks, pct)) for pct in (50, 95, 99)},
+        "e2e_ms": {f"p{pct}": _ms(percentile(e2es, pct)) for pct in (50, 95, 99)},
+        "notion_calls": _delta(notion_before, notion_after),
+        "line_calls": _delta(line_before, line_after),
+    }
+
+
+def print_report(results, out=sys.stdout):
+    header = f"{'scenario':<16} {'steps':>6} {'err':>4} {'req/s':>7} " \
+             f"{'ack p50':>8} {'p95':>7} {'p99':>7} {'e2e p50':>8} {'p95':>7} {'p99':>7}  (ms)"
+    print(header, file=out)
+    for result in results:
+        ack, e2e = result["ack_ms"], result["e2e_ms"]
+        print(
+            f"{result['scenario']:<16} {result['steps']:>6} {result['errors']:>4} {result['throughput']:>7.1f} "
+            f"{_fmt(ack['p50']):>8} {_fmt(ack['p95']):>7} {_fmt(ack['p99']):>7} "
+            f"{_fmt(e2e['p50']):>8} {_fmt(e2e['p95']):>7} {_fmt(e2e['p99']):>7}",
+            file=out
+        )
+    print("\n上游呼叫次數", file=out)
+    for result in results:
+        calls = {**{f"notion {key}": value for key, value in result["notion_calls"].items()},
+                 **{f"line {key}": value for key, value in result["line_calls"].items()}}
+        summary = ", ".join(f"{key} x{value}" for key, value in sorted(calls.items())) or "-"
+        print(f"{result['scenario']:<16} {summary}", file=out)
+
+
+def start_local_target(notion, line, args):
+    """設定環境變數後載入 main.py，並以 werkzeug 在隨機埠提供服務"""
+    os.environ.update({
+        "NOTION_BASE_URL": notion.url,
+        "LINE_API_HOST": line.url,
+        "NOTION_TOKEN": os.getenv("NOTION_TOKEN", "benchmark"),
+        "NOTION_DATABASE_ID": os.getenv("NOTION_DATABASE_ID", "benchmark-db"),
+        "LINE_CHANNEL_ACCESS_TOKEN": os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "benchmark"),
+        "LINE_CHANNEL_SECRET": args.secret,
+        "ADMIN_USER_ID": ",".join(f"U{index:032x}" for index in range(args.recipients)),
+    })
+    if args.notion_rate:
+        os.environ["NOTION_RATE_LIMIT"] = str(args.notion_rate)
+        os.environ["NOTION_RATE_BURST"] = str(args.notion_rate)
+
+    from werkzeug.serving import make_server
+    import main
+
+    server = make_server("127.0.0.1", 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/callback"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="LINE webhook 重播基準測試")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="以逗號分隔的情境名稱")
+    parser.add_argument("--payloads", help="錄製的 webhook 內容 (JSON Lines)，加入 recorded 情境")
+    parser.add_argument("--rate", type=float, default=5, help="每秒開始的使用者數")
+    parser.add_argument("--duration", type=float, default=10, help="每個情境持續的秒數")
+    parser.add_argument("--concurrency", type=int, default=64, help="同時進行中的使用者上限")
+    parser.add_argument("--reply-timeout", type=float, default=30, help="等待 reply 的秒數")
+    parser.add_argument("--events", type=int, default=200, help="Notion 替身中的活動數量")
+    parser.add_argument("--notion-extra-properties", type=int, default=0, help="Notion 替身頁面中 bot 不讀取的額外屬性數量")
+    parser.add_argument("--recipients", type=int, default=3, help="手動提醒的收件者數量 (ADMIN_USER_ID)")
+    parser.add_argument("--notion-latency", type=float, default=150, help="Notion 替身延遲 (ms)")
+    parser.add_argument("--notion-jitter", type=float, default=50, help="Notion 替身延遲抖動 (ms)")
+    parser.add_argument("--notion-error-rate", type=float, default=0.0, help="Notion 替身回傳 503 的機率")
+    parser.add_argument("--notion-rate", type=float, help="覆寫 NOTION_RATE_LIMIT")
+    parser.add_argument("--line-latency", type=float, default=40, help="LINE 替身延遲 (ms)")
+    parser.add_argument("--line-jitter", type=float, default=10, help="LINE 替身延遲抖動 (ms)")
+    parser.add_argument("--line-error-rate", type=float, default=0.0, help="LINE 替身回傳 500 的機率")
+    parser.add_argument("--notion-port", type=int, default=0, help="固定 Notion 替身的埠號 (搭配 --target)")
+    parser.add_argument("--line-port", type=int, default=0, help="固定 LINE 替身的埠號 (搭配 --target)")
+    parser.add_argument("--target", help="已啟動的 /callback 網址，未提供則在本行程載入 main.py")
+    parser.add_argument("--secret", default=os.getenv("LINE_CHANNEL_SECRET") or "benchmark-secret", help="簽署用的 channel secret")
+    parser.add_argument("--json", help="將結果另存為 JSON")
+    parser.add_argument("--verbose", action="store_true", help="顯示 bot 本身的輸出")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scenarios = {name: SCENARIOS[name] for name in args.scenarios.split(",") if name}
+    if args.payloads:
+        scenarios["recorded"] = load_recorded(args.payloads)
+
+    notion = NotionStandIn(
+        events=args.events, extra_properties=args.notion_extra_properties, latency_ms=args.notion_latency, jitter_ms=args.notion_jitter,
+        error_rate=args.notion_error_rate, port=args.notion_port
+    ).start()
+    line = LineStandIn(
+        latency_ms=args.line_latency, jitter_ms=args.line_jitter,
+        error_rate=args.line_error_rate, port=args.line_port
+    ).start()
+    print(f"Notion 替身: {notion.url}  LINE 替身: {line.url}")
+
+    report = sys.stdout
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            # bot 每個事件都會 print，壓測時改寫到 devnull
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        target = args.target or start_local_target(notion, line, args)
+        client = WebhookClient(target, args.secret)
+        print(f"目標: {target}，每秒 {args.rate} 位使用者，每個情境 {args.duration} 秒\n", file=report)
+
+        results = []
+        for name, steps in scenarios.items():
+            result = run_scenario(
+                name, steps, client, line, notion,
+                args.rate, args.duration, args.concurrency, args.reply_timeout
+            )
+            results.append(result)
+            print(f"完成 {name}: {result['steps']} 個步驟，{result['errors']} 個錯誤", file=report)
+
+    print(file=report)
+    print_report(results, report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def _date_bounds(query_filter):
+    """從 databases.query 的 and 條件取出日期時間的上下限"""
+    start = end = None
+    for condition in (query_filter or {}).get("and", []):
+        date = condition.get("date") if condition.get("property") == "日期時間" else None
+        if date:
+            start = date.get("on_or_after", start)
+            end = date.get("on_or_before", end)
+    return start, end
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _delta(before, after):
+    return {key: after[key] - before.get(key, 0) for key in after if after[key] - before.get(key, 0)}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+if __name__ == "__main__":
+    main()
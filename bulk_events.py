@@ -0,0 +1,116 @@
+import re
+from datetime import datetime, timezone
+
+# 單一活動的格式: [新增活動] 活動名稱 YYYY/MM/DD [HH:MM] [分類] [重要性] [備註]
+EVENT_PREFIX = re.compile(r'^新增(?:活動)?\s+')
+EVENT_PATTERN = re.compile(
+    r'^(.+?)\s+(\d{4}/\d{1,2}/\d{1,2}(?:\s+\d{1,2}:\d{1,2})?)\s*'
+    r'(?:\[([^\]]+)\])?\s*(?:\[([^\]]+)\])?\s*(?:\[([^\]]*)\])?$'
+)
+VALID_IMPORTANCE = ("高", "中", "低")
+
+
+def parse_event_line(text):
+    """
+    解析一行活動文字，開頭的「新增活動」可省略
+
+    參數:
+    text (str): 例如「開會 2025/01/01 14:30 [工作] [高] [準備簡報]」
+
+    返回:
+    dict: add_event 的參數 (event_name, event_time, category, importance, notes)，格式不符時返回 None
+
+    日期或重要性不正確時拋出 ValueError，訊息可直接回覆給用戶
+    """
+    match = EVENT_PATTERN.match(EVENT_PREFIX.sub("", text.strip(), count=1))
+    if not match:
+        return None
+
+    date_str = match.group(2).strip()
+    try:
+        if ' ' in date_str:
+            event_time = datetime.strptime(re.sub(r'\s+', ' ', date_str), "%Y/%m/%d %H:%M")
+        else:
+            event_time = datetime.strptime(date_str, "%Y/%m/%d").replace(hour=9, minute=0)  # 預設為上午9點
+    except ValueError:
+        raise ValueError(f"無效的日期時間: {date_str}")
+
+    importance = match.group(4).strip() if match.group(4) else "中"
+    if importance not in VALID_IMPORTANCE:
+        raise ValueError(f"無效的重要性: {importance}。請使用「高」、「中」或「低」。")
+
+    return {
+        "event_name": match.group(1).strip(),
+        "event_time": event_time.replace(tzinfo=timezone.utc),
+        "category": match.group(3).strip() if match.group(3) else "活動",
+        "importance": importance,
+        "notes": match.group(5).strip() if match.group(5) else ""
+    }
+
+
+def parse_event_lines(text):
+    """
+    解析多行活動文字 (訊息或上傳的文字檔)，每行一個活動
+
+    空白行、以 # 開頭的註解行與只有「新增活動」的標題行會被略過
+
+    返回:
+    tuple: ([(行號, add_event 參數)], [(行號, 原始文字, 錯誤原因)])
+    """
+    events = []
+    errors = []
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#") or line in ("新增", "新增活動"):
+            continue
+        try:
+            fields = parse_event_line(line)
+        except ValueError as e:
+            errors.append((line_number, line, str(e)))
+            continue
+        if fields is None:
+            errors.append((line_number, line, "格式不正確"))
+        else:
+            events.append((line_number, fields))
+    return events, errors
+
+
+def format_summary(results, errors, limit=5000):
+    """
+    產生批次新增的摘要訊息
+
+    參數:
+    results (list): [(行號, add_event 參數, 是否成功)]
+    errors (list): parse_event_lines 返回的解析錯誤
+    limit (int): 訊息長度上限 (LINE 文字訊息最多 5000 字)
+
+    返回:
+    str: 摘要文字
+    """
+    succeeded = [(number, fields) for number, fields, ok in results if ok]
+    failed = [
+        (number, f"{fields['event_name']} (Notion 寫入失敗)") for number, fields, ok in results if not ok
+    ] + [(number, f"{line} ({reason})") for number, line, reason in errors]
+    failed.sort()
+
+    header = f"📥 批次新增活動：成功 {len(succeeded)} 項，失敗 {len(failed)} 項"
+    lines = []
+    if succeeded:
+        lines.append("\n✅ 成功：")
+        lines.extend(
+            f"- {fields['event_name']} {fields['event_time'].strftime('%Y/%m/%d %H:%M')}"
+            for _, fields in succeeded
+        )
+    if failed:
+        lines.append("\n❌ 失敗：")
+        lines.extend(f"- 第 {number} 行：{text}" for number, text in failed)
+
+    # 超過長度上限時截斷明細，保留總數
+    message = header
+    for index, line in enumerate(lines):
+        if len(message) + len(line) + 30 > limit:
+            remaining = sum(1 for rest in lines[index:] if rest.startswith("- "))
+            message += f"\n…以及其他 {remaining} 項"
+            break
+        message += "\n" + line
+    return message
@@ -0,0 +1,191 @@
+import io
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from circuit_breaker import CircuitOpenError
+from ical import ImportMapping, iter_vevents
+from notion_manager import NotionQueryError
+
+# 去重查詢的時間窗口：同一批中相隔超過此間隔的活動分開查詢，避免未排序的檔案一次查詢跨越數年
+DEDUP_WINDOW_GAP = timedelta(days=1)
+
+
+def dedup_windows(times, gap=DEDUP_WINDOW_GAP):
+    """
+    將活動時間排序後分群，相鄰時間相隔超過 gap 就另起一群
+
+    參數:
+    times (iterable): 帶時區的活動時間
+
+    返回:
+    list: [(開始時間, 結束時間)]，查詢的總時間長度不超過活動數乘以 gap
+    """
+    windows = []
+    for moment in sorted(times):
+        if windows and moment - windows[-1][1] <= gap:
+            windows[-1][1] = moment
+        else:
+            windows.append([moment, moment])
+    return [tuple(window) for window in windows]
+
+
+class CalendarImporter:
+    """
+    將 .ics 檔匯入 Notion 資料庫
+
+    在背景執行緒逐行解析上傳的檔案，每累積 batch_size 個 VEVENT：
+    1. 查詢這批活動所在時段 (依時間分群，每群只查詢活動實際所在的幾天) 已存在的活動，
+       以 UID (本 bot 匯出的 <頁面 ID>@notion) 或 (名稱, 時間) 去除重複
+    2. 以 NotionManager.add_events 在速率限制內並行建立頁面
+    去重查詢失敗時中止匯入，不會在無法確認是否重複的情況下建立活動。
+    進度與結果以 notify(user_id, text) 推播給用戶 (LINE push)；每位用戶同時只能進行一個匯入
+    """
+
+    def __init__(self, notion_manager, notify, mapping=None):
+        self.notion_manager = notion_manager
+        self.notify = notify
+        self.mapping = mapping or ImportMapping(
+            categories=json.loads(os.getenv("ICS_IMPORT_CATEGORY_MAP", "{}")),
+            importance=json.loads(os.getenv("ICS_IMPORT_IMPORTANCE_MAP", "{}")),
+            default_category=os.getenv("ICS_IMPORT_DEFAULT_CATEGORY", "活動"),
+            default_importance=os.getenv("ICS_IMPORT_DEFAULT_IMPORTANCE", "中")
+        )
+        self.batch_size = int(os.getenv("ICS_IMPORT_BATCH_SIZE", "50"))
+        self.max_events = int(os.getenv("ICS_IMPORT_MAX_EVENTS", "1000"))
+        # 至少間隔幾秒才推播一次進度，避免大量消耗推播訊息額度
+        self.progress_seconds = float(os.getenv("ICS_IMPORT_PROGRESS_SECONDS", "30"))
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def start(self, user_id, fileobj):
+        """
+        在背景執行緒匯入已上傳的檔案 (二進位檔案物件，匯入結束後關閉)
+
+        返回:
+        bool: 是否開始匯入；該用戶已有匯入在進行時返回 False
+        """
+        with self._lock:
+            if user_id in self._active:
+                fileobj.close()
+                return False
+            self._active.add(user_id)
+        threading.Thread(target=self._run, args=(user_id, fileobj), daemon=True).start()
+        return True
+
+    def _run(self, user_id, fileobj):
+        started = time.perf_counter()
+        stats = Counter()
+        try:
+            self.notify(user_id, "📥 已收到行事曆檔案，開始匯入…")
+            lines = io.TextIOWrapper(fileobj, encoding="utf-8-sig", errors="replace", newline="")
+            self.import_lines(lines, lambda stats: self.notify(user_id, self.format_progress(stats)), stats)
+            self.notify(user_id, self.format_result(stats, time.perf_counter() - started))
+        except (CircuitOpenError, NotionQueryError) as e:
+            # 無法查詢既有活動時不能去除重複，中止匯入並告知已建立的數量
+            self.notify(user_id, f"匯入中止：{e}\n中止前已建立 {stats['created']} 項，再次匯入同一檔案會略過已建立的活動")
+        except Exception as e:
+            print(f"匯入行事曆時出錯: {e}")
+            self.notify(user_id, "匯入行事曆時發生錯誤，請確認檔案為 .ics 格式後再試")
+        finally:
+            fileobj.close()
+            with self._lock:
+                self._active.discard(user_id)
+
+    def import_lines(self, lines, progress=None, stats=None):
+        """
+        匯入 iCalendar 文字行
+
+        參數:
+        lines (iterable): 文字行
+        progress (callable, optional): 接收目前統計，每批建立後呼叫 (間隔至少 ICS_IMPORT_PROGRESS_SECONDS 秒)
+        stats (Counter, optional): 累計統計的 Counter，匯入中止時呼叫端仍可得知已建立的數量
+
+        返回:
+        Counter: created, failed, duplicates, invalid, recurring, skipped (超過上限)；
+        去重查詢失敗時拋出 CircuitOpenError 或 NotionQueryError
+        """
+        stats = Counter() if stats is None else stats
+        seen_uids = set()
+        seen_keys = set()
+        last_report = time.monotonic()
+        batch = []
+
+        for vevent in iter_vevents(lines):
+            uid = vevent.get("UID", ({}, ""))[1].strip()
+            if uid and uid in seen_uids:
+                # 同一 UID 的其他 VEVENT 為重複活動的例外日期，只匯入第一個
+                stats["duplicates"] += 1
+                continue
+            if stats["created"] + stats["failed"] + len(batch) >= self.max_events:
+                stats["skipped"] += 1
+                continue
+            try:
+                fields = self.mapping.to_fields(vevent)
+            except ValueError:
+                stats["invalid"] += 1
+                continue
+            if "RRULE" in vevent:
+                # 重複規則不展開，只建立第一次
+                stats["recurring"] += 1
+            if uid:
+                seen_uids.add(uid)
+            batch.append((uid, fields))
+
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch, seen_keys, stats)
+                batch = []
+                if progress and time.monotonic() - last_report >= self.progress_seconds:
+                    progress(stats)
+                    last_report = time.monotonic()
+
+        self._write_batch(batch, seen_keys, stats)
+        return stats
+
+    def _write_batch(self, batch, seen_keys, stats):
+        """去除已存在的活動後，並行建立這批活動；任何一個去重查詢失敗都會在建立前拋出例外"""
+        if not batch:
+            return
+        existing_ids = set()
+        for start, end in dedup_windows(fields["event_time"] for _, fields in batch):
+            for event in self.notion_manager.query_events(start, end):
+                existing_ids.add(event.id)
+                seen_keys.add((event.name, event.start_ts))
+
+        to_create = []
+        for uid, fields in batch:
+            key = (fields["event_name"], fields["event_time"].timestamp())
+            if key in seen_keys or (uid.endswith("@notion") and uid[:-len("@notion")] in existing_ids):
+                stats["duplicates"] += 1
+                continue
+            seen_keys.add(key)
+            to_create.append(fields)
+
+        results = self.notion_manager.add_events(to_create)
+        created = sum(result is not None for result in results)
+        stats["created"] += created
+        stats["failed"] += len(results) - created
+
+    @staticmethod
+    def format_progress(stats):
+        return f"⏳ 匯入中：已建立 {stats['created']} 項，略過重複 {stats['duplicates']} 項，失敗 {stats['failed']} 項"
+
+    @staticmethod
+    def format_result(stats, elapsed):
+        lines = [
+            f"✅ 行事曆匯入完成 ({elapsed:.0f} 秒)",
+            f"建立：{stats['created']} 項",
+            f"略過重複：{stats['duplicates']} 項"
+        ]
+        if stats["failed"]:
+            lines.append(f"寫入失敗：{stats['failed']} 項")
+        if stats["invalid"]:
+            lines.append(f"無法解析：{stats['invalid']} 項")
+        if stats["recurring"]:
+            lines.append(f"重複活動只建立第一次：{stats['recurring']} 項")
+        if stats["skipped"]:
+            lines.append(f"超過單次上限未匯入：{stats['skipped']} 項")
+        return "\n".join(lines)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟時直接拒絕呼叫，訊息可直接回覆給使用者"""
+
+    def __init__(self, message="Notion 服務暫時無法使用，請稍後再試"):
+        super().__init__(message)
+
+
+class CircuitBreaker:
+    """
+    上游服務的斷路器
+
+    - closed: 正常呼叫，連續失敗 (含過慢的呼叫) 達到 failure_threshold 次即開啟
+    - open: 直接拋出 CircuitOpenError，reset_timeout 秒後進入 half_open
+    - half_open: 只放行一個探測請求，成功則關閉，失敗則重新開啟
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, slow_call_seconds=10, reset_timeout=30, name="Notion"):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._trips = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    @property
+    def is_open(self):
+        return self.state == self.OPEN
+
+    def before_call(self):
+        """呼叫上游前檢查；斷路器開啟或已有探測請求進行中時拋出 CircuitOpenError"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self._rejected += 1
+        raise CircuitOpenError()
+
+    def record_success(self, elapsed):
+        """記錄成功的呼叫；超過 slow_call_seconds 的呼叫視為失敗"""
+        if elapsed > self.slow_call_seconds:
+            print(f"{self.name} 呼叫耗時 {elapsed:.1f} 秒，超過 {self.slow_call_seconds} 秒，視為失敗")
+            self.record_failure()
+            return
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"{self.name} 斷路器已恢復")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._trips += 1
+                    print(f"{self.name} 斷路器開啟：連續 {self._failures} 次失敗，{self.reset_timeout} 秒後重新探測")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """探測請求因與上游狀態無關的原因結束 (例如參數錯誤) 時，讓下一個請求繼續探測"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "rejected": self._rejected
+            }
+
+    def _current_state(self):
+        """需持有 self._lock"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
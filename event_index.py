@@ -0,0 +1,123 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+
+from event_model import Event, parse_time
+
+
+class EventIndex:
+    """
+    以活動開始時間建立的記憶體索引
+
+    - 排序陣列 (開始時間, ID)：以二分搜尋回答任意時間範圍，O(log n + k)
+    - 每日分桶 (UTC 日期 -> ID)：直接取出某一天的活動
+    """
+
+    def __init__(self, events=()):
+        self._starts = []   # 依 (開始時間, ID) 排序
+        self._events = {}   # ID -> (開始時間, 活動資料)
+        self._days = {}     # UTC 日期 -> 依開始時間排序的 [(開始時間, ID)]
+
+        entries = []
+        for event in events:
+            start_ts = _start_timestamp(event)
+            if start_ts is None:
+                continue
+            self._events[event["id"]] = (start_ts, event)
+            entries.append((start_ts, event["id"]))
+
+        # 批次建立時排序一次，避免逐筆插入
+        entries.sort()
+        self._starts = entries
+        for entry in entries:
+            self._days.setdefault(_day_key(entry[0]), []).append(entry)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __contains__(self, event_id):
+        return event_id in self._events
+
+    def add(self, event):
+        """新增或更新活動"""
+        self.remove(event["id"])
+        start_ts = _start_timestamp(event)
+        if start_ts is None:
+            return
+        entry = (start_ts, event["id"])
+        self._events[event["id"]] = (start_ts, event)
+        insort(self._starts, entry)
+        insort(self._days.setdefault(_day_key(start_ts), []), entry)
+
+    def remove(self, event_id):
+        """移除活動，不存在時忽略"""
+        existing = self._events.pop(event_id, None)
+        if existing is None:
+            return
+        entry = (existing[0], event_id)
+        _remove_sorted(self._starts, entry)
+
+        day_key = _day_key(existing[0])
+        bucket = self._days.get(day_key)
+        if bucket is not None:
+            _remove_sorted(bucket, entry)
+            if not bucket:
+                del self._days[day_key]
+
+    def range(self, start_date, end_date, reminder_status=None):
+        """
+        查詢開始時間落在 [start_date, end_date] 的活動，依時間排序
+
+        參數:
+        start_date (datetime): 開始時間 (含時區)
+        end_date (datetime): 結束時間 (含時區)
+        reminder_status (str, optional): 提醒狀態過濾
+
+        返回:
+        list: 活動列表
+        """
+        # ID 為字串，"" 與 "\uffff" 分別小於、大於任何 ID
+        lo = bisect_left(self._starts, (start_date.timestamp(), ""))
+        hi = bisect_right(self._starts, (end_date.timestamp(), "\uffff"))
+        return self._collect(self._starts[lo:hi], reminder_status)
+
+    def on_day(self, day, reminder_status=None):
+        """
+        取出某一天 (UTC) 的活動
+
+        參數:
+        day (date): 日期
+        reminder_status (str, optional): 提醒狀態過濾
+        """
+        return self._collect(self._days.get(day.toordinal(), ()), reminder_status)
+
+    def _collect(self, entries, reminder_status):
+        events = []
+        for _, event_id in entries:
+            event = self._events[event_id][1]
+            if reminder_status and event.get("reminder_status") != reminder_status:
+                continue
+            events.append(event)
+        return events
+
+
+def _start_timestamp(event):
+    # Event 建立時已解析過時間
+    if isinstance(event, Event):
+        return event.start_ts
+    return to_timestamp(event.get("time"))
+
+
+def to_timestamp(value):
+    """將 Notion 的 ISO 日期字串轉為 epoch 秒，純日期視為 UTC 午夜"""
+    parsed = parse_time(value)
+    return parsed.timestamp() if parsed else None
+
+
+def _day_key(start_ts):
+    return datetime.fromtimestamp(start_ts, timezone.utc).toordinal()
+
+
+def _remove_sorted(entries, entry):
+    position = bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
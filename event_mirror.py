@@ -0,0 +1,210 @@
+import sqlite3
+import threading
+import time
+from event_index import EventIndex
+from event_model import Event
+
+
+class EventMirror:
+    """
+    Notion 活動資料庫的本地 SQLite 鏡像
+
+    由 NotionManager.sync_mirror 以 last_edited_time 增量同步，
+    查詢時直接讀取本地資料，避免每次都呼叫 Notion API。
+    範圍查詢由記憶體中的 EventIndex 回答，其他行程寫入資料庫時會自動重建索引
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        # WAL 模式讓多個 worker 行程可以同時讀取鏡像
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                time TEXT,
+                start_ts REAL,
+                category TEXT,
+                importance TEXT,
+                notes TEXT,
+                reminder_status TEXT,
+                last_edited_time TEXT,
+                generation INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_start_ts ON events (start_ts);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self._conn.commit()
+
+        self._index = None
+        self._data_version = None
+
+    # 同步狀態
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, str(value))
+            )
+            self._conn.commit()
+
+    @property
+    def last_synced_at(self):
+        """最後一次成功同步的時間 (epoch 秒)，從未同步則為 None"""
+        value = self.get_meta("last_synced_at")
+        return float(value) if value is not None else None
+
+    def is_fresh(self, max_age):
+        """鏡像是否在 max_age 秒內同步過"""
+        synced_at = self.last_synced_at
+        return synced_at is not None and time.time() - synced_at <= max_age
+
+    # 寫入
+    def upsert(self, events, last_edited_times=None, generation=None):
+        """
+        新增或更新活動
+
+        參數:
+        events (iterable): 活動資料 (Event 或 dict)
+        last_edited_times (dict, optional): 活動 ID 對應的 Notion last_edited_time
+        generation (int, optional): 全量同步的世代編號，用於偵測已刪除的活動；未提供時使用目前寫入中的世代
+        """
+        last_edited_times = last_edited_times or {}
+        events = [event if isinstance(event, Event) else Event.from_dict(event) for event in events]
+        rows = [
+            (
+                event.id,
+                event.name,
+                event.time,
+                event.start_ts,
+                event.category,
+                event.importance_name,
+                event.notes,
+                event.reminder_status,
+                last_edited_times.get(event.id)
+            )
+            for event in events
+        ]
+        if not rows:
+            return
+        if generation is None:
+            # 增量同步與寫入使用目前寫入中的世代 (全量同步進行中時為新世代)，避免被全量同步的 prune 誤刪；
+            # 在同一個 INSERT 中讀取，與其他行程開始全量同步的寫入不會交錯
+            generation_sql = (
+                "CAST(COALESCE((SELECT value FROM meta WHERE key = 'write_generation'),"
+                " (SELECT value FROM meta WHERE key = 'generation'), 0) AS INTEGER)"
+            )
+        else:
+            generation_sql = "?"
+            rows = [row + (generation,) for row in rows]
+        with self._lock:
+            self._conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO events
+                    (id, name, time, start_ts, category, importance, notes,
+                     reminder_status, last_edited_time, generation)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {generation_sql})
+                """,
+                rows
+            )
+            self._conn.commit()
+            if self._index is not None:
+                # Event 建立後不再修改，索引可以直接共用同一個物件
+                for event in events:
+                    self._index.add(event)
+
+    def begin_full_sync(self):
+        """
+        開始全量同步，返回新的世代編號
+
+        新世代同時記錄為 write_generation：全量同步期間其他寫入 (例如新增活動的 write-through)
+        也屬於新世代，不會被這次同步結束時的 prune 刪除。
+        先前中斷的全量同步已使用過的世代不再重複使用
+        """
+        with self._lock:
+            with self._conn:
+                row = self._conn.execute(
+                    "SELECT MAX(CAST(value AS INTEGER)) FROM meta WHERE key IN ('generation', 'write_generation')"
+                ).fetchone()
+                generation = (row[0] or 0) + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('write_generation', ?)",
+                    (str(generation),)
+                )
+        return generation
+
+    def prune(self, generation):
+        """刪除不屬於指定全量同步世代的活動 (已在 Notion 中刪除或封存)"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM events WHERE generation != ?", (generation,))
+            self._conn.commit()
+            if cursor.rowcount:
+                self._index = None
+        return cursor.rowcount
+
+    def delete(self, event_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            self._conn.commit()
+            if self._index is not None:
+                self._index.remove(event_id)
+
+    # 查詢
+    def query(self, start_date, end_date, reminder_status=None):
+        """
+        查詢指定時間範圍內的活動，依時間排序
+
+        參數:
+        start_date (datetime): 開始時間 (含時區)
+        end_date (datetime): 結束時間 (含時區)
+        reminder_status (str, optional): 提醒狀態過濾
+
+        返回:
+        list: 活動列表
+        """
+        with self._lock:
+            return self._ensure_index().range(start_date, end_date, reminder_status)
+
+    def on_day(self, day, reminder_status=None):
+        """取出某一天 (UTC) 的活動"""
+        with self._lock:
+            return self._ensure_index().on_day(day, reminder_status)
+
+    def _ensure_index(self):
+        """需持有 self._lock；第一次查詢或其他連線修改過資料庫時重建索引"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._index is None or data_version != self._data_version:
+            rows = self._conn.execute("SELECT * FROM events").fetchall()
+            self._index = EventIndex(_row_to_event(row) for row in rows)
+            self._data_version = data_version
+        return self._index
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+
+def _row_to_event(row):
+    return Event(
+        row["id"],
+        row["name"],
+        row["time"],
+        row["category"],
+        row["importance"],
+        row["notes"],
+        row["reminder_status"]
+    )
@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from enum import Enum
+
+
+class Importance(str, Enum):
+    """活動重要性，與 Notion「重要性」選項的名稱相同"""
+
+    HIGH = "高"
+    MEDIUM = "中"
+    LOW = "低"
+
+    # 與字串一樣顯示為「高」而不是 Importance.HIGH，並可與 "高" 互換作為 dict 的鍵
+    __str__ = str.__str__
+    __format__ = str.__format__
+    __hash__ = str.__hash__
+
+    @classmethod
+    def parse(cls, value):
+        """將選項名稱轉為 Importance，空值或不認得的名稱返回 None"""
+        try:
+            return cls(value)
+        except ValueError:
+            return None
+
+
+def parse_time(value):
+    """將 Notion 的 ISO 日期字串轉為帶時區的 datetime，純日期或無時區時視為 UTC"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class Event:
+    """
+    從 Notion 頁面解析一次的活動資料
+
+    建立時就把 time 解析為帶時區的 start、UTC 日期 day 與 epoch 秒 start_ts，
+    之後排序、分組與格式化都不必重新解析字串。
+    仍支援 event["name"]、event.get(...) 與 dict(event)，
+    此時 importance 以原本的字串 (例如 "高") 表示
+    """
+
+    __slots__ = (
+        "id", "name", "time", "start", "start_ts", "day",
+        "category", "importance", "importance_name", "notes", "reminder_status"
+    )
+
+    # 與舊版 dict 相容的欄位
+    FIELDS = ("id", "name", "time", "category", "importance", "notes", "reminder_status")
+
+    def __init__(self, id, name, time, category="", importance="", notes="", reminder_status=""):
+        self.id = id
+        self.name = name
+        # Notion 原始的 ISO 字串，寫回鏡像或 Notion 時使用
+        self.time = time
+        self.start = parse_time(time)
+        self.start_ts = self.start.timestamp() if self.start else None
+        self.day = self.start.astimezone(timezone.utc).date() if self.start else None
+        self.category = category
+        self.importance = Importance.parse(importance)
+        # 不在 Importance 中的選項名稱也原樣保留
+        self.importance_name = importance or ""
+        self.notes = notes
+        self.reminder_status = reminder_status or ""
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["id"],
+            data.get("name", ""),
+            data.get("time"),
+            data.get("category", ""),
+            data.get("importance", ""),
+            data.get("notes", ""),
+            data.get("reminder_status", "")
+        )
+
+    def replace(self, **changes):
+        """返回套用變更後的新活動，例如 event.replace(reminder_status="已提醒")"""
+        data = self.to_dict()
+        data.update(changes)
+        return Event.from_dict(data)
+
+    def to_dict(self):
+        return {field: self[field] for field in self.FIELDS}
+
+    # dict 相容介面
+    def __getitem__(self, key):
+        if key == "importance":
+            return self.importance_name
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.FIELDS
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, Event):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Event(id={self.id!r}, name={self.name!r}, time={self.time!r}, importance={self.importance_name!r})"
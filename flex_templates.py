@@ -0,0 +1,318 @@
+from datetime import datetime, timedelta
+
+from linebot.v3.messaging import (
+    ButtonsTemplate,
+    DatetimePickerAction,
+    FlexContainer,
+    FlexMessage,
+    MessageAction,
+    PostbackAction,
+    QuickReply,
+    QuickReplyItem,
+    TemplateMessage,
+    TextMessage
+)
+
+# 活動分類與重要性選項 (Flex 表單、快速回覆共用)
+CATEGORIES = ["會議", "活動", "提醒", "任務", "其他"]
+IMPORTANCE_COLORS = {"高": "#FF5551", "中": "#FFA500", "低": "#00CC00"}
+
+# Flex 表單中日期時間選擇器的位置：body.contents[0].contents[1].action
+DATETIME_PICKER_PATH = ("body", ("contents", 0), ("contents", 1), "action")
+
+# 查詢結果卡片：每張卡片最多列出的活動數 (LINE 單一 bubble 最大 10KB)
+DAY_BUBBLE_MAX_EVENTS = 10
+WEEKDAYS = "一二三四五六日"
+
+
+def build_event_creation_bubble(now=None):
+    """活動設定 Flex 表單的內容 (dict)，只有日期時間選擇器的 initial / min / max 隨時間變動"""
+    now = now or datetime.now()
+    picker_now = now.strftime("%Y-%m-%dT%H:%M")
+
+    def label_row(text, margin=None):
+        row = {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": text,
+                    "size": "sm",
+                    "color": "#555555",
+                    "flex": 0
+                }
+            ]
+        }
+        if margin:
+            row["margin"] = margin
+        return row
+
+    def button_row(buttons):
+        for index, button in enumerate(buttons):
+            button["height"] = "sm"
+            if index:
+                button["margin"] = "md"
+        return {"type": "box", "layout": "horizontal", "margin": "md", "contents": buttons}
+
+    importance_buttons = [
+        {
+            "type": "button",
+            "style": "primary",
+            "color": color,
+            "action": {
+                "type": "postback",
+                "label": importance,
+                "data": f"action=select_importance_flex&value={importance}"
+            }
+        }
+        for importance, color in IMPORTANCE_COLORS.items()
+    ]
+
+    def category_button(category):
+        return {
+            "type": "button",
+            "style": "secondary",
+            "action": {
+                "type": "postback",
+                "label": category,
+                "data": f"action=select_category_flex&value={category}"
+            }
+        }
+
+    return {
+        "type": "bubble",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "📅 活動設定",
+                    "size": "xl",
+                    "weight": "bold",
+                    "color": "#1DB446"
+                }
+            ]
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "margin": "lg",
+                    "spacing": "sm",
+                    "contents": [
+                        label_row("日期時間"),
+                        {
+                            "type": "text",
+                            "text": "點擊選擇",
+                            "size": "sm",
+                            "color": "#111111",
+                            "margin": "md",
+                            "action": {
+                                "type": "datetimepicker",
+                                "label": "選擇日期時間",
+                                "data": "action=select_datetime_flex",
+                                "mode": "datetime",
+                                "initial": picker_now,
+                                "max": (now + timedelta(days=365)).strftime("%Y-%m-%dT%H:%M"),
+                                "min": picker_now
+                            }
+                        },
+                        {"type": "separator", "margin": "lg"},
+                        label_row("重要性", margin="lg"),
+                        button_row(importance_buttons),
+                        {"type": "separator", "margin": "lg"},
+                        label_row("分類", margin="lg"),
+                        button_row([category_button("會議"), category_button("活動")]),
+                        button_row([category_button("提醒"), category_button("任務")])
+                    ]
+                }
+            ]
+        }
+    }
+
+
+def build_importance_selector():
+    """步驟 2/4：重要性選擇按鈕範本"""
+    return TemplateMessage(
+        alt_text="選擇活動重要性",
+        template=ButtonsTemplate(
+            title="📅 設定活動 (步驟 2/4)",
+            text="請選擇活動的重要性等級",
+            actions=[
+                PostbackAction(label=f"{importance}重要性", data=f"action=set_importance&value={importance}")
+                for importance in IMPORTANCE_COLORS
+            ]
+        )
+    )
+
+
+def build_importance_quick_reply():
+    """以文字「重要性:高」回覆的重要性快速回覆"""
+    return QuickReply(items=[
+        QuickReplyItem(action=MessageAction(label=f"{importance}重要性", text=f"重要性:{importance}"))
+        for importance in IMPORTANCE_COLORS
+    ])
+
+
+def build_category_quick_reply():
+    """以文字「分類:會議」回覆的分類快速回覆"""
+    return QuickReply(items=[
+        QuickReplyItem(action=MessageAction(label=category, text=f"分類:{category}"))
+        for category in CATEGORIES
+    ])
+
+
+def build_query_form():
+    """活動查詢的快速回覆選單"""
+    return TextMessage(
+        text="📅 活動查詢\n請選擇查詢方式，或直接輸入格式如：\n查詢活動:2023/12/01,2023/12/31",
+        quick_reply=QuickReply(items=[
+            QuickReplyItem(action=DatetimePickerAction(label="選擇單日日期", data="action=query_date", mode="date")),
+            QuickReplyItem(action=PostbackAction(label="選擇範圍日期", data="action=select_date_range")),
+            QuickReplyItem(action=PostbackAction(label="查詢今天", data="action=query_today")),
+            QuickReplyItem(action=PostbackAction(label="查詢後7天", data="action=query_next7days")),
+            QuickReplyItem(action=PostbackAction(label="查詢本月", data="action=query_month")),
+            QuickReplyItem(action=PostbackAction(label="查詢本年", data="action=query_year"))
+        ])
+    )
+
+
+def build_day_bubble(day, events, max_events=DAY_BUBBLE_MAX_EVENTS):
+    """
+    查詢結果中某一天的卡片 (dict)
+
+    參數:
+    day (date): 日期 (UTC)
+    events (iterable): 當天依時間排序的 Event；超過 max_events 的部分只計數
+    """
+    rows = []
+    total = 0
+    for event in events:
+        total += 1
+        if total > max_events:
+            continue
+        details = [
+            {
+                "type": "text",
+                "text": event.name[:60] or "(未命名活動)",
+                "size": "sm",
+                "weight": "bold",
+                "wrap": True,
+                "maxLines": 2
+            },
+            {
+                "type": "text",
+                "text": f"[{event.category}] {event.importance_name}重要性" if event.category else f"{event.importance_name}重要性",
+                "size": "xxs",
+                "color": IMPORTANCE_COLORS.get(event.importance_name, "#888888")
+            }
+        ]
+        if event.notes:
+            details.append({
+                "type": "text",
+                "text": event.notes[:80],
+                "size": "xxs",
+                "color": "#888888",
+                "wrap": True,
+                "maxLines": 2
+            })
+        rows.append({
+            "type": "box",
+            "layout": "horizontal",
+            "spacing": "md",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": event.start.strftime("%H:%M"),
+                    "size": "sm",
+                    "color": "#555555",
+                    "flex": 0
+                },
+                {"type": "box", "layout": "vertical", "flex": 1, "contents": details}
+            ]
+        })
+    if total > max_events:
+        rows.append({"type": "text", "text": f"…以及其他 {total - max_events} 項", "size": "xs", "color": "#888888"})
+
+    return {
+        "type": "bubble",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": f"{day.strftime('%Y/%m/%d')} ({WEEKDAYS[day.weekday()]})",
+                    "size": "lg",
+                    "weight": "bold",
+                    "color": "#1DB446"
+                },
+                {"type": "text", "text": f"共 {total} 項活動", "size": "xs", "color": "#888888"}
+            ]
+        },
+        "body": {"type": "box", "layout": "vertical", "spacing": "lg", "contents": rows}
+    }
+
+
+class FlexTemplates:
+    """
+    預先建立並驗證的訊息範本
+
+    啟動時將靜態的 Flex 容器與快速回覆轉為 SDK 模型一次 (格式錯誤會在啟動時就發現)，
+    之後每次回覆直接重用；只有動態欄位 (例如日期時間選擇器的 initial / min / max)
+    沿著該欄位的路徑淺層複製後替換，不必重新驗證整個容器
+    """
+
+    def __init__(self):
+        self.event_creation_bubble = FlexContainer.from_dict(build_event_creation_bubble())
+        picker = _get_path(self.event_creation_bubble, DATETIME_PICKER_PATH)
+        if getattr(picker, "data", None) != "action=select_datetime_flex":
+            raise ValueError("活動設定表單中找不到日期時間選擇器")
+
+        self.importance_selector = build_importance_selector()
+        self.importance_quick_reply = build_importance_quick_reply()
+        self.category_quick_reply = build_category_quick_reply()
+        self.category_selector = TextMessage(
+            text="📅 設定活動 (步驟 3/4)\n請選擇活動分類",
+            quick_reply=self.category_quick_reply
+        )
+        self.query_form = build_query_form()
+
+    def event_creation_flex(self, now=None):
+        """活動設定 Flex 表單，日期時間選擇器以 now 為預設與最早時間"""
+        now = now or datetime.now()
+        picker_now = now.strftime("%Y-%m-%dT%H:%M")
+        bubble = _replace_path(self.event_creation_bubble, DATETIME_PICKER_PATH, {
+            "initial": picker_now,
+            "max": (now + timedelta(days=365)).strftime("%Y-%m-%dT%H:%M"),
+            "min": picker_now
+        })
+        return FlexMessage(alt_text="活動設定表單", contents=bubble)
+
+
+def _get_path(model, path):
+    for step in path:
+        if isinstance(step, tuple):
+            name, index = step
+            model = getattr(model, name)[index]
+        else:
+            model = getattr(model, step)
+    return model
+
+
+def _replace_path(model, path, changes):
+    """沿 path 淺層複製模型並在終點套用 changes，其餘節點與原範本共用"""
+    if not path:
+        return model.copy(update=changes)
+    step, rest = path[0], path[1:]
+    if isinstance(step, tuple):
+        name, index = step
+        items = list(getattr(model, name))
+        items[index] = _replace_path(items[index], rest, changes)
+        return model.copy(update={name: items})
+    return model.copy(update={step: _replace_path(getattr(model, step), rest, changes)})
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from notion_client import Client
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi, MessagingApiBlob
+from metrics import LINE_CALL_SECONDS, line_endpoint
+from tracing import span
+
+# 整個行程共用的連線池，每個上游 (Notion、api.line.me、api-data.line.me) 各自保持 keep-alive 連線
+_lock = threading.Lock()
+_notion_client = None
+_line_api_client = None
+_messaging_api = None
+_messaging_api_blob = None
+_line_session = None
+
+
+class PooledApiClient(ApiClient):
+    """為每次 LINE API 呼叫套用預設逾時的 ApiClient"""
+
+    def __init__(self, configuration, timeout):
+        super().__init__(configuration)
+        self.default_timeout = timeout
+
+    def call_api(self, *args, **kwargs):
+        if kwargs.get("_request_timeout") is None:
+            kwargs["_request_timeout"] = self.default_timeout
+        return super().call_api(*args, **kwargs)
+
+    def request(self, method, url, *args, **kwargs):
+        """實際送出 HTTP 請求的地方，記錄延遲指標與 span (url 已包含主機與查詢參數)"""
+        endpoint = line_endpoint(url)
+        started = time.perf_counter()
+        status = "error"
+        with span(f"line {method} {endpoint}", **{"http.method": method, "http.route": endpoint}) as current:
+            try:
+                response = super().request(method, url, *args, **kwargs)
+                status = str(response.status)
+                current.set_attribute("http.status_code", response.status)
+                return response
+            except Exception as e:
+                # 非 2xx 回應會以 ApiException 拋出，狀態碼在 e.status
+                if getattr(e, "status", None):
+                    status = str(e.status)
+                raise
+            finally:
+                LINE_CALL_SECONDS.labels(
+                    method=method, endpoint=endpoint, status=status
+                ).observe(time.perf_counter() - started)
+
+
+class TimeoutSession(requests.Session):
+    """未指定 timeout 時使用預設逾時的 requests.Session"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+def get_notion_client():
+    """
+    共用的 Notion Client
+
+    NOTION_POOL_SIZE: 最大連線數
+    NOTION_TIMEOUT_SECONDS: 請求逾時 (秒)
+    NOTION_BASE_URL: API 位址，預設 https://api.notion.com (基準測試時指向本地替身)
+    """
+    global _notion_client
+    with _lock:
+        if _notion_client is None:
+            pool_size = int(os.getenv("NOTION_POOL_SIZE", "10"))
+            timeout = float(os.getenv("NOTION_TIMEOUT_SECONDS", "30"))
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size
+                )
+            )
+            _notion_client = Client(
+                auth=os.getenv("NOTION_TOKEN"),
+                client=http_client,
+                base_url=os.getenv("NOTION_BASE_URL", "https://api.notion.com"),
+                timeout_ms=int(timeout * 1000)
+            )
+        return _notion_client
+
+
+def get_line_api_client():
+    """
+    共用的 LINE ApiClient
+
+    LINE_POOL_SIZE: 每個主機的最大連線數
+    LINE_TIMEOUT_SECONDS: 請求逾時 (秒)
+    LINE_API_HOST: Messaging API 位址，預設 https://api.line.me (基準測試時指向本地替身)
+    """
+    global _line_api_client
+    with _lock:
+        if _line_api_client is None:
+            configuration = Configuration(
+                access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN"),
+                host=os.getenv("LINE_API_HOST", "https://api.line.me")
+            )
+            configuration.connection_pool_maxsize = int(os.getenv("LINE_POOL_SIZE", "10"))
+            _line_api_client = PooledApiClient(
+                configuration,
+                timeout=float(os.getenv("LINE_TIMEOUT_SECONDS", "10"))
+            )
+        return _line_api_client
+
+
+def get_messaging_api():
+    """共用的 LINE MessagingApi"""
+    global _messaging_api
+    api_client = get_line_api_client()
+    with _lock:
+        if _messaging_api is None:
+            _messaging_api = MessagingApi(api_client)
+        return _messaging_api
+
+
+def get_messaging_api_blob():
+    """共用的 LINE MessagingApiBlob (api-data.line.me，例如下載用戶上傳的檔案)"""
+    global _messaging_api_blob
+    api_client = get_line_api_client()
+    with _lock:
+        if _messaging_api_blob is None:
+            _messaging_api_blob = MessagingApiBlob(api_client)
+        return _messaging_api_blob
+
+
+def get_line_session():
+    """
+    直接呼叫 LINE REST API (例如上傳 Rich Menu 圖片到 api-data.line.me) 用的共用 Session
+    """
+    global _line_session
+    with _lock:
+        if _line_session is None:
+            pool_size = int(os.getenv("LINE_POOL_SIZE", "10"))
+            session = TimeoutSession(timeout=float(os.getenv("LINE_TIMEOUT_SECONDS", "10")))
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _line_session = session
+        return _line_session
@@ -0,0 +1,301 @@
+import base64
+import hashlib
+import hmac
+import json
+import re
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from event_model import Importance
+
+# iCalendar 的 PRIORITY：1 最高、9 最低
+PRIORITY = {Importance.HIGH: 1, Importance.MEDIUM: 5, Importance.LOW: 9}
+PRODUCT_ID = "-//Linebot for NotionNote//Notion Events//ZH"
+
+
+# 匯出 / 匯入連結的用戶 token
+def make_export_token(user_id, secret, purpose="export"):
+    """
+    產生匯出 (或匯入) 連結用的 token：base64url(用戶 ID) + "." + HMAC-SHA256 簽章
+
+    token 無法偽造，但任何取得連結的人都能讀取 (或匯入) 行事曆，因此只回覆給用戶本人；
+    purpose 不同的 token 互不通用
+    """
+    payload = _b64encode(user_id.encode("utf-8"))
+    return f"{payload}.{_sign(payload, secret, purpose)}"
+
+
+def verify_export_token(token, secret, purpose="export"):
+    """驗證匯出 (或匯入) token，返回用戶 ID；簽章不符時返回 None"""
+    payload, _, signature = token.partition(".")
+    if not payload or not secret or not hmac.compare_digest(signature, _sign(payload, secret, purpose)):
+        return None
+    try:
+        return base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)).decode("utf-8")
+    except ValueError:
+        return None
+
+
+def _sign(payload, secret, purpose):
+    digest = hmac.new(secret.encode("utf-8"), f"ics-{purpose}:{payload}".encode("utf-8"), hashlib.sha256).digest()
+    return _b64encode(digest[:18])
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+# 匯出
+def calendar_etag(events):
+    """
+    逐筆計算活動內容的雜湊，作為行事曆的 ETag
+
+    /export 以同一份完整查詢結果計算 ETag 與輸出內容，查詢不完整時不會產生 ETag
+
+    DTSTAMP 每次都不同，因此回應應使用弱 ETag
+    """
+    digest = hashlib.sha256()
+    for event in events:
+        digest.update(json.dumps(event.to_dict(), ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()[:32]
+
+
+def iter_calendar(events, name="Notion 活動", duration_minutes=60, now=None):
+    """
+    逐段產生 iCalendar 內容，每個活動一個 VEVENT，適合作為串流回應
+
+    參數:
+    events (iterable): Event (例如 NotionManager.iter_events 的結果)
+    name (str): 行事曆名稱
+    duration_minutes (int): 活動沒有結束時間，以此長度顯示
+
+    產出:
+    str: 以 CRLF 結尾的 iCalendar 文字片段
+    """
+    stamp = format_utc(now or datetime.now(timezone.utc))
+    yield _lines(
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODUCT_ID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(name)}"
+    )
+    for event in events:
+        if event.start is None:
+            continue
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{event.id}@notion",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{format_utc(event.start)}",
+            f"DURATION:PT{int(duration_minutes)}M",
+            f"SUMMARY:{escape_text(event.name)}"
+        ]
+        if event.category:
+            lines.append(f"CATEGORIES:{escape_text(event.category)}")
+        if event.importance in PRIORITY:
+            lines.append(f"PRIORITY:{PRIORITY[event.importance]}")
+        if event.notes:
+            lines.append(f"DESCRIPTION:{escape_text(event.notes)}")
+        lines.append("END:VEVENT")
+        yield _lines(*lines)
+    yield _lines("END:VCALENDAR")
+
+
+def format_utc(value):
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def escape_text(value):
+    """RFC 5545 TEXT 值的跳脫"""
+    return (
+        str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def fold_line(line, limit=75):
+    """超過 75 個位元組的內容行摺疊為多行 (不切斷 UTF-8 多位元組字元)"""
+    if len(line.encode("utf-8")) <= limit:
+        return line
+    parts = []
+    current, size = [], 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        # 續行開頭的空白也算一個位元組
+        if size + width > (limit if not parts else limit - 1):
+            parts.append("".join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+
+def _lines(*lines):
+    return "".join(fold_line(line) + "\r\n" for line in lines)
+
+
+# 匯入
+def iter_vevents(lines):
+    """
+    逐行解析 iCalendar 內容，每讀完一個 VEVENT 就產出一次，不需載入整個檔案
+
+    參數:
+    lines (iterable): 文字行 (例如以文字模式開啟的檔案)
+
+    產出:
+    dict: 屬性名稱 (大寫) 對應 (參數 dict, 值)；同名屬性只保留第一個。
+    VEVENT 內的 VALARM 等子元件會被略過
+    """
+    event = None
+    depth = 0
+    for line in _unfold(lines):
+        name, params, value = parse_content_line(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and event is None:
+                event, depth = {}, 0
+            elif event is not None:
+                depth += 1
+        elif name == "END":
+            if event is not None and depth:
+                depth -= 1
+            elif event is not None and value.upper() == "VEVENT":
+                yield event
+                event = None
+        elif event is not None and not depth and name:
+            event.setdefault(name, (params, value))
+
+
+def _unfold(lines):
+    """將以空白或 tab 開頭的續行接回上一行"""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+_PARAM = re.compile(r';([^=;:]+)=("[^"]*"|[^;:]*)')
+
+
+def parse_content_line(line):
+    """
+    解析一行內容，例如 DTSTART;TZID=Asia/Taipei:20250415T100000
+
+    返回:
+    tuple: (屬性名稱 (大寫), 參數 dict, 值)
+    """
+    # 參數值可能以雙引號包住並含有冒號，因此先跳過參數再找值的分隔冒號
+    head = re.match(r'[^;:]*', line).group(0)
+    params = {}
+    position = len(head)
+    for match in _PARAM.finditer(line, position):
+        if match.start() != position:
+            break
+        params[match.group(1).upper()] = match.group(2).strip('"')
+        position = match.end()
+    if line[position:position + 1] != ":":
+        return "", {}, ""
+    return head.upper(), params, line[position + 1:]
+
+
+def unescape_text(value):
+    """RFC 5545 TEXT 值的反跳脫"""
+    return re.sub(
+        r"\\([\\;,nN])",
+        lambda match: "\n" if match.group(1) in "nN" else match.group(1),
+        value
+    )
+
+
+def parse_datetime(params, value, all_day_hour=9):
+    """
+    將 DTSTART 轉為帶時區的 datetime
+
+    - 20250415T100000Z: UTC
+    - TZID=Asia/Taipei:20250415T100000: 依 TZID 換算，不認得的時區視為 UTC
+    - VALUE=DATE:20250415: 全天活動，以 all_day_hour 點 (UTC) 表示，與「新增活動」省略時間時相同
+
+    返回:
+    tuple: (datetime, 是否為全天活動)，無法解析時拋出 ValueError
+    """
+    value = value.strip()
+    if params.get("VALUE", "").upper() == "DATE" or len(value) == 8:
+        return datetime.strptime(value[:8], "%Y%m%d").replace(hour=all_day_hour, tzinfo=timezone.utc), True
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc), False
+    parsed = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    try:
+        tz = ZoneInfo(params["TZID"]) if params.get("TZID") else timezone.utc
+    except (ValueError, KeyError, OSError):
+        tz = timezone.utc
+    return parsed.replace(tzinfo=tz), False
+
+
+class ImportMapping:
+    """
+    VEVENT 轉為 add_event 參數的對應規則
+
+    - categories: iCalendar CATEGORIES 對應到 Notion 的分類，例如 {"Work": "工作"}
+    - importance: CATEGORIES 名稱或 PRIORITY 數字 (字串) 對應到重要性，例如 {"考試": "高", "1": "高"}；
+      先比對分類，再比對 PRIORITY，都沒有時使用 default_importance
+    """
+
+    # RFC 5545：1-4 高、5 中、6-9 低，0 表示未定義
+    DEFAULT_IMPORTANCE = {
+        str(level): "高" if level <= 4 else "中" if level == 5 else "低"
+        for level in range(1, 10)
+    }
+
+    def __init__(self, categories=None, importance=None, default_category="活動", default_importance="中", all_day_hour=9):
+        self.categories = dict(categories or {})
+        self.importance = dict(self.DEFAULT_IMPORTANCE, **(importance or {}))
+        self.default_category = default_category
+        self.default_importance = default_importance
+        self.all_day_hour = all_day_hour
+
+    def to_fields(self, vevent):
+        """
+        將 iter_vevents 產出的 VEVENT 轉為 add_event 參數
+
+        返回:
+        dict: event_name, event_time, category, importance, notes；沒有 DTSTART 或無法解析時拋出 ValueError
+        """
+        if "DTSTART" not in vevent:
+            raise ValueError("缺少 DTSTART")
+        event_time, _ = parse_datetime(*vevent["DTSTART"], all_day_hour=self.all_day_hour)
+
+        raw_categories = [
+            unescape_text(category).strip()
+            for category in re.split(r"(?<!\\),", vevent.get("CATEGORIES", ({}, ""))[1])
+            if category.strip()
+        ]
+        source_category = raw_categories[0] if raw_categories else ""
+        # Notion 的選項名稱不能含逗號
+        category = (self.categories.get(source_category, source_category) or self.default_category).replace(",", " ")
+
+        priority = vevent.get("PRIORITY", ({}, ""))[1].strip()
+        importance = (
+            self.importance.get(source_category)
+            or self.importance.get(category)
+            or self.importance.get(priority)
+            or self.default_importance
+        )
+
+        # Notion rich text 每段最多 2000 字
+        return {
+            "event_name": unescape_text(vevent.get("SUMMARY", ({}, ""))[1]).strip()[:2000] or "(未命名活動)",
+            "event_time": event_time,
+            "category": category,
+            "importance": importance,
+            "notes": unescape_text(vevent.get("DESCRIPTION", ({}, ""))[1]).strip()[:2000]
+        }
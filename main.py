@@ -1,17 +1,15 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort, g
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import MessagingApi, ApiClient, Configuration
-from linebot.v3.webhooks import MessageEvent, TextMessageContent, PostbackEvent
+from linebot.v3.webhooks import MessageEvent, TextMessageContent, FileMessageContent, PostbackEvent
 from linebot.v3.messaging import (
     TextMessage, 
     ReplyMessageRequest,
+    PushMessageRequest,
     RichMenuArea,
     RichMenuSize,
     RichMenuBounds,
     URIAction,
-    FlexMessage,
-    FlexContainer,
     RichMenuResponse,
     RichMenuRequest,
     ConfirmTemplate
@@ -27,11 +25,32 @@ from linebot.v3.messaging.models import (
 )
 import os
 from dotenv import load_dotenv
-import re
 import json
+import tempfile
 from datetime import datetime, timedelta, timezone
-from notion_manager import NotionManager
+from notion_manager import NotionManager, NotionQueryError
+from circuit_breaker import CircuitOpenError
+from bulk_events import format_summary, parse_event_line, parse_event_lines
+from calendar_import import CalendarImporter
+from flex_templates import FlexTemplates
+from query_results import (
+    format_range,
+    make_cards_data,
+    make_page_data,
+    parse_cards_data,
+    parse_page_data,
+    render_day_carousel,
+    render_query_results
+)
 from reminder import EventReminder
+from webhook_queue import WebhookDispatcher
+from http_pool import get_line_api_client, get_messaging_api, get_messaging_api_blob, get_line_session
+from state_store import create_state_store
+from routing import CommandRouter, PostbackRouter
+import ical
+import metrics
+import time
+import tracing
 import requests
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
@@ -56,21 +75,150 @@ else:
 app = Flask(__name__)
 
 # 設置LINE Bot配置
-configuration = Configuration(access_token=os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
+LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 handler = WebhookHandler(os.getenv('LINE_CHANNEL_SECRET'))
 
 # 健康檢查路由
 @app.route("/health", methods=['GET'])
 def health_check():
-    return {"status": "healthy"}, 200
+    status = {"status": "healthy", "notion": notion_manager.stats()}
+    if webhook_dispatcher:
+        status["webhook_queue"] = webhook_dispatcher.stats()
+    return status, 200
+
+# Prometheus 指標：請求延遲、各處理函數、Notion / LINE 呼叫、排程工作與使用者狀態數量
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return body, 200, {"Content-Type": content_type}
+
+# iCalendar 匯出：行事曆 App 以「匯出行事曆」回覆的連結訂閱，活動完整查詢後每個活動一個 VEVENT 串流輸出
+@app.route("/export/<token>.ics", methods=['GET'])
+def export_calendar(token):
+    if ical.verify_export_token(token, export_secret()) is None:
+        abort(404)
+    
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = today - timedelta(days=int(os.getenv("ICS_EXPORT_PAST_DAYS", "30")))
+    end_date = today + timedelta(days=int(os.getenv("ICS_EXPORT_FUTURE_DAYS", "365")))
+    
+    try:
+        # 完整讀取一次活動，ETag 與回應內容都來自同一份結果；
+        # 查詢途中失敗時回覆 503，不能以不完整的結果計算 ETag
+        events = notion_manager.query_events(start_date, end_date)
+    except CircuitOpenError as e:
+        return str(e), 503, {"Retry-After": str(int(notion_manager.breaker.reset_timeout))}
+    except NotionQueryError as e:
+        return str(e), 503, {"Retry-After": "60"}
+    etag = ical.calendar_etag(events)
+    
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(
+            ical.iter_calendar(
+                events,
+                duration_minutes=int(os.getenv("ICS_EVENT_DURATION_MINUTES", "60"))
+            ),
+            mimetype="text/calendar"
+        )
+        response.headers["Content-Disposition"] = 'inline; filename="events.ics"'
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
-# 初始化 LINE API 客戶端
-api_client = ApiClient(configuration)
-line_bot_api = MessagingApi(api_client)
+# iCalendar 匯入：GET 顯示上傳表單，POST 接收 .ics 檔 (multipart 的 file 欄位或原始內容)
+@app.route("/import/<token>.ics", methods=['GET', 'POST'])
+def import_calendar(token):
+    user_id = ical.verify_export_token(token, export_secret(), purpose="import")
+    if user_id is None:
+        abort(404)
+    if request.method == 'GET':
+        return IMPORT_FORM, 200, {"Content-Type": "text/html; charset=utf-8"}
+    
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    max_bytes = int(os.getenv("ICS_IMPORT_MAX_BYTES", str(5 * 1024 * 1024)))
+    
+    # 逐塊寫到暫存檔後立即回覆，背景執行緒再逐行解析並寫入 Notion
+    spool = tempfile.TemporaryFile()
+    size = 0
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            return {"status": "error", "message": f"檔案超過 {max_bytes // 1024} KB"}, 413
+        spool.write(chunk)
+    if not size:
+        spool.close()
+        return {"status": "error", "message": "沒有收到檔案"}, 400
+    spool.seek(0)
+    
+    if not calendar_importer.start(user_id, spool):
+        return {"status": "error", "message": "已有匯入正在進行，請等待完成後再試"}, 409
+    return {"status": "accepted", "message": "開始匯入，進度會以 LINE 訊息通知"}, 202
+
+IMPORT_FORM = """<!DOCTYPE html>
+<html lang="zh-Hant">
+<head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1"><title>匯入行事曆</title></head>
+<body>
+<h3>匯入行事曆 (.ics)</h3>
+<form method="post" enctype="multipart/form-data">
+<input type="file" name="file" accept=".ics,text/calendar" required>
+<button type="submit">上傳</button>
+</form>
+<p>上傳後即可關閉此頁，匯入進度與結果會以 LINE 訊息通知。</p>
+</body>
+</html>
+"""
+
+def export_secret():
+    """匯出 token 的簽章金鑰，未設定 ICS_EXPORT_SECRET 時使用 LINE channel secret"""
+    return os.getenv("ICS_EXPORT_SECRET") or os.getenv("LINE_CHANNEL_SECRET") or ""
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            endpoint=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=str(response.status_code)
+        ).observe(time.perf_counter() - started)
+    return response
+
+# 初始化 LINE API 客戶端（整個行程共用同一個連線池）
+api_client = get_line_api_client()
+line_bot_api = get_messaging_api()
 
 # 初始化 Notion 管理器和提醒器
 notion_manager = NotionManager()
-event_reminder = EventReminder()
+event_reminder = EventReminder(notion_manager, line_bot_api)
+
+def push_text(user_id, text):
+    """以推播發送文字訊息給用戶 (背景工作的進度通知)"""
+    try:
+        line_bot_api.push_message(
+            PushMessageRequest(
+                to=user_id,
+                messages=[TextMessage(text=text)]
+            )
+        )
+    except Exception as e:
+        print(f"推播訊息失敗: {e}")
+
+# 靜態的 Flex 表單與快速回覆在啟動時建立並驗證一次
+message_templates = FlexTemplates()
+
+# 行事曆匯入 (/import/<token>.ics)
+calendar_importer = CalendarImporter(notion_manager, push_text)
 
 # 啟動自動提醒
 event_reminder.start()
@@ -165,12 +313,10 @@ def init_rich_menu():
         rich_menu_id = response.rich_menu_id
         print(f"已創建 Rich Menu，ID: {rich_menu_id}")
         
-        # 使用requests直接調用LINE API來上傳圖片
+        # 使用共用的requests Session直接調用LINE API來上傳圖片
         print("正在上傳Rich Menu圖片...")
+        line_session = get_line_session()
         try:
-            import requests
-            from requests_toolbelt.multipart.encoder import MultipartEncoder
-            
             with open('rich_menu_image.jpg', 'rb') as f:
                 image_data = f.read()
                 print(f"讀取圖片成功，大小: {len(image_data)} 字節")
@@ -182,7 +328,7 @@ def init_rich_menu():
                 }
                 
                 print(f"直接呼叫LINE API上傳圖片: {url}")
-                response = requests.post(url, headers=headers, data=image_data)
+                response = line_session.post(url, headers=headers, data=image_data)
                 
                 if response.status_code == 200:
                     print("上傳圖片成功!")
@@ -193,7 +339,7 @@ def init_rich_menu():
             print(f"上傳圖片時發生錯誤: {e}")
             raise e
         
-        # 使用requests直接調用LINE API來設置默認Rich Menu
+        # 使用共用的requests Session直接調用LINE API來設置默認Rich Menu
         print("正在設置為默認Rich Menu...")
         try:
             url = f'https://api.line.me/v2/bot/user/all/richmenu/{rich_menu_id}'
@@ -202,7 +348,7 @@ def init_rich_menu():
             }
             
             print(f"直接呼叫LINE API設置默認Rich Menu: {url}")
-            response = requests.post(url, headers=headers)
+            response = line_session.post(url, headers=headers)
             
             if response.status_code == 200:
                 print("設置默認Rich Menu成功!")
@@ -223,9 +369,6 @@ def init_rich_menu():
         print(f"詳細錯誤堆疊:\n{traceback.format_exc()}")
         return None
 
-# 全局變數，用於存儲用戶的日期選擇狀態
-user_date_selection = {}
-
 # 全局變數，用於存儲所有用戶狀態
 # 使用結構化格式：
 # user_states[user_id] = {
@@ -233,15 +376,39 @@ user_date_selection = {}
 #     'flex_form': {...},       # 用於存儲Flex表單相關狀態 
 #     'query': {...}            # 用於存儲查詢相關狀態
 # }
-user_states = {}
+# 後端由 STATE_STORE 決定（memory / sqlite），閒置超過 STATE_TTL_SECONDS 的狀態會自動過期。
+# 處理函數以 @user_states.in_session 包裝，處理過程中的修改會在結束時一次寫回
+user_states = create_state_store()
+metrics.watch_user_states(user_states)
 
 # 為了向後兼容，保留這些變數但將其指向user_states
+user_date_selection = user_states  # 將在下一版本移除
 user_event_creation = user_states  # 將在下一版本移除
 user_state = user_states  # 將在下一版本移除
 
 # 在應用啟動時初始化 Rich Menu
 rich_menu_id = None
 
+def dispatch_event(event):
+    """將單一 webhook 事件交給對應的處理函數（背景工作執行緒使用）"""
+    if isinstance(event, MessageEvent):
+        handle_message(event)
+    elif isinstance(event, PostbackEvent):
+        handle_postback(event)
+    else:
+        print(f"未處理的事件類型: {type(event).__name__}")
+
+# Webhook 背景處理池，WEBHOOK_WORKERS=0 時改為在請求中同步處理
+webhook_workers = int(os.getenv("WEBHOOK_WORKERS", "4"))
+webhook_dispatcher = None
+if webhook_workers > 0:
+    webhook_dispatcher = WebhookDispatcher(
+        dispatch_event,
+        workers=webhook_workers,
+        max_queue=int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    )
+    webhook_dispatcher.start()
+
 @app.route("/callback", methods=['POST'])
 def callback():
     # 取得 X-Line-Signature 標頭值
@@ -251,14 +418,36 @@ def callback():
     body = request.get_data(as_text=True)
     app.logger.info("Request body: " + body)
 
-    # 驗證簽名
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        abort(400)
+    # 以 webhook 事件 ID 作為追蹤的關聯鍵 (一次送來多個事件時以第一個為準)
+    event_ids = webhook_event_ids(body)
+    with tracing.span(
+        "POST /callback",
+        trace_key=event_ids[0] if event_ids else None,
+        **{"line.webhook_event_ids": ",".join(event_ids), "line.event_count": len(event_ids)}
+    ):
+        # 驗證簽名
+        try:
+            if webhook_dispatcher:
+                # 只驗證簽名與解析事件，依用戶排入佇列後立即回覆，避免 LINE 等待 Notion 而逾時重送；
+                # 同一用戶的事件由同一個工作執行緒依序處理，佇列已滿時在此等待空位
+                with tracing.span("verify_signature"):
+                    events = handler.parser.parse(body, signature)
+                with tracing.span("enqueue"):
+                    webhook_dispatcher.submit(events)
+            else:
+                handler.handle(body, signature)
+        except InvalidSignatureError:
+            abort(400)
 
     return 'OK'
 
+def webhook_event_ids(body):
+    """從 webhook 內容取出事件 ID，內容無法解析時返回空列表"""
+    try:
+        return [event.get("webhookEventId", "") for event in json.loads(body).get("events", [])]
+    except (ValueError, AttributeError):
+        return []
+
 @app.route("/init_rich_menu", methods=['GET'])
 def init_rich_menu_route():
     """初始化Rich Menu的路由"""
@@ -294,6 +483,8 @@ def init_rich_menu_route():
         return f"初始化Rich Menu時發生錯誤: {str(e)}\n\n詳細信息: {error_trace}"
 
 @handler.add(MessageEvent)
+@tracing.traced_event("handle_message")
+@user_states.in_session
 def handle_message(event):
     try:
         # 打印用戶ID - 添加在這裡，確保每次收到文字消息時都會打印
@@ -307,272 +498,298 @@ def handle_message(event):
             user_text = event.message.text.strip()
             reply_token = event.reply_token
             
-            # 檢查是否為設定活動的指令
-            if user_text.startswith("設定活動:"):
-                handle_add_event(user_text, reply_token, user_id)
-            
-            # 檢查是否為查詢活動的指令
-            elif user_text.startswith("查詢活動:"):
-                handle_query_events(user_text, reply_token, user_id)
-            
-            # 檢查是否為手動提醒的指令
-            elif user_text == "手動提醒":
-                response_text = event_reminder.manual_remind(user_id)
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text=response_text)]
-                    )
-                )
-            
-            # 檢查是否為幫助指令
-            elif user_text == "幫助" or user_text == "help":
-                send_help_message(reply_token)
-            
-            # 新增：設定活動表單請求
-            elif user_text == "設定活動":
-                start_event_creation_flow(reply_token, user_id)
-            
-            # 新增：查詢活動日期選擇請求
-            elif user_text == "查詢活動":
-                send_query_form_with_quick_reply(reply_token)
-                
-            # 新增：處理LIFF輸入活動名稱
-            elif user_text.startswith("LIFF_NAME:"):
-                name = user_text[10:].strip()
-                handle_liff_name_input(name, reply_token, user_id)
-                
-            # 新增：處理LIFF輸入備註
-            elif user_text.startswith("LIFF_NOTES:"):
-                notes = user_text[11:].strip()
-                handle_liff_notes_input(notes, reply_token, user_id)
-
-            # 處理設定活動流程中的活動名稱輸入（修改：添加支持Flex表單）
-            elif (user_id in user_states and 
-                  (('event_creation' in user_states[user_id] and user_states[user_id]['event_creation'].get('step') == 'waiting_for_name') or
-                   ('flex_form' in user_states[user_id] and user_states[user_id]['flex_form'].get('step') == 'waiting_for_flex_name'))):
-                
-                if 'flex_form' in user_states[user_id] and user_states[user_id]['flex_form'].get('step') == 'waiting_for_flex_name':
-                    # 處理Flex表單的名稱輸入
-                    user_states[user_id]['flex_form']['name'] = user_text
-                    
-                    # 詢問是否需要備註
-                    template_message = TemplateMessage(
-                        alt_text="是否需要備註",
-                        template=ConfirmTemplate(
-                            text="是否需要添加備註？",
-                            actions=[
-                                PostbackAction(
-                                    label="是",
-                                    data="action=need_notes_flex&value=yes"
-                                ),
-                                PostbackAction(
-                                    label="否",
-                                    data="action=need_notes_flex&value=no"
-                                )
-                            ]
-                        )
-                    )
-                    
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=reply_token,
-                            messages=[template_message]
-                        )
-                    )
-                else:
-                    # 處理常規流程的名稱輸入
-                    handle_event_name_input(user_text, reply_token, user_id)
-                
-            # 處理設定活動流程中的備註輸入（修改：添加支持Flex表單）
-            elif (user_id in user_states and 
-                  (('event_creation' in user_states[user_id] and user_states[user_id]['event_creation'].get('step') == 'waiting_for_notes') or
-                   ('flex_form' in user_states[user_id] and user_states[user_id]['flex_form'].get('step') == 'waiting_for_flex_notes'))):
-                
-                if 'flex_form' in user_states[user_id] and user_states[user_id]['flex_form'].get('step') == 'waiting_for_flex_notes':
-                    # 處理Flex表單的備註輸入
-                    # 如果用戶輸入「無」或「n」，則設置備註為空字符串
-                    notes = user_text
-                    if notes.lower() in ['無', 'none', 'n/a', '', 'n']:
-                        notes = ""
-                    
-                    user_states[user_id]['flex_form']['notes'] = notes
-                    
-                    # 創建完整的提交確認消息
-                    flex_form = user_states[user_id]['flex_form']
-                    confirm_message = f"請確認活動資訊:\n\n"
-                    
-                    if 'datetime' in flex_form:
-                        confirm_message += f"時間: {flex_form['datetime']}\n"
-                    if 'importance' in flex_form:
-                        confirm_message += f"重要性: {flex_form['importance']}\n"
-                    if 'category' in flex_form:
-                        confirm_message += f"分類: {flex_form['category']}\n"
-                    if 'name' in flex_form:
-                        confirm_message += f"活動名稱: {flex_form['name']}\n"
-                    if notes:
-                        confirm_message += f"備註: {notes}\n"
-                    
-                    # 發送確認按鈕
-                    
-                    # 更新用戶狀態，表示等待確認
-                    user_states[user_id]['flex_form']['step'] = 'waiting_for_confirmation'
-                    
-                    # 添加無備註信息
-                    if not notes:
-                        confirm_message += f"備註: (無備註)\n"
-                    
-                    # 使用共用函數發送確認訊息
-                    send_confirmation_message(reply_token, confirm_message, is_flex=True)
-                else:
-                    # 處理常規流程的備註輸入 - 修正：將參數從notes改為user_text
-                    handle_event_notes_input(user_text, reply_token, user_id)
+            # 依指令前綴與用戶目前的表單步驟分派
+            state = user_states[user_id] if user_id in user_states else None
+            command_router.dispatch(event, user_id, reply_token, user_text, state)
+        
+        # 上傳的文字檔：每行一個活動，批次新增
+        elif isinstance(event.message, FileMessageContent):
+            handle_event_file(event.message, event.reply_token, user_id)
+    except (CircuitOpenError, NotionQueryError) as e:
+        # Notion 暫時無法使用 (或查詢中途失敗) 且沒有可用的本地鏡像
+        print(f"處理消息時 Notion 無法使用: {e}")
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=event.reply_token,
+                messages=[TextMessage(text=str(e))]
+            )
+        )
+    except Exception as e:
+        print(f"處理消息時出錯: {e}")
 
-            # 新增：處理分類消息
-            elif user_text.startswith("分類:") and user_id in user_states and 'event_creation' in user_states[user_id]:
-                category = user_text[3:].strip()
-                handle_category_selection(category, reply_token, user_id)
-            
-            # 新增：處理時間選擇消息
-            elif user_text.startswith("選擇時間:") and user_id in user_states and 'event_creation' in user_states[user_id] and user_states[user_id]['event_creation'].get('step') == 'selecting_datetime':
-                # 解析時間字符串
-                try:
-                    # 從消息中提取時間
-                    time_str = user_text[5:].strip()
-                    
-                    # 解析日期時間字符串
-                    selected_time = datetime.strptime(time_str, "%Y/%m/%d %H:%M")
-                    
-                    # 確保時間有時區信息
-                    selected_time = selected_time.replace(tzinfo=timezone.utc)
-                    
-                    # 保存到用戶的活動創建狀態中
-                    user_states[user_id]['event_creation']['datetime'] = time_str
-                    user_states[user_id]['event_creation']['step'] = 'selecting_importance'
-                    
-                    # 創建重要性選擇的QuickReply選項
-                    importance_items = [
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="高重要性",
-                                text="重要性:高"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="中重要性",
-                                text="重要性:中"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="低重要性",
-                                text="重要性:低"
-                            )
-                        )
-                    ]
-                    
-                    # 創建含有QuickReply的文字訊息
-                    importance_message = TextMessage(
-                        text=f"📅 設定活動 (步驟 2/4)\n您選擇的時間是: {time_str}\n\n請選擇活動的重要性等級：",
-                        quick_reply=QuickReply(items=importance_items)
-                    )
-                    
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=reply_token,
-                            messages=[importance_message]
-                        )
-                    )
-                except Exception as e:
-                    print(f"處理時間選擇時出錯: {e}")
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=reply_token,
-                            messages=[TextMessage(text="時間格式不正確，請重新選擇")]
-                        )
-                    )
-            
-            # 新增：處理重要性選擇消息
-            elif user_text.startswith("重要性:") and user_id in user_states and 'event_creation' in user_states[user_id] and user_states[user_id]['event_creation'].get('step') == 'selecting_importance':
-                # 解析重要性
-                importance = user_text[4:].strip()
-                
-                # 驗證重要性
-                valid_importance = ["高", "中", "低"]
-                if importance not in valid_importance:
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=reply_token,
-                            messages=[TextMessage(text=f"無效的重要性: {importance}。請使用「高」、「中」或「低」。")]
-                        )
-                    )
-                    return
-                
-                # 保存到用戶的活動創建狀態中
-                user_states[user_id]['event_creation']['importance'] = importance
-                user_states[user_id]['event_creation']['step'] = 'selecting_category'
-                
-                # 顯示已完成的設定
-                progress_message = f"您已設定：\n時間: {user_states[user_id]['event_creation']['datetime']}\n重要性: {importance}\n\n"
-                
-                # 發送分類選擇器
-                category_quick_reply = QuickReply(
-                    items=[
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="會議",
-                                text="分類:會議"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="活動",
-                                text="分類:活動"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="提醒",
-                                text="分類:提醒"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="任務",
-                                text="分類:任務"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="其他",
-                                text="分類:其他"
-                            )
-                        )
-                    ]
-                )
-                
-                # 發送分類選擇消息
-                category_message = TextMessage(
-                    text=f"📅 設定活動 (步驟 3/4)\n{progress_message}請選擇活動分類：",
-                    quick_reply=category_quick_reply
-                )
-                
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[category_message]
-                    )
+# 文字指令分派器
+command_router = CommandRouter()
+
+# 檢查是否為設定活動 / 新增活動的指令 (新增活動可一次傳送多行，每行一個活動)
+# 新增活動以 when 註冊，在表單步驟之後才判斷：在表單中輸入以「新增活動」開頭的名稱或備註時仍交給表單
+@command_router.command("設定活動:", prefix=True)
+@command_router.command("新增活動", prefix=True, when=lambda state: True)
+def command_add_event(ctx):
+    handle_add_event(ctx.text, ctx.reply_token, ctx.user_id)
+
+# 檢查是否為查詢活動的指令
+@command_router.command("查詢活動:", prefix=True)
+def command_query_events(ctx):
+    handle_query_events(ctx.text, ctx.reply_token, ctx.user_id)
+
+# 檢查是否為手動提醒的指令
+@command_router.command("手動提醒")
+def command_manual_remind(ctx):
+    response_text = event_reminder.manual_remind(ctx.user_id)
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[TextMessage(text=response_text)]
+        )
+    )
+
+# 檢查是否為匯出行事曆的指令
+@command_router.command("匯出行事曆")
+def command_export_calendar(ctx):
+    base_url = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+    if not base_url or not export_secret():
+        reply_text = "尚未設定行事曆匯出功能 (PUBLIC_BASE_URL)"
+    else:
+        url = f"{base_url}/export/{ical.make_export_token(ctx.user_id, export_secret())}.ics"
+        reply_text = (
+            "📤 行事曆訂閱連結：\n"
+            f"{url}\n\n"
+            "在 Google 日曆選擇「以網址新增」，或在 iPhone 的「設定 > 日曆 > 帳號 > 加入已訂閱的行事曆」貼上此連結，"
+            "活動更新後會自動同步。請勿將連結分享給他人"
+        )
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[TextMessage(text=reply_text)]
+        )
+    )
+
+# 檢查是否為匯入行事曆的指令
+@command_router.command("匯入行事曆")
+def command_import_calendar(ctx):
+    base_url = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+    if not base_url or not export_secret():
+        reply_text = "尚未設定行事曆匯入功能 (PUBLIC_BASE_URL)"
+    else:
+        token = ical.make_export_token(ctx.user_id, export_secret(), purpose="import")
+        reply_text = (
+            "📥 行事曆匯入連結：\n"
+            f"{base_url}/import/{token}.ics\n\n"
+            "開啟連結並上傳從 Google 日曆或其他行事曆匯出的 .ics 檔，"
+            "已存在的活動會自動略過，匯入進度會以訊息通知。請勿將連結分享給他人"
+        )
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[TextMessage(text=reply_text)]
+        )
+    )
+
+# 檢查是否為幫助指令
+@command_router.command("幫助", "help")
+def command_help(ctx):
+    send_help_message(ctx.reply_token)
+
+# 新增：設定活動表單請求
+@command_router.command("設定活動")
+def command_start_event_creation(ctx):
+    start_event_creation_flow(ctx.reply_token, ctx.user_id)
+
+# 新增：查詢活動日期選擇請求
+@command_router.command("查詢活動")
+def command_query_form(ctx):
+    send_query_form_with_quick_reply(ctx.reply_token)
+
+# 新增：處理LIFF輸入活動名稱
+@command_router.command("LIFF_NAME:", prefix=True)
+def command_liff_name(ctx):
+    handle_liff_name_input(ctx.arg.strip(), ctx.reply_token, ctx.user_id)
+
+# 新增：處理LIFF輸入備註
+@command_router.command("LIFF_NOTES:", prefix=True)
+def command_liff_notes(ctx):
+    handle_liff_notes_input(ctx.arg.strip(), ctx.reply_token, ctx.user_id)
+
+# 處理Flex表單的名稱輸入
+@command_router.step('flex_form', 'waiting_for_flex_name')
+def step_flex_name(ctx):
+    user_states[ctx.user_id]['flex_form']['name'] = ctx.text
+    
+    # 詢問是否需要備註
+    template_message = TemplateMessage(
+        alt_text="是否需要備註",
+        template=ConfirmTemplate(
+            text="是否需要添加備註？",
+            actions=[
+                PostbackAction(
+                    label="是",
+                    data="action=need_notes_flex&value=yes"
+                ),
+                PostbackAction(
+                    label="否",
+                    data="action=need_notes_flex&value=no"
                 )
-            
-            # 其他情況，回覆相同的訊息並附帶快速回覆按鈕
-            else:
-                send_message_with_quick_reply(reply_token, user_text)
+            ]
+        )
+    )
+    
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[template_message]
+        )
+    )
+
+# 處理常規流程的名稱輸入
+@command_router.step('event_creation', 'waiting_for_name')
+def step_event_name(ctx):
+    handle_event_name_input(ctx.text, ctx.reply_token, ctx.user_id)
+
+# 處理Flex表單的備註輸入
+@command_router.step('flex_form', 'waiting_for_flex_notes')
+def step_flex_notes(ctx):
+    user_id = ctx.user_id
+    # 如果用戶輸入「無」或「n」，則設置備註為空字符串
+    notes = ctx.text
+    if notes.lower() in ['無', 'none', 'n/a', '', 'n']:
+        notes = ""
+    
+    user_states[user_id]['flex_form']['notes'] = notes
+    
+    # 創建完整的提交確認消息
+    flex_form = user_states[user_id]['flex_form']
+    confirm_message = f"請確認活動資訊:\n\n"
+    
+    if 'datetime' in flex_form:
+        confirm_message += f"時間: {flex_form['datetime']}\n"
+    if 'importance' in flex_form:
+        confirm_message += f"重要性: {flex_form['importance']}\n"
+    if 'category' in flex_form:
+        confirm_message += f"分類: {flex_form['category']}\n"
+    if 'name' in flex_form:
+        confirm_message += f"活動名稱: {flex_form['name']}\n"
+    if notes:
+        confirm_message += f"備註: {notes}\n"
+    
+    # 更新用戶狀態，表示等待確認
+    user_states[user_id]['flex_form']['step'] = 'waiting_for_confirmation'
+    
+    # 添加無備註信息
+    if not notes:
+        confirm_message += f"備註: (無備註)\n"
+    
+    # 使用共用函數發送確認訊息
+    send_confirmation_message(ctx.reply_token, confirm_message, is_flex=True)
+
+# 處理常規流程的備註輸入
+@command_router.step('event_creation', 'waiting_for_notes')
+def step_event_notes(ctx):
+    handle_event_notes_input(ctx.text, ctx.reply_token, ctx.user_id)
+
+# 新增：處理分類消息
+@command_router.command("分類:", prefix=True, when=lambda state: 'event_creation' in state)
+def command_category(ctx):
+    handle_category_selection(ctx.arg.strip(), ctx.reply_token, ctx.user_id)
+
+# 新增：處理時間選擇消息
+@command_router.command(
+    "選擇時間:",
+    prefix=True,
+    when=lambda state: 'event_creation' in state and state['event_creation'].get('step') == 'selecting_datetime'
+)
+def command_select_time(ctx):
+    user_id = ctx.user_id
+    reply_token = ctx.reply_token
+    # 解析時間字符串
+    try:
+        # 從消息中提取時間
+        time_str = ctx.arg.strip()
+        
+        # 解析日期時間字符串
+        selected_time = datetime.strptime(time_str, "%Y/%m/%d %H:%M")
+        
+        # 確保時間有時區信息
+        selected_time = selected_time.replace(tzinfo=timezone.utc)
+        
+        # 保存到用戶的活動創建狀態中
+        user_states[user_id]['event_creation']['datetime'] = time_str
+        user_states[user_id]['event_creation']['step'] = 'selecting_importance'
+        
+        # 創建含有重要性快速回覆的文字訊息
+        importance_message = TextMessage(
+            text=f"📅 設定活動 (步驟 2/4)\n您選擇的時間是: {time_str}\n\n請選擇活動的重要性等級：",
+            quick_reply=message_templates.importance_quick_reply
+        )
+        
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[importance_message]
+            )
+        )
     except Exception as e:
-        print(f"處理消息時出錯: {e}")
+        print(f"處理時間選擇時出錯: {e}")
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text="時間格式不正確，請重新選擇")]
+            )
+        )
+
+# 新增：處理重要性選擇消息
+@command_router.command(
+    "重要性:",
+    prefix=True,
+    when=lambda state: 'event_creation' in state and state['event_creation'].get('step') == 'selecting_importance'
+)
+def command_importance(ctx):
+    user_id = ctx.user_id
+    reply_token = ctx.reply_token
+    # 解析重要性
+    importance = ctx.arg.strip()
+    
+    # 驗證重要性
+    valid_importance = ["高", "中", "低"]
+    if importance not in valid_importance:
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text=f"無效的重要性: {importance}。請使用「高」、「中」或「低」。")]
+            )
+        )
+        return
+    
+    # 保存到用戶的活動創建狀態中
+    user_states[user_id]['event_creation']['importance'] = importance
+    user_states[user_id]['event_creation']['step'] = 'selecting_category'
+    
+    # 顯示已完成的設定
+    progress_message = f"您已設定：\n時間: {user_states[user_id]['event_creation']['datetime']}\n重要性: {importance}\n\n"
+    
+    # 發送分類選擇器 (快速回覆在啟動時已建立)
+    category_quick_reply = message_templates.category_quick_reply
+    # 發送分類選擇消息
+    category_message = TextMessage(
+        text=f"📅 設定活動 (步驟 3/4)\n{progress_message}請選擇活動分類：",
+        quick_reply=category_quick_reply
+    )
+    
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=reply_token,
+            messages=[category_message]
+        )
+    )
+
+# 其他情況，回覆相同的訊息並附帶快速回覆按鈕
+@command_router.fallback
+def command_echo(ctx):
+    send_message_with_quick_reply(ctx.reply_token, ctx.text)
 
 # 處理按鈕點擊事件
 @handler.add(PostbackEvent)
+@tracing.traced_event("handle_postback")
+@user_states.in_session
 def handle_postback(event):
     """處理 postback 事件"""
     try:
@@ -583,434 +800,458 @@ def handle_postback(event):
         print(f"收到 postback 事件: {data}")
         print(f"完整 postback 事件: data='{data}' params={event.postback.params}")
         
-        # 處理活動確認或取消
-        if data == "action=confirm_event":
-            handle_event_confirmation(reply_token, user_id, is_flex=False)
-        elif data == "action=confirm_event_flex":
-            handle_event_confirmation(reply_token, user_id, is_flex=True)
-        elif data == "action=cancel_event":
-            handle_event_cancellation(reply_token, user_id, is_flex=False)
-        elif data == "action=cancel_event_flex":
-            handle_event_cancellation(reply_token, user_id, is_flex=True)
-        # 處理開啟Flex表單
-        elif data == "action=open_event_form_flex":
-            send_event_creation_flex(reply_token, user_id)
-        # 處理自訂時間選擇
-        elif data == "action=select_custom_time" and event.postback.params and "datetime" in event.postback.params:
-            selected_datetime = event.postback.params["datetime"]
-            
-            # 格式化日期時間
-            dt_obj = datetime.strptime(selected_datetime, "%Y-%m-%dT%H:%M")
-            formatted_datetime = dt_obj.strftime("%Y/%m/%d %H:%M")
-            
-            # 保存到用戶的活動創建狀態中
-            if user_id not in user_states:
-                user_states[user_id] = {}
-            
-            if 'event_creation' not in user_states[user_id]:
-                user_states[user_id]['event_creation'] = {}
-                
-            user_states[user_id]['event_creation']['datetime'] = formatted_datetime
-            user_states[user_id]['event_creation']['step'] = 'selecting_importance'
-            
-            # 創建重要性選擇的QuickReply選項
-            importance_items = [
-                QuickReplyItem(
-                    action=MessageAction(
-                        label="高重要性",
-                        text="重要性:高"
-                    )
-                ),
-                QuickReplyItem(
-                    action=MessageAction(
-                        label="中重要性",
-                        text="重要性:中"
-                    )
-                ),
-                QuickReplyItem(
-                    action=MessageAction(
-                        label="低重要性",
-                        text="重要性:低"
-                    )
-                )
-            ]
-            
-            # 創建含有QuickReply的文字訊息
-            importance_message = TextMessage(
-                text=f"📅 設定活動 (步驟 2/4)\n您選擇的時間是: {formatted_datetime}\n\n請選擇活動的重要性等級：",
-                quick_reply=QuickReply(items=importance_items)
-            )
-            
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[importance_message]
-                )
-            )
-            
-        # 處理日期選擇（用於查詢單一日期）
-        elif data == "action=select_date" and event.postback.params and "date" in event.postback.params:
-            date_str = event.postback.params["date"]
-            start_date = datetime.strptime(date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-            end_date = start_date.replace(hour=23, minute=59, second=59)
-            events = notion_manager.query_events(start_date, end_date)
-            send_query_results(reply_token, start_date, end_date, events)
-            return
-        # 處理查詢範圍開始日期選擇
-        elif data == "action=select_start_date" and event.postback.params and "date" in event.postback.params:
-            start_date_str = event.postback.params["date"]
-            
-            # 保存開始日期到用戶狀態
-            if user_id not in user_states:
-                user_states[user_id] = {}
-            
-            user_states[user_id]['query_start_date'] = start_date_str
-            
-            # 顯示結束日期選擇器
-            send_end_date_picker(reply_token, start_date_str)
-            
-        # 處理查詢範圍結束日期選擇
-        elif data == "action=select_end_date" and event.postback.params and "date" in event.postback.params:
-            end_date_str = event.postback.params["date"]
-            
-            # 獲取之前保存的開始日期
-            if user_id in user_states and 'query_start_date' in user_states[user_id]:
-                start_date_str = user_states[user_id]['query_start_date']
-                
-                # 轉換日期格式並添加時區信息
-                start_date = datetime.strptime(start_date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-                end_date = datetime.strptime(end_date_str, "%Y-%m-%d").replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
-                
-                # 檢查日期順序
-                if end_date < start_date:
-                    line_bot_api.reply_message(
-                        ReplyMessageRequest(
-                            reply_token=reply_token,
-                            messages=[TextMessage(text="結束日期不能早於開始日期，請重新選擇")]
-                        )
-                    )
-                    return
-                
-                # 查詢事件並顯示結果
-                events = notion_manager.query_events(start_date, end_date)
-                send_query_results(reply_token, start_date, end_date, events)
-                
-                # 清理用戶狀態
-                del user_states[user_id]['query_start_date']
-            else:
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="請先選擇開始日期")]
-                    )
-                )
-        # 處理事件時間選擇
-        elif data == "action=select_event_date" and event.postback.params and "datetime" in event.postback.params:
-            selected_datetime = event.postback.params["datetime"]
-            
-            # 確保使用者狀態存在
-            if user_id not in user_state:
-                user_state[user_id] = {}
-            
-            if "flex_form_data" not in user_state[user_id]:
-                user_state[user_id]["flex_form_data"] = {}
-            
-            # 從 LINE 返回的日期時間格式（YYYY-MM-DDTHH:mm）轉換為我們使用的格式（YYYY/MM/DD HH:mm）
-            dt_obj = datetime.strptime(selected_datetime, "%Y-%m-%dT%H:%M")
-            formatted_datetime = dt_obj.strftime("%Y/%m/%d %H:%M")
-            
-            # 保存到用戶的表單數據中
-            user_state[user_id]["flex_form_data"]["datetime"] = formatted_datetime
-            
-            # 回覆用戶確認消息
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[TextMessage(text=f"已選擇時間: {formatted_datetime}")]
-                )
+        # 依 action 名稱分派給對應的處理函數
+        postback_router.dispatch(event, user_id, reply_token)
+    except (CircuitOpenError, NotionQueryError) as e:
+        # Notion 暫時無法使用 (或查詢中途失敗) 且沒有可用的本地鏡像
+        print(f"處理 postback 時 Notion 無法使用: {e}")
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text=str(e))]
             )
-        # 處理查詢單一日期
-        elif data == "action=query_date" and event.postback.params and "date" in event.postback.params:
-            date_str = event.postback.params["date"]
-            start_date = datetime.strptime(date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-            end_date = start_date.replace(hour=23, minute=59, second=59)
-            events = notion_manager.query_events(start_date, end_date)
-            send_query_results(reply_token, start_date, end_date, events)
-            
-        # 處理查詢今天
-        elif data == "action=query_today":
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-            end_date = today.replace(hour=23, minute=59, second=59)
-            events = notion_manager.query_events(today, end_date)
-            send_query_results(reply_token, today, end_date, events)
-            
-        # 處理查詢未來7天
-        elif data == "action=query_next7days":
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
-            end_date = (today + timedelta(days=7)).replace(hour=23, minute=59, second=59)
-            events = notion_manager.query_events(today, end_date)
-            send_query_results(reply_token, today, end_date, events)
-            
-        # 處理查詢本月
-        elif data == "action=query_month":
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, day=1, tzinfo=timezone.utc)
-            if today.month == 12:
-                end_date = datetime(today.year + 1, 1, 1, 23, 59, 59, tzinfo=timezone.utc) - timedelta(days=1)
-            else:
-                end_date = datetime(today.year, today.month + 1, 1, 23, 59, 59, tzinfo=timezone.utc) - timedelta(days=1)
-            events = notion_manager.query_events(today, end_date)
-            send_query_results(reply_token, today, end_date, events)
-            
-        # 處理查詢本年
-        elif data == "action=query_year":
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, day=1, month=1, tzinfo=timezone.utc)
-            end_date = datetime(today.year + 1, 1, 1, 0, 0, 0, tzinfo=timezone.utc) - timedelta(seconds=1)
-            events = notion_manager.query_events(today, end_date)
-            send_query_results(reply_token, today, end_date, events)
-
-        # 處理日期選擇器開啟表單
-        elif data == "action=open_query_form":
-            send_query_form_with_quick_reply(reply_token)
-            
-        # 處理日期範圍選擇
-        elif data == "action=select_date_range":
-            send_start_date_picker(reply_token)
-
-        # 處理其他操作
-        elif data == "action=open_event_form":
-            handle_query_events(data, reply_token, user_id)
-        elif data == "action=select_datetime_flex" and event.postback.params and "datetime" in event.postback.params:
-            # 處理Flex表單的日期時間選擇
-            selected_datetime = event.postback.params["datetime"]
-            
-            # 格式化日期時間
-            dt_obj = datetime.strptime(selected_datetime, "%Y-%m-%dT%H:%M")
-            formatted_datetime = dt_obj.strftime("%Y/%m/%d %H:%M")
-            
-            # 保存到用戶的Flex表單狀態中
-            if user_id not in user_states:
-                user_states[user_id] = {}
-            
-            if 'flex_form' not in user_states[user_id]:
-                user_states[user_id]['flex_form'] = {}
-                
-            user_states[user_id]['flex_form']['datetime'] = formatted_datetime
-            
-            # 發送確認消息
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[TextMessage(text=f"已選擇時間: {formatted_datetime}\n請繼續選擇重要性和分類")]
-                )
+        )
+    except Exception as e:
+        print(f"處理 postback 時出錯: {e}")
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text="處理請求時發生錯誤，請稍後再試")]
             )
-        elif data.startswith("action=select_importance_flex"):
-            # 從data參數中提取重要性值
-            importance = data.split("value=")[1] if "value=" in data else "中"
-            
-            # 保存重要性到用戶的Flex表單狀態中
-            if user_id not in user_states:
-                user_states[user_id] = {}
-            
-            if 'flex_form' not in user_states[user_id]:
-                user_states[user_id]['flex_form'] = {}
-                
-            user_states[user_id]['flex_form']['importance'] = importance
-            
-            # 發送確認消息
+        )
+
+# postback 動作分派表
+postback_router = PostbackRouter()
+
+# 處理活動確認或取消
+@postback_router.route("confirm_event")
+def postback_confirm_event(ctx):
+    handle_event_confirmation(ctx.reply_token, ctx.user_id, is_flex=False)
+
+@postback_router.route("confirm_event_flex")
+def postback_confirm_event_flex(ctx):
+    handle_event_confirmation(ctx.reply_token, ctx.user_id, is_flex=True)
+
+@postback_router.route("cancel_event")
+def postback_cancel_event(ctx):
+    handle_event_cancellation(ctx.reply_token, ctx.user_id, is_flex=False)
+
+@postback_router.route("cancel_event_flex")
+def postback_cancel_event_flex(ctx):
+    handle_event_cancellation(ctx.reply_token, ctx.user_id, is_flex=True)
+
+# 處理開啟Flex表單
+@postback_router.route("open_event_form_flex")
+def postback_open_event_form_flex(ctx):
+    send_event_creation_flex(ctx.reply_token, ctx.user_id)
+
+# 處理自訂時間選擇
+@postback_router.route("select_custom_time")
+def postback_select_custom_time(ctx):
+    if "datetime" not in ctx.picker:
+        return
+    user_id = ctx.user_id
+    selected_datetime = ctx.picker["datetime"]
+    
+    # 格式化日期時間
+    dt_obj = datetime.strptime(selected_datetime, "%Y-%m-%dT%H:%M")
+    formatted_datetime = dt_obj.strftime("%Y/%m/%d %H:%M")
+    
+    # 保存到用戶的活動創建狀態中
+    if user_id not in user_states:
+        user_states[user_id] = {}
+    
+    if 'event_creation' not in user_states[user_id]:
+        user_states[user_id]['event_creation'] = {}
+        
+    user_states[user_id]['event_creation']['datetime'] = formatted_datetime
+    user_states[user_id]['event_creation']['step'] = 'selecting_importance'
+    
+    # 創建含有重要性快速回覆的文字訊息
+    importance_message = TextMessage(
+        text=f"📅 設定活動 (步驟 2/4)\n您選擇的時間是: {formatted_datetime}\n\n請選擇活動的重要性等級：",
+        quick_reply=message_templates.importance_quick_reply
+    )
+    
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[importance_message]
+        )
+    )
+
+# 處理單一日期查詢（select_date 與 query_date 皆使用日期選擇器）
+@postback_router.route("select_date", "query_date")
+def postback_query_date(ctx):
+    if "date" not in ctx.picker:
+        return
+    date_str = ctx.picker["date"]
+    start_date = datetime.strptime(date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+    end_date = start_date.replace(hour=23, minute=59, second=59)
+    events = notion_manager.iter_events(start_date, end_date)
+    send_query_results(ctx.reply_token, start_date, end_date, events)
+
+# 處理查詢範圍開始日期選擇
+@postback_router.route("select_start_date")
+def postback_select_start_date(ctx):
+    if "date" not in ctx.picker:
+        return
+    user_id = ctx.user_id
+    start_date_str = ctx.picker["date"]
+    
+    # 保存開始日期到用戶狀態
+    if user_id not in user_states:
+        user_states[user_id] = {}
+    
+    user_states[user_id]['query_start_date'] = start_date_str
+    
+    # 顯示結束日期選擇器
+    send_end_date_picker(ctx.reply_token, start_date_str)
+
+# 處理查詢範圍結束日期選擇
+@postback_router.route("select_end_date")
+def postback_select_end_date(ctx):
+    if "date" not in ctx.picker:
+        return
+    user_id = ctx.user_id
+    reply_token = ctx.reply_token
+    end_date_str = ctx.picker["date"]
+    
+    # 獲取之前保存的開始日期
+    if user_id in user_states and 'query_start_date' in user_states[user_id]:
+        start_date_str = user_states[user_id]['query_start_date']
+        
+        # 轉換日期格式並添加時區信息
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+        
+        # 檢查日期順序
+        if end_date < start_date:
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
-                    messages=[TextMessage(text=f"已選擇重要性: {importance}\n請繼續選擇分類")]
+                    messages=[TextMessage(text="結束日期不能早於開始日期，請重新選擇")]
                 )
             )
-        elif data.startswith("action=select_category_flex"):
-            # 從data參數中提取分類值
-            category = data.split("value=")[1] if "value=" in data else "活動"
-            
-            # 保存分類到用戶的Flex表單狀態中
-            if user_id not in user_states:
-                user_states[user_id] = {}
-            
-            if 'flex_form' not in user_states[user_id]:
-                user_states[user_id]['flex_form'] = {
-                    'datetime': datetime.now().strftime("%Y/%m/%d %H:%M"),  # 默認為當前時間
-                    'importance': '中'  # 默認為中等重要性
-                }
-                
-            user_states[user_id]['flex_form']['category'] = category
-            
-            # 確保設置了默認值
-            if 'datetime' not in user_states[user_id]['flex_form'] or not user_states[user_id]['flex_form']['datetime']:
-                user_states[user_id]['flex_form']['datetime'] = datetime.now().strftime("%Y/%m/%d %H:%M")
-                
-            if 'importance' not in user_states[user_id]['flex_form'] or not user_states[user_id]['flex_form']['importance']:
-                user_states[user_id]['flex_form']['importance'] = '中'
-                
-            user_states[user_id]['flex_form']['step'] = 'waiting_for_flex_name'
-            
-            # 創建含QuickReply的消息以繼續收集信息
-            quick_reply_items = [
-                QuickReplyItem(
-                    action=MessageAction(
-                        label="取消",
-                        text="取消設定活動"
-                    )
-                )
-            ]
-            
-            # 創建含有QuickReply的訊息
-            message = TextMessage(
-                text=f"已選擇分類: {category}\n\n請直接輸入活動名稱：",
-                quick_reply=QuickReply(items=quick_reply_items)
+            return
+        
+        # 查詢事件並顯示結果
+        events = notion_manager.iter_events(start_date, end_date)
+        send_query_results(reply_token, start_date, end_date, events)
+        
+        # 清理用戶狀態
+        del user_states[user_id]['query_start_date']
+    else:
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text="請先選擇開始日期")]
             )
-            
-            line_bot_api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[message]
-                )
+        )
+
+# 處理事件時間選擇
+@postback_router.route("select_event_date")
+def postback_select_event_date(ctx):
+    if "datetime" not in ctx.picker:
+        return
+    user_id = ctx.user_id
+    selected_datetime = ctx.picker["datetime"]
+    
+    # 確保使用者狀態存在
+    if user_id not in user_state:
+        user_state[user_id] = {}
+    
+    if "flex_form_data" not in user_state[user_id]:
+        user_state[user_id]["flex_form_data"] = {}
+    
+    # 從 LINE 返回的日期時間格式（YYYY-MM-DDTHH:mm）轉換為我們使用的格式（YYYY/MM/DD HH:mm）
+    dt_obj = datetime.strptime(selected_datetime, "%Y-%m-%dT%H:%M")
+    formatted_datetime = dt_obj.strftime("%Y/%m/%d %H:%M")
+    
+    # 保存到用戶的表單數據中
+    user_state[user_id]["flex_form_data"]["datetime"] = formatted_datetime
+    
+    # 回覆用戶確認消息
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[TextMessage(text=f"已選擇時間: {formatted_datetime}")]
+        )
+    )
+
+# 處理查詢今天、未來7天、本月、本年
+@postback_router.route("query_today")
+def postback_query_today(ctx):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+    end_date = today.replace(hour=23, minute=59, second=59)
+    events = notion_manager.iter_events(today, end_date)
+    send_query_results(ctx.reply_token, today, end_date, events)
+
+@postback_router.route("query_next7days")
+def postback_query_next7days(ctx):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+    end_date = (today + timedelta(days=7)).replace(hour=23, minute=59, second=59)
+    events = notion_manager.iter_events(today, end_date)
+    send_query_results(ctx.reply_token, today, end_date, events)
+
+@postback_router.route("query_month")
+def postback_query_month(ctx):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, day=1, tzinfo=timezone.utc)
+    if today.month == 12:
+        end_date = datetime(today.year + 1, 1, 1, 23, 59, 59, tzinfo=timezone.utc) - timedelta(days=1)
+    else:
+        end_date = datetime(today.year, today.month + 1, 1, 23, 59, 59, tzinfo=timezone.utc) - timedelta(days=1)
+    events = notion_manager.iter_events(today, end_date)
+    send_query_results(ctx.reply_token, today, end_date, events)
+
+@postback_router.route("query_year")
+def postback_query_year(ctx):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, day=1, month=1, tzinfo=timezone.utc)
+    end_date = datetime(today.year + 1, 1, 1, 0, 0, 0, tzinfo=timezone.utc) - timedelta(seconds=1)
+    events = notion_manager.iter_events(today, end_date)
+    send_query_results(ctx.reply_token, today, end_date, events)
+
+# 處理查詢結果的「下一頁」：從游標時間重新查詢，略過已顯示的活動
+@postback_router.route("query_page")
+def postback_query_page(ctx):
+    try:
+        start_date, end_date, cursor, offset = parse_page_data(ctx.params)
+    except ValueError as e:
+        print(f"無效的查詢分頁參數: {ctx.data} ({e})")
+        return
+    after = datetime.fromtimestamp(cursor[0], timezone.utc)
+    events = notion_manager.iter_events(after, end_date)
+    send_query_results(ctx.reply_token, start_date, end_date, events, cursor=cursor, offset=offset)
+
+# 處理查詢結果的卡片檢視與「更多」：從指定日期查詢到結束日期
+@postback_router.route("query_cards")
+def postback_query_cards(ctx):
+    try:
+        start_date, end_date = parse_cards_data(ctx.params)
+    except ValueError as e:
+        print(f"無效的卡片查詢參數: {ctx.data} ({e})")
+        return
+    events = notion_manager.iter_events(start_date, end_date)
+    send_query_cards(ctx.reply_token, start_date, end_date, events)
+
+# 處理日期選擇器開啟表單
+@postback_router.route("open_query_form")
+def postback_open_query_form(ctx):
+    send_query_form_with_quick_reply(ctx.reply_token)
+
+# 處理日期範圍選擇
+@postback_router.route("select_date_range")
+def postback_select_date_range(ctx):
+    send_start_date_picker(ctx.reply_token)
+
+# 處理其他操作
+@postback_router.route("open_event_form")
+def postback_open_event_form(ctx):
+    handle_query_events(ctx.data, ctx.reply_token, ctx.user_id)
+
+@postback_router.route("select_datetime_flex")
+def postback_select_datetime_flex(ctx):
+    if "datetime" not in ctx.picker:
+        return
+    user_id = ctx.user_id
+    # 處理Flex表單的日期時間選擇
+    selected_datetime = ctx.picker["datetime"]
+    
+    # 格式化日期時間
+    dt_obj = datetime.strptime(selected_datetime, "%Y-%m-%dT%H:%M")
+    formatted_datetime = dt_obj.strftime("%Y/%m/%d %H:%M")
+    
+    # 保存到用戶的Flex表單狀態中
+    if user_id not in user_states:
+        user_states[user_id] = {}
+    
+    if 'flex_form' not in user_states[user_id]:
+        user_states[user_id]['flex_form'] = {}
+        
+    user_states[user_id]['flex_form']['datetime'] = formatted_datetime
+    
+    # 發送確認消息
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[TextMessage(text=f"已選擇時間: {formatted_datetime}\n請繼續選擇重要性和分類")]
+        )
+    )
+
+@postback_router.route("select_importance_flex")
+def postback_select_importance_flex(ctx):
+    user_id = ctx.user_id
+    # 從data參數中提取重要性值
+    importance = ctx.params.get("value", "中")
+    
+    # 保存重要性到用戶的Flex表單狀態中
+    if user_id not in user_states:
+        user_states[user_id] = {}
+    
+    if 'flex_form' not in user_states[user_id]:
+        user_states[user_id]['flex_form'] = {}
+        
+    user_states[user_id]['flex_form']['importance'] = importance
+    
+    # 發送確認消息
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[TextMessage(text=f"已選擇重要性: {importance}\n請繼續選擇分類")]
+        )
+    )
+
+@postback_router.route("select_category_flex")
+def postback_select_category_flex(ctx):
+    user_id = ctx.user_id
+    # 從data參數中提取分類值
+    category = ctx.params.get("value", "活動")
+    
+    # 保存分類到用戶的Flex表單狀態中
+    if user_id not in user_states:
+        user_states[user_id] = {}
+    
+    if 'flex_form' not in user_states[user_id]:
+        user_states[user_id]['flex_form'] = {
+            'datetime': datetime.now().strftime("%Y/%m/%d %H:%M"),  # 默認為當前時間
+            'importance': '中'  # 默認為中等重要性
+        }
+        
+    user_states[user_id]['flex_form']['category'] = category
+    
+    # 確保設置了默認值
+    if 'datetime' not in user_states[user_id]['flex_form'] or not user_states[user_id]['flex_form']['datetime']:
+        user_states[user_id]['flex_form']['datetime'] = datetime.now().strftime("%Y/%m/%d %H:%M")
+        
+    if 'importance' not in user_states[user_id]['flex_form'] or not user_states[user_id]['flex_form']['importance']:
+        user_states[user_id]['flex_form']['importance'] = '中'
+        
+    user_states[user_id]['flex_form']['step'] = 'waiting_for_flex_name'
+    
+    # 創建含QuickReply的消息以繼續收集信息
+    quick_reply_items = [
+        QuickReplyItem(
+            action=MessageAction(
+                label="取消",
+                text="取消設定活動"
             )
-        elif data.startswith("action=need_notes_flex"):
-            # 從data參數中提取是否需要備註
-            need_notes = data.split("value=")[1] if "value=" in data else "no"
-            
-            if need_notes.lower() == "yes":
-                # 用戶希望添加備註
-                if user_id not in user_states:
-                    user_states[user_id] = {}
-                
-                if 'flex_form' not in user_states[user_id]:
-                    user_states[user_id]['flex_form'] = {}
-                    
-                user_states[user_id]['flex_form']['step'] = 'waiting_for_flex_notes'
-                
-                # 創建含QuickReply的消息
-                quick_reply_items = [
-                    QuickReplyItem(
-                        action=MessageAction(
-                            label="取消備註",
-                            text="無"
-                        )
-                    )
-                ]
-                
-                # 創建含有QuickReply的訊息
-                message = TextMessage(
-                    text="請直接輸入備註，或選擇「取消備註」跳過：",
-                    quick_reply=QuickReply(items=quick_reply_items)
-                )
-                
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[message]
-                    )
-                )
-            else:
-                # 用戶不需要添加備註，直接進入確認步驟
-                if user_id not in user_states:
-                    user_states[user_id] = {}
-                
-                if 'flex_form' not in user_states[user_id]:
-                    user_states[user_id]['flex_form'] = {}
-                    
-                user_states[user_id]['flex_form']['notes'] = ""
-                
-                # 構建確認信息
-                flex_form = user_states[user_id]['flex_form']
-                confirm_message = "請確認活動資訊:\n"
-                
-                if 'datetime' in flex_form:
-                    confirm_message += f"時間: {flex_form['datetime']}\n"
-                if 'importance' in flex_form:
-                    confirm_message += f"重要性: {flex_form['importance']}\n"
-                if 'category' in flex_form:
-                    confirm_message += f"分類: {flex_form['category']}\n"
-                if 'name' in flex_form:
-                    confirm_message += f"活動名稱: {flex_form['name']}\n"
-                
-                confirm_message += f"備註: (無備註)"
-                
-                # 設置用戶狀態為等待確認
-                user_states[user_id]['flex_form']['step'] = 'waiting_for_confirmation'
-                
-                # 發送確認訊息
-                send_confirmation_message(reply_token, confirm_message, is_flex=True)
-        elif data == "action=set_importance":
-            handle_query_events(data, reply_token, user_id)
-        # 處理選擇重要性按鈕
-        elif data.startswith("action=set_importance"):
-            # 從data參數中提取重要性值
-            importance = data.split("value=")[1] if "value=" in data else "中"
-            
-            # 保存重要性到用戶的活動創建狀態中
-            if user_id in user_states and 'event_creation' in user_states[user_id] and user_states[user_id]['event_creation'].get('step') == 'selecting_importance':
-                user_states[user_id]['event_creation']['importance'] = importance
-                user_states[user_id]['event_creation']['step'] = 'selecting_category'
-                
-                # 顯示已完成的設定
-                progress_message = f"您已設定：\n時間: {user_states[user_id]['event_creation']['datetime']}\n重要性: {importance}\n\n"
-                
-                # 發送分類選擇器
-                category_quick_reply = QuickReply(
-                    items=[
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="會議",
-                                text="分類:會議"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="活動",
-                                text="分類:活動"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="提醒",
-                                text="分類:提醒"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="任務",
-                                text="分類:任務"
-                            )
-                        ),
-                        QuickReplyItem(
-                            action=MessageAction(
-                                label="其他",
-                                text="分類:其他"
-                            )
-                        )
-                    ]
-                )
-                
-                category_message = TextMessage(
-                    text=progress_message + "📅 設定活動 (步驟 3/4)\n請選擇活動分類",
-                    quick_reply=category_quick_reply
-                )
-                
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[category_message]
-                    )
-                )
-            else:
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="請先選擇活動時間")]
-                    )
+        )
+    ]
+    
+    # 創建含有QuickReply的訊息
+    message = TextMessage(
+        text=f"已選擇分類: {category}\n\n請直接輸入活動名稱：",
+        quick_reply=QuickReply(items=quick_reply_items)
+    )
+    
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=ctx.reply_token,
+            messages=[message]
+        )
+    )
+
+@postback_router.route("need_notes_flex")
+def postback_need_notes_flex(ctx):
+    user_id = ctx.user_id
+    # 從data參數中提取是否需要備註
+    need_notes = ctx.params.get("value", "no")
+    
+    if user_id not in user_states:
+        user_states[user_id] = {}
+    
+    if 'flex_form' not in user_states[user_id]:
+        user_states[user_id]['flex_form'] = {}
+    
+    if need_notes.lower() == "yes":
+        # 用戶希望添加備註
+        user_states[user_id]['flex_form']['step'] = 'waiting_for_flex_notes'
+        
+        # 創建含QuickReply的消息
+        quick_reply_items = [
+            QuickReplyItem(
+                action=MessageAction(
+                    label="取消備註",
+                    text="無"
                 )
-    except Exception as e:
-        print(f"處理 postback 時出錯: {e}")
+            )
+        ]
+        
+        # 創建含有QuickReply的訊息
+        message = TextMessage(
+            text="請直接輸入備註，或選擇「取消備註」跳過：",
+            quick_reply=QuickReply(items=quick_reply_items)
+        )
+        
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=ctx.reply_token,
+                messages=[message]
+            )
+        )
+    else:
+        # 用戶不需要添加備註，直接進入確認步驟
+        user_states[user_id]['flex_form']['notes'] = ""
+        
+        # 構建確認信息
+        flex_form = user_states[user_id]['flex_form']
+        confirm_message = "請確認活動資訊:\n"
+        
+        if 'datetime' in flex_form:
+            confirm_message += f"時間: {flex_form['datetime']}\n"
+        if 'importance' in flex_form:
+            confirm_message += f"重要性: {flex_form['importance']}\n"
+        if 'category' in flex_form:
+            confirm_message += f"分類: {flex_form['category']}\n"
+        if 'name' in flex_form:
+            confirm_message += f"活動名稱: {flex_form['name']}\n"
+        
+        confirm_message += f"備註: (無備註)"
+        
+        # 設置用戶狀態為等待確認
+        user_states[user_id]['flex_form']['step'] = 'waiting_for_confirmation'
+        
+        # 發送確認訊息
+        send_confirmation_message(ctx.reply_token, confirm_message, is_flex=True)
+
+# 處理選擇重要性按鈕
+@postback_router.route("set_importance")
+def postback_set_importance(ctx):
+    user_id = ctx.user_id
+    reply_token = ctx.reply_token
+    if "value" not in ctx.params:
+        handle_query_events(ctx.data, reply_token, user_id)
+        return
+    
+    # 從data參數中提取重要性值
+    importance = ctx.params["value"]
+    
+    # 保存重要性到用戶的活動創建狀態中
+    if user_id in user_states and 'event_creation' in user_states[user_id] and user_states[user_id]['event_creation'].get('step') == 'selecting_importance':
+        user_states[user_id]['event_creation']['importance'] = importance
+        user_states[user_id]['event_creation']['step'] = 'selecting_category'
+        
+        # 顯示已完成的設定
+        progress_message = f"您已設定：\n時間: {user_states[user_id]['event_creation']['datetime']}\n重要性: {importance}\n\n"
+        
+        # 發送分類選擇器 (快速回覆在啟動時已建立)
+        category_quick_reply = message_templates.category_quick_reply
+        category_message = TextMessage(
+            text=progress_message + "📅 設定活動 (步驟 3/4)\n請選擇活動分類",
+            quick_reply=category_quick_reply
+        )
+        
         line_bot_api.reply_message(
             ReplyMessageRequest(
                 reply_token=reply_token,
-                messages=[TextMessage(text="處理請求時發生錯誤，請稍後再試")]
+                messages=[category_message]
+            )
+        )
+    else:
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text="請先選擇活動時間")]
             )
         )
 
@@ -1149,87 +1390,19 @@ def start_event_creation_flow(reply_token, user_id):
 
 # 發送重要性選擇器
 def send_importance_selector(reply_token):
-    # 創建重要性選擇按鈕
-    importance_buttons = [
-        PostbackAction(
-            label="高重要性",
-            data="action=set_importance&value=高"
-        ),
-        PostbackAction(
-            label="中重要性",
-            data="action=set_importance&value=中"
-        ),
-        PostbackAction(
-            label="低重要性",
-            data="action=set_importance&value=低"
-        )
-    ]
-    
-    # 創建重要性選擇模板
-    importance_template = TemplateMessage(
-        alt_text="選擇活動重要性",
-        template=ButtonsTemplate(
-            title="📅 設定活動 (步驟 2/4)",
-            text="請選擇活動的重要性等級",
-            actions=importance_buttons
-        )
-    )
-    
     line_bot_api.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
-            messages=[importance_template]
+            messages=[message_templates.importance_selector]
         )
     )
 
 # 發送分類選擇器
 def send_category_selector(reply_token):
-    # 創建分類選擇快速回覆
-    category_quick_reply = QuickReply(
-        items=[
-            QuickReplyItem(
-                action=MessageAction(
-                    label="會議",
-                    text="分類:會議"
-                )
-            ),
-            QuickReplyItem(
-                action=MessageAction(
-                    label="活動",
-                    text="分類:活動"
-                )
-            ),
-            QuickReplyItem(
-                action=MessageAction(
-                    label="提醒",
-                    text="分類:提醒"
-                )
-            ),
-            QuickReplyItem(
-                action=MessageAction(
-                    label="任務",
-                    text="分類:任務"
-                )
-            ),
-            QuickReplyItem(
-                action=MessageAction(
-                    label="其他",
-                    text="分類:其他"
-                )
-            )
-        ]
-    )
-    
-    # 發送分類選擇消息
-    category_message = TextMessage(
-        text="📅 設定活動 (步驟 3/4)\n請選擇活動分類",
-        quick_reply=category_quick_reply
-    )
-    
     line_bot_api.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
-            messages=[category_message]
+            messages=[message_templates.category_selector]
         )
     )
 
@@ -1508,9 +1681,19 @@ def send_help_message(reply_token):
    也可以只指定一天:
    範例: 查詢活動:2025/12/25
 
-3️⃣ 手動提醒:
+3️⃣ 批次新增活動:
+   在「新增活動」之後每行輸入一個活動，或上傳每行一個活動的 .txt 檔
+   範例: 新增活動
+   期中考 2025/04/15 10:00 [考試] [高]
+   報告繳交 2025/05/20 [作業] [中] [第三組]
+
+4️⃣ 手動提醒:
    直接發送「手動提醒」，Bot 將立即檢查並發送未來三天內的活動提醒
 
+5️⃣ 匯出 / 匯入行事曆:
+   直接發送「匯出行事曆」，取得可在手機行事曆訂閱的連結
+   直接發送「匯入行事曆」，取得上傳 .ics 檔的連結
+
 🔔 自動提醒功能會在每天早上 9 點自動檢查未來三天內的活動並發送提醒。
     """
     
@@ -1550,79 +1733,70 @@ def send_help_message(reply_token):
         )
     )
 
+ADD_EVENT_HELP = (
+    "請使用以下格式新增活動：\n\n新增活動 活動名稱 YYYY/MM/DD HH:MM [分類] [重要性] [備註]\n\n"
+    "例如：\n新增活動 開會 2023/01/01 14:30 [工作] [高] [準備簡報]\n\n"
+    "一次新增多個活動時，在「新增活動」之後每行輸入一個活動，或上傳每行一個活動的 .txt 檔"
+)
+
 def handle_add_event(user_text, reply_token, user_id):
-    """處理添加活動的命令"""
+    """處理添加活動的命令，訊息包含多行活動時改為批次新增"""
     try:
+        # 多行時每行一個活動
+        if len([line for line in user_text.splitlines() if line.strip()]) > 1:
+            handle_bulk_add_events(user_text, reply_token, user_id)
+            return
+        
         # 檢查格式: 新增活動 活動名稱 YYYY/MM/DD HH:MM [分類] [重要性] [備註]
-        pattern = r'^新增(?:活動)?\s+(.+?)\s+(\d{4}/\d{1,2}/\d{1,2}(?:\s+\d{1,2}:\d{1,2})?)\s*(?:\[([^\]]+)\])?\s*(?:\[([^\]]+)\])?\s*(?:\[([^\]]*)\])?$'
-        match = re.match(pattern, user_text, re.DOTALL)
+        try:
+            fields = parse_event_line(user_text) if user_text.startswith("新增") else None
+        except ValueError as e:
+            line_bot_api.reply_message(
+                ReplyMessageRequest(
+                    reply_token=reply_token,
+                    messages=[TextMessage(text=str(e))]
+                )
+            )
+            return
         
-        if match:
-            event_name = match.group(1).strip()
-            date_str = match.group(2).strip()
-            
-            # 解析日期時間
-            if ' ' in date_str and ':' in date_str.split(' ')[1]:
-                event_time = datetime.strptime(date_str, "%Y/%m/%d %H:%M")
-            else:
-                event_time = datetime.strptime(date_str, "%Y/%m/%d").replace(hour=9, minute=0)  # 預設為上午9點
-            
-            # 確保event_time有時區信息
-            event_time = event_time.replace(tzinfo=timezone.utc)
-            
-            # 解析可選參數
-            category = match.group(3).strip() if match.group(3) else "活動"
-            importance = match.group(4).strip() if match.group(4) else "中"
-            notes = match.group(5).strip() if match.group(5) else ""
-            
-            # 驗證重要性
-            valid_importance = ["高", "中", "低"]
-            if importance not in valid_importance:
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text=f"無效的重要性: {importance}。請使用「高」、「中」或「低」。")]
-                    )
+        if fields is None:
+            # 格式不正確，顯示幫助
+            line_bot_api.reply_message(
+                ReplyMessageRequest(
+                    reply_token=reply_token,
+                    messages=[TextMessage(text=ADD_EVENT_HELP)]
                 )
-                return
-            
-            # 添加到 Notion
-            response = notion_manager.add_event(
-                event_name=event_name,
-                event_time=event_time,
-                category=category,
-                importance=importance,
-                notes=notes
             )
+            return
+        
+        # 添加到 Notion
+        response = notion_manager.add_event(**fields)
+        
+        if response:
+            # 創建成功消息
+            success_message = (
+                f"✅ 活動已設定成功！\n\n活動名稱: {fields['event_name']}\n"
+                f"時間: {fields['event_time'].strftime('%Y/%m/%d %H:%M')}\n"
+                f"分類: {fields['category']}\n重要性: {fields['importance']}"
+            )
+            if fields["notes"]:
+                success_message += f"\n備註: {fields['notes']}"
             
-            if response:
-                # 創建成功消息
-                success_message = f"✅ 活動已設定成功！\n\n活動名稱: {event_name}\n時間: {date_str}\n分類: {category}\n重要性: {importance}"
-                if notes:
-                    success_message += f"\n備註: {notes}"
-                
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text=success_message)]
-                    )
-                )
-            else:
-                line_bot_api.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="活動設定失敗，請稍後再試")]
-                    )
+            line_bot_api.reply_message(
+                ReplyMessageRequest(
+                    reply_token=reply_token,
+                    messages=[TextMessage(text=success_message)]
                 )
+            )
         else:
-            # 格式不正確，顯示幫助
-            help_message = "請使用以下格式新增活動：\n\n新增活動 活動名稱 YYYY/MM/DD HH:MM [分類] [重要性] [備註]\n\n例如：\n新增活動 開會 2023/01/01 14:30 [工作] [高] [準備簡報]"
             line_bot_api.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
-                    messages=[TextMessage(text=help_message)]
+                    messages=[TextMessage(text="活動設定失敗，請稍後再試")]
                 )
             )
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"處理添加活動時出錯: {e}")
         line_bot_api.reply_message(
@@ -1632,6 +1806,78 @@ def handle_add_event(user_text, reply_token, user_id):
             )
         )
 
+def handle_bulk_add_events(text, reply_token, user_id):
+    """
+    批次新增活動
+    
+    每行解析為一個活動，經由 NotionManager.add_events 在速率限制內並行寫入，
+    最後以一則訊息回覆成功與失敗的項目
+    """
+    events, errors = parse_event_lines(text)
+    max_events = int(os.getenv("BULK_EVENT_MAX", "100"))
+    
+    if not events and not errors:
+        reply_text = ADD_EVENT_HELP
+    elif len(events) > max_events:
+        reply_text = f"一次最多新增 {max_events} 項活動，目前有 {len(events)} 項，請分批傳送"
+    else:
+        responses = notion_manager.add_events([fields for _, fields in events])
+        results = [
+            (line_number, fields, response is not None)
+            for (line_number, fields), response in zip(events, responses)
+        ]
+        reply_text = format_summary(results, errors)
+    
+    reply_or_push(reply_token, user_id, [TextMessage(text=reply_text)])
+
+def handle_event_file(message, reply_token, user_id):
+    """處理用戶上傳的 .txt 檔，內容與多行「新增活動」訊息相同，每行一個活動"""
+    try:
+        max_bytes = int(os.getenv("BULK_EVENT_MAX_FILE_BYTES", "102400"))
+        if not (message.file_name or "").lower().endswith(".txt"):
+            reply_text = "目前只支援以 .txt 檔批次新增活動，每行一個活動"
+        elif message.file_size and message.file_size > max_bytes:
+            reply_text = f"檔案過大，請小於 {max_bytes // 1024} KB"
+        else:
+            content = get_messaging_api_blob().get_message_content(message.id)
+            try:
+                text = bytes(content).decode("utf-8-sig")
+            except UnicodeDecodeError:
+                reply_text = "無法讀取檔案，請以 UTF-8 編碼儲存"
+            else:
+                handle_bulk_add_events(text, reply_token, user_id)
+                return
+        
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text=reply_text)]
+            )
+        )
+    except Exception as e:
+        print(f"處理上傳檔案時出錯: {e}")
+        reply_or_push(reply_token, user_id, [TextMessage(text="處理檔案時發生錯誤，請稍後再試")])
+
+def reply_or_push(reply_token, user_id, messages):
+    """
+    以 reply 回覆；耗時較長的處理 (例如批次新增) 可能讓 replyToken 失效，此時改用 push
+    """
+    try:
+        line_bot_api.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=messages
+            )
+        )
+    except Exception as e:
+        print(f"回覆訊息失敗 ({e})，改以推播發送")
+        line_bot_api.push_message(
+            PushMessageRequest(
+                to=user_id,
+                messages=messages
+            )
+        )
+
 def handle_query_events(user_text, reply_token, user_id):
     """處理查詢活動的指令"""
     try:
@@ -1649,14 +1895,14 @@ def handle_query_events(user_text, reply_token, user_id):
             elif user_text == "action=query_today":
                 today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
                 end_date = today.replace(hour=23, minute=59, second=59)
-                events = notion_manager.query_events(today, end_date)
+                events = notion_manager.iter_events(today, end_date)
                 send_query_results(reply_token, today, end_date, events)
                 return
             # 處理未來7天查詢
             elif user_text == "action=query_next7days":
                 today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
                 end_date = (today + timedelta(days=7)).replace(hour=23, minute=59, second=59)
-                events = notion_manager.query_events(today, end_date)
+                events = notion_manager.iter_events(today, end_date)
                 send_query_results(reply_token, today, end_date, events)
                 return
             # 處理本月查詢
@@ -1666,14 +1912,14 @@ def handle_query_events(user_text, reply_token, user_id):
                     end_date = datetime(today.year + 1, 1, 1, 23, 59, 59, tzinfo=timezone.utc) - timedelta(days=1)
                 else:
                     end_date = datetime(today.year, today.month + 1, 1, 23, 59, 59, tzinfo=timezone.utc) - timedelta(days=1)
-                events = notion_manager.query_events(today, end_date)
+                events = notion_manager.iter_events(today, end_date)
                 send_query_results(reply_token, today, end_date, events)
                 return
             # 處理本年查詢
             elif user_text == "action=query_year":
                 today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0, day=1, month=1, tzinfo=timezone.utc)
                 end_date = datetime(today.year + 1, 1, 1, 0, 0, 0, tzinfo=timezone.utc) - timedelta(seconds=1)
-                events = notion_manager.query_events(today, end_date)
+                events = notion_manager.iter_events(today, end_date)
                 send_query_results(reply_token, today, end_date, events)
                 return
             # 其他未知操作
@@ -1718,7 +1964,7 @@ def handle_query_events(user_text, reply_token, user_id):
             end_date = start_date.replace(hour=23, minute=59, second=59)
         
         # 查詢 Notion
-        events = notion_manager.query_events(start_date, end_date)
+        events = notion_manager.iter_events(start_date, end_date)
         send_query_results(reply_token, start_date, end_date, events)
         
     except ValueError as e:
@@ -1739,311 +1985,90 @@ def handle_query_events(user_text, reply_token, user_id):
 # 新增：使用QuickReply發送查詢活動表單
 def send_query_form_with_quick_reply(reply_token):
     """使用QuickReply發送查詢活動表單"""
-    
-    # 創建查詢選項的QuickReply
-    quick_reply_items = [
-        QuickReplyItem(
-            action=DatetimePickerAction(
-                label="選擇單日日期",
-                data="action=query_date",
-                mode="date"
-            )
-        ),
-        QuickReplyItem(
-            action=PostbackAction(
-                label="選擇範圍日期",
-                data="action=select_date_range"
-            )
-        ),
-        QuickReplyItem(
-            action=PostbackAction(
-                label="查詢今天",
-                data="action=query_today"
-            )
-        ),
-        QuickReplyItem(
-            action=PostbackAction(
-                label="查詢後7天",
-                data="action=query_next7days"
-            )
-        ),
-        QuickReplyItem(
-            action=PostbackAction(
-                label="查詢本月",
-                data="action=query_month"
-            )
-        ),
-        QuickReplyItem(
-            action=PostbackAction(
-                label="查詢本年",
-                data="action=query_year"
-            )
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=reply_token,
+            messages=[message_templates.query_form]
         )
-    ]
+    )
+
+# 新增：發送查詢結果的通用函數
+@tracing.traced("send_query_results")
+def send_query_results(reply_token, start_date, end_date, events, cursor=None, offset=0):
+    """
+    發送查詢結果的通用函數
     
-    # 創建含有QuickReply的文字訊息
-    query_message = TextMessage(
-        text="📅 活動查詢\n請選擇查詢方式，或直接輸入格式如：\n查詢活動:2023/12/01,2023/12/31",
-        quick_reply=QuickReply(items=quick_reply_items)
+    events 可以是列表或 NotionManager.iter_events 產生的生成器。
+    活動逐筆排入最多 5 則、每則不超過 5000 字的文字訊息；放不下時停止讀取
+    (之後的 Notion 分頁不會被查詢)，並在最後一則訊息附上「下一頁」按鈕，
+    按下時從游標位置重新查詢 (見 postback_query_page)
+    """
+    messages, count, next_cursor = render_query_results(
+        events, format_range(start_date, end_date), cursor=cursor, offset=offset
     )
+    # 關閉生成器，釋放尚未讀完的查詢
+    if hasattr(events, "close"):
+        events.close()
+    
+    text_messages = [TextMessage(text=text) for text in messages]
+    quick_reply_items = []
+    if next_cursor:
+        quick_reply_items.append(QuickReplyItem(action=PostbackAction(
+            label="下一頁",
+            data=make_page_data(start_date, end_date, next_cursor, offset + count),
+            display_text="下一頁"
+        )))
+    if count and end_date.date() != start_date.date():
+        # 日期範圍查詢可改以每天一張卡片的 carousel 檢視
+        quick_reply_items.append(QuickReplyItem(action=PostbackAction(
+            label="卡片檢視",
+            data=make_cards_data(start_date, end_date),
+            display_text="卡片檢視"
+        )))
+    if quick_reply_items:
+        text_messages[-1].quick_reply = QuickReply(items=quick_reply_items)
     
     line_bot_api.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
-            messages=[query_message]
+            messages=text_messages
         )
     )
 
-# 新增：發送查詢結果的通用函數
-def send_query_results(reply_token, start_date, end_date, events):
-    """發送查詢結果的通用函數"""
-    if events:
-        # 創建回覆消息
-        message = f"📅 {start_date.strftime('%Y/%m/%d')} "
-        if end_date.date() != start_date.date():
-            message += f"到 {end_date.strftime('%Y/%m/%d')} "
-        message += f"的活動（共 {len(events)} 項）：\n\n"
-        
-        for event_item in events:
-            event_time = datetime.fromisoformat(event_item["time"].replace("Z", "+00:00"))
-            formatted_time = event_time.strftime("%Y/%m/%d %H:%M")
-            
-            # 簡潔格式
-            message += f"{event_item['name']}     {formatted_time} ({event_item['importance']})\n"
-            message += f"[{event_item['category']}]"
-            
-            if event_item["notes"]:
-                message += f" {event_item['notes']}"
-            
-            message += "\n\n"
-        
-        line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=reply_token,
-                messages=[TextMessage(text=message)]
-            )
-        )
-    else:
-        message = f"📅 {start_date.strftime('%Y/%m/%d')} "
-        if end_date.date() != start_date.date():
-            message += f"到 {end_date.strftime('%Y/%m/%d')} "
-        message += "沒有找到任何活動"
-        
-        line_bot_api.reply_message(
-            ReplyMessageRequest(
-                reply_token=reply_token,
-                messages=[TextMessage(text=message)]
-            )
-        )
-
-# 新增：發送活動設定Flex表單
-def send_event_creation_flex(reply_token, user_id=None):
-    # 創建Flex表單的內容
-    flex_content = {
-        "type": "bubble",
-        "header": {
-            "type": "box",
-            "layout": "vertical",
-            "contents": [
-                {
-                    "type": "text",
-                    "text": "📅 活動設定",
-                    "size": "xl",
-                    "weight": "bold",
-                    "color": "#1DB446"
-                }
-            ]
-        },
-        "body": {
-            "type": "box",
-            "layout": "vertical",
-            "contents": [
-                {
-                    "type": "box",
-                    "layout": "vertical",
-                    "margin": "lg",
-                    "spacing": "sm",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "日期時間",
-                                    "size": "sm",
-                                    "color": "#555555",
-                                    "flex": 0
-                                }
-                            ]
-                        },
-                        {
-                            "type": "text",
-                            "text": "點擊選擇",
-                            "size": "sm",
-                            "color": "#111111",
-                            "margin": "md",
-                            "action": {
-                                "type": "datetimepicker",
-                                "label": "選擇日期時間",
-                                "data": "action=select_datetime_flex",
-                                "mode": "datetime",
-                                "initial": datetime.now().strftime("%Y-%m-%dT%H:%M"),
-                                "max": (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%dT%H:%M"),
-                                "min": datetime.now().strftime("%Y-%m-%dT%H:%M")
-                            }
-                        },
-                        {
-                            "type": "separator",
-                            "margin": "lg"
-                        },
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "margin": "lg",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "重要性",
-                                    "size": "sm",
-                                    "color": "#555555",
-                                    "flex": 0
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "margin": "md",
-                            "contents": [
-                                {
-                                    "type": "button",
-                                    "style": "primary",
-                                    "color": "#FF5551",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "高",
-                                        "data": "action=select_importance_flex&value=高"
-                                    },
-                                    "height": "sm"
-                                },
-                                {
-                                    "type": "button",
-                                    "style": "primary",
-                                    "color": "#FFA500",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "中",
-                                        "data": "action=select_importance_flex&value=中"
-                                    },
-                                    "margin": "md",
-                                    "height": "sm"
-                                },
-                                {
-                                    "type": "button",
-                                    "style": "primary",
-                                    "color": "#00CC00",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "低",
-                                        "data": "action=select_importance_flex&value=低"
-                                    },
-                                    "margin": "md",
-                                    "height": "sm"
-                                }
-                            ]
-                        },
-                        {
-                            "type": "separator",
-                            "margin": "lg"
-                        },
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "margin": "lg",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "分類",
-                                    "size": "sm",
-                                    "color": "#555555",
-                                    "flex": 0
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "margin": "md",
-                            "contents": [
-                                {
-                                    "type": "button",
-                                    "style": "secondary",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "會議",
-                                        "data": "action=select_category_flex&value=會議"
-                                    },
-                                    "height": "sm"
-                                },
-                                {
-                                    "type": "button",
-                                    "style": "secondary",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "活動",
-                                        "data": "action=select_category_flex&value=活動"
-                                    },
-                                    "margin": "md",
-                                    "height": "sm"
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "margin": "md",
-                            "contents": [
-                                {
-                                    "type": "button",
-                                    "style": "secondary",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "提醒",
-                                        "data": "action=select_category_flex&value=提醒"
-                                    },
-                                    "height": "sm"
-                                },
-                                {
-                                    "type": "button",
-                                    "style": "secondary",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "任務",
-                                        "data": "action=select_category_flex&value=任務"
-                                    },
-                                    "margin": "md",
-                                    "height": "sm"
-                                }
-                            ]
-                        }
-                        # 此處已移除活動名稱和備註輸入區塊
-                    ]
-                }
-            ]
-        }
-    }
+@tracing.traced("send_query_cards")
+def send_query_cards(reply_token, start_date, end_date, events):
+    """
+    以 Flex carousel 發送查詢結果，每天一張卡片，一則訊息最多 12 張
     
-    # 移除對非存在欄位的操作
+    之後的日期要等用戶點選「更多」才查詢並建立卡片
+    """
+    title = format_range(start_date, end_date)
+    message, next_day = render_day_carousel(events, title)
+    if hasattr(events, "close"):
+        events.close()
     
-    # 移除原來的送出按鈕
-    if "footer" in flex_content:
-        del flex_content["footer"]
+    if message is None:
+        message = TextMessage(text=title + "沒有找到任何活動")
+    elif next_day:
+        message.quick_reply = QuickReply(items=[
+            QuickReplyItem(action=PostbackAction(
+                label="更多",
+                data=make_cards_data(next_day, end_date),
+                display_text="更多"
+            ))
+        ])
     
-    flex_message = FlexMessage(
-        alt_text="活動設定表單",
-        contents=FlexContainer.from_dict(flex_content)
+    line_bot_api.reply_message(
+        ReplyMessageRequest(
+            reply_token=reply_token,
+            messages=[message]
+        )
     )
+
+# 新增：發送活動設定Flex表單
+def send_event_creation_flex(reply_token, user_id=None):
+    # 表單內容在啟動時已建立，只替換日期時間選擇器的時間
+    flex_message = message_templates.event_creation_flex()
     
     # 初始化用戶的Flex表單狀態，設置默認值
     if user_id:
@@ -0,0 +1,105 @@
+import re
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Notion / LINE 呼叫與處理函數的延遲分佈 (秒)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "linebot_http_request_seconds",
+    "Flask 請求處理時間",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HANDLER_SECONDS = Histogram(
+    "linebot_handler_seconds",
+    "各個 postback 動作 / 文字指令的處理時間",
+    ["kind", "action", "status"],
+    buckets=LATENCY_BUCKETS
+)
+NOTION_CALL_SECONDS = Histogram(
+    "linebot_notion_call_seconds",
+    "Notion API 單次呼叫時間 (不含限流等待)",
+    ["method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+LINE_CALL_SECONDS = Histogram(
+    "linebot_line_call_seconds",
+    "LINE Messaging API 單次呼叫時間",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    "linebot_scheduler_job_seconds",
+    "排程工作的執行時間",
+    ["job", "status"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600)
+)
+JOB_FAILURES = Counter(
+    "linebot_scheduler_job_failures_total",
+    "排程工作拋出例外的次數",
+    ["job"]
+)
+USER_STATES = Gauge(
+    "linebot_user_states",
+    "目前保存中的使用者對話狀態數量"
+)
+
+# LINE API 路徑中的 ID (richmenu-xxx、使用者 ID、訊息 ID...) 以 {id} 取代，避免標籤數量無限增長
+_ID_SEGMENT = re.compile(r"/(?:richmenu-[0-9a-f]+|[UCR][0-9a-f]{32}|[0-9a-zA-Z_-]{20,}|\d+)(?=/|$)")
+
+
+@contextmanager
+def track(histogram, **labels):
+    """計時 with 區塊並記錄到 histogram，區塊拋出例外時 status 標為 error"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        histogram.labels(status=status, **labels).observe(time.perf_counter() - started)
+
+
+def timed_job(job_id, func):
+    """包裝排程工作，記錄每次執行時間與失敗次數"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            with track(JOB_SECONDS, job=job_id):
+                return func(*args, **kwargs)
+        except Exception:
+            JOB_FAILURES.labels(job=job_id).inc()
+            raise
+    return wrapper
+
+
+def notion_method(func):
+    """Notion SDK 方法的標籤名稱，例如 pages.create、databases.query"""
+    label = getattr(func, "notion_method", None)
+    if label:
+        return label
+    endpoint = type(getattr(func, "__self__", None)).__name__.replace("Endpoint", "").lower()
+    return f"{endpoint}.{func.__name__}" if endpoint != "nonetype" else func.__name__
+
+
+def line_endpoint(url):
+    """LINE API 網址轉為標籤用的路徑，例如 https://api.line.me/v2/bot/message/reply -> /v2/bot/message/reply"""
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    return _ID_SEGMENT.sub("/{id}", path.split("?", 1)[0])
+
+
+def watch_user_states(store):
+    """在每次抓取 /metrics 時回報 store 內的狀態數量"""
+    USER_STATES.set_function(lambda: len(store))
+
+
+def render():
+    """返回 (內容, Content-Type)，供 /metrics 路由使用"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,16 +1,86 @@
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from notion_client import Client
+import httpx
 from dotenv import load_dotenv
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from event_mirror import EventMirror
+from metrics import NOTION_CALL_SECONDS, notion_method
+from http_pool import get_notion_client
+from notion_schema import EventExtractor
+from query_cache import QueryCache
+from rate_limit import get_notion_limiter
+from tracing import bind, span, traced
 
 # 載入環境變數
 load_dotenv()
 
+
+class NotionQueryError(Exception):
+    """查詢 Notion 途中失敗、結果不完整，訊息可直接回覆給使用者"""
+
+    def __init__(self, message="查詢 Notion 活動時發生錯誤，請稍後再試"):
+        super().__init__(message)
+
+
 class NotionManager:
-    def __init__(self):
-        self.notion = Client(auth=os.getenv("NOTION_TOKEN"))
+    def __init__(self, notion_client=None):
+        # 預設使用整個行程共用的連線池
+        self.notion = notion_client or get_notion_client()
         self.database_id = os.getenv("NOTION_DATABASE_ID")
+        # 每次 databases.query 取回的筆數，Notion 上限為 100
+        self.page_size = int(os.getenv("NOTION_PAGE_SIZE", "100"))
+        
+        # 批次寫入時同時進行的請求數
+        self.max_workers = int(os.getenv("NOTION_MAX_WORKERS", "3"))
+        # 最近一次批次更新 / 批次新增的統計 (數量、成功、失敗、耗時)
+        self.last_bulk_update = None
+        self.last_bulk_add = None
+        
+        # 遇到 429 / 5xx / 逾時時的重試設定
+        self.max_retries = int(os.getenv("NOTION_MAX_RETRIES", "4"))
+        self.backoff_base = float(os.getenv("NOTION_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("NOTION_BACKOFF_MAX", "30"))
+        # API 呼叫統計：呼叫次數、被限流器延後、收到 429、重試、最終失敗
+        self.call_stats = {"calls": 0, "throttled": 0, "rate_limited": 0, "retried": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        
+        # Notion 持續出錯或回應過慢時暫停呼叫，讀取改由本地鏡像回答
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("NOTION_BREAKER_FAILURES", "5")),
+            slow_call_seconds=float(os.getenv("NOTION_BREAKER_SLOW_SECONDS", "10")),
+            reset_timeout=float(os.getenv("NOTION_BREAKER_RESET_SECONDS", "30"))
+        )
+        
+        # 活動新增或同步時通知的函數 (例如精準提醒排程)，參數為活動資料列表
+        self._listeners = []
+        
+        # 直接查詢 Notion 的結果快取，新增或更新活動時只清除包含該活動的時間窗口
+        self.query_cache = QueryCache(
+            ttl=float(os.getenv("NOTION_QUERY_CACHE_TTL", "60")),
+            max_entries=int(os.getenv("NOTION_QUERY_CACHE_SIZE", "128"))
+        )
+        
+        # 依資料庫結構編譯的頁面解析器；取得結構後查詢只要求活動用到的屬性
+        self.project_properties = os.getenv("NOTION_PROJECT_PROPERTIES", "true").lower() == "true"
+        self.extractor = EventExtractor()
+        self._schema_loaded = False
+        self._schema_retry_at = 0
+        self._schema_lock = threading.Lock()
+        
+        # 本地鏡像（未設定 NOTION_MIRROR_PATH 時停用）
+        mirror_path = os.getenv("NOTION_MIRROR_PATH", "")
+        self.mirror = EventMirror(mirror_path) if mirror_path else None
+        # 鏡像超過此秒數未同步即視為過期，改為直接查詢 Notion
+        self.mirror_max_staleness = int(os.getenv("NOTION_MIRROR_MAX_STALENESS", "300"))
+        # 每隔多少小時做一次全量同步，用於清除已在 Notion 刪除的活動
+        self.mirror_full_sync_hours = float(os.getenv("NOTION_MIRROR_FULL_SYNC_HOURS", "6"))
     
+    @traced("NotionManager.add_event")
     def add_event(self, event_name, event_time, category, importance="中", notes=""):
         """
         將新活動添加到 Notion 資料庫
@@ -34,7 +104,8 @@ class NotionManager:
             formatted_time = event_time.isoformat()
             
             # 創建新的資料庫項目
-            response = self.notion.pages.create(
+            response = self._call(
+                self.notion.pages.create,
                 parent={"database_id": self.database_id},
                 properties={
                     "活動名稱": {
@@ -77,11 +148,55 @@ class NotionManager:
                     }
                 }
             )
+            self._write_through(response)
+            self._invalidate_cached(response)
+            self._notify([self._parse_event(response)])
             return response
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"添加活動時出錯: {e}")
             return None
     
+    @traced("NotionManager.add_events")
+    def add_events(self, events):
+        """
+        以有上限的工作池並行新增多個活動，並遵守 Notion 的速率限制
+        
+        參數:
+        events (list): 每個元素為 add_event 的參數 dict (event_name, event_time, category, importance, notes)
+        
+        返回:
+        list: 與 events 順序相同的新建活動資料，失敗的活動為 None
+        """
+        events = list(events)
+        if not events:
+            return []
+        
+        started = time.perf_counter()
+        
+        # 每個請求都會經過 _call 中共用的限流器；斷路器開啟時其餘活動直接視為失敗
+        def add(fields):
+            try:
+                return self.add_event(**fields)
+            except CircuitOpenError:
+                return None
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(events)))) as pool:
+            results = list(pool.map(bind(add), events))
+        
+        elapsed = time.perf_counter() - started
+        succeeded = sum(result is not None for result in results)
+        self.last_bulk_add = {
+            "count": len(events),
+            "succeeded": succeeded,
+            "failed": len(events) - succeeded,
+            "elapsed": elapsed
+        }
+        print(f"批次新增活動：{succeeded}/{len(events)} 成功，耗時 {elapsed:.2f} 秒")
+        return results
+    
+    @traced("NotionManager.query_events")
     def query_events(self, start_date, end_date=None, reminder_status=None):
         """
         查詢指定時間範圍內的活動
@@ -92,8 +207,30 @@ class NotionManager:
         reminder_status (str, optional): 提醒狀態過濾 ("已提醒"/"未提醒")
         
         返回:
-        list: 活動列表
+        list: 活動列表；查詢失敗時拋出 CircuitOpenError 或 NotionQueryError
+        """
+        return list(self.iter_events(start_date, end_date, reminder_status))
+    
+    @traced("NotionManager.iter_events")
+    def iter_events(self, start_date, end_date=None, reminder_status=None, page_size=None):
+        """
+        以游標分頁逐頁查詢指定時間範圍內的活動，每收到一頁就產出該頁的活動
+        
+        參數:
+        start_date (datetime): 開始日期
+        end_date (datetime, optional): 結束日期，如果未提供則使用開始日期
+        reminder_status (str, optional): 提醒狀態過濾 ("已提醒"/"未提醒")
+        page_size (int, optional): 每頁筆數 (1-100)，未提供則使用 NOTION_PAGE_SIZE
+        
+        產出:
+        dict: 活動資料
+        
+        Notion 斷路器開啟時改由本地鏡像回答 (不論是否過期)；
+        沒有鏡像可用時拋出 CircuitOpenError。
+        其他查詢錯誤在尚未產出活動時同樣改用鏡像，否則拋出 NotionQueryError，
+        讓呼叫端知道結果不完整
         """
+        yielded = False
         try:
             # 如果未提供結束日期，則使用開始日期
             if end_date is None:
@@ -106,6 +243,24 @@ class NotionManager:
             if end_date.tzinfo is None:
                 end_date = end_date.replace(tzinfo=timezone.utc)
             
+            # 鏡像在有效期限內時直接從本地回答
+            if self.mirror and self.mirror.is_fresh(self.mirror_max_staleness):
+                yield from self.mirror.query(start_date, end_date, reminder_status)
+                return
+            
+            # 相同時間窗口在 NOTION_QUERY_CACHE_TTL 秒內重複查詢時直接使用快取
+            cache_key = self.query_cache.key(start_date, end_date, reminder_status)
+            cached = self.query_cache.get(cache_key) if self.query_cache.enabled else None
+            if cached is not None:
+                yield from cached
+                return
+            
+            # Notion 暫時無法使用時，寧可回答稍舊的鏡像資料
+            if self.breaker.is_open and self._mirror_available():
+                print("Notion 斷路器開啟，改用本地鏡像查詢")
+                yield from self.mirror.query(start_date, end_date, reminder_status)
+                return
+            
             # 格式化日期為 ISO 8601 格式
             start_formatted = start_date.isoformat()
             end_formatted = end_date.isoformat()
@@ -135,9 +290,7 @@ class NotionManager:
                     }
                 })
             
-            # 查詢資料庫
-            response = self.notion.databases.query(
-                database_id=self.database_id,
+            pages = self._iter_pages(
                 filter={
                     "and": filter_conditions
                 },
@@ -146,30 +299,34 @@ class NotionManager:
                         "property": "日期時間",
                         "direction": "ascending"
                     }
-                ]
+                ],
+                page_size=page_size
             )
-            
-            # 處理結果
-            events = []
-            for page in response["results"]:
-                properties = page["properties"]
-                event = {
-                    "id": page["id"],
-                    "name": self._get_title_property(properties["活動名稱"]),
-                    "time": self._get_date_property(properties["日期時間"]),
-                    "category": self._get_select_property(properties["分類"]),
-                    "importance": self._get_select_property(properties["重要性"]),
-                    "notes": self._get_text_property(properties["備註"]),
-                    "reminder_status": self._get_select_property(properties["提醒狀態"])
-                }
-                events.append(event)
-            
-            return events
+            # 完整迭代後才寫入快取；查詢期間若有活動異動則放棄寫入
+            cache_version = self.query_cache.version
+            results = []
+            for page in pages:
+                event = self._parse_event(page)
+                results.append(event)
+                yield event
+                yielded = True
+            self.query_cache.put(cache_key, results, cache_version)
         
+        except CircuitOpenError:
+            # 查詢途中斷路器才開啟：尚未產出任何活動時改用鏡像，否則讓呼叫端回覆錯誤
+            if yielded or not self._mirror_available():
+                raise
+            print("Notion 斷路器開啟，改用本地鏡像查詢")
+            yield from self.mirror.query(start_date, end_date, reminder_status)
         except Exception as e:
             print(f"查詢活動時出錯: {e}")
-            return []
+            # 與斷路器相同：尚未產出任何活動時改用鏡像；否則結果已不完整，不能當作查詢結束
+            if yielded or not self._mirror_available():
+                raise NotionQueryError() from e
+            print("Notion 查詢失敗，改用本地鏡像查詢")
+            yield from self.mirror.query(start_date, end_date, reminder_status)
     
+    @traced("NotionManager.get_upcoming_events")
     def get_upcoming_events(self, days=3):
         """
         獲取即將到來的活動（未來幾天內）
@@ -178,60 +335,15 @@ class NotionManager:
         days (int): 未來幾天
         
         返回:
-        list: 活動列表
+        list: 尚未提醒的活動列表；與 query_events 相同，查詢失敗時拋出 CircuitOpenError 或 NotionQueryError，
+        不會以空列表代表查詢失敗
         """
-        try:
-            # 使用帶時區的日期時間
-            today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = today + timedelta(days=days)
-            
-            # 查詢資料庫
-            response = self.notion.databases.query(
-                database_id=self.database_id,
-                filter={
-                    "and": [
-                        {
-                            "property": "日期時間",
-                            "date": {
-                                "on_or_after": today.isoformat()
-                            }
-                        },
-                        {
-                            "property": "日期時間",
-                            "date": {
-                                "on_or_before": end_date.isoformat()
-                            }
-                        },
-                        {
-                            "property": "提醒狀態",
-                            "select": {
-                                "equals": "未提醒"
-                            }
-                        }
-                    ]
-                }
-            )
-            
-            # 處理結果
-            events = []
-            for page in response["results"]:
-                properties = page["properties"]
-                event = {
-                    "id": page["id"],
-                    "name": self._get_title_property(properties["活動名稱"]),
-                    "time": self._get_date_property(properties["日期時間"]),
-                    "category": self._get_select_property(properties["分類"]),
-                    "importance": self._get_select_property(properties["重要性"]),
-                    "notes": self._get_text_property(properties["備註"])
-                }
-                events.append(event)
-            
-            return events
-        
-        except Exception as e:
-            print(f"獲取即將到來的活動時出錯: {e}")
-            return []
+        # 使用帶時區的日期時間
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = today + timedelta(days=days)
+        return self.query_events(today, end_date, reminder_status="未提醒")
     
+    @traced("NotionManager.update_reminder_status")
     def update_reminder_status(self, page_id, status="已提醒"):
         """
         更新活動的提醒狀態
@@ -244,7 +356,8 @@ class NotionManager:
         dict: 更新後的頁面資料
         """
         try:
-            response = self.notion.pages.update(
+            response = self._call(
+                self.notion.pages.update,
                 page_id=page_id,
                 properties={
                     "提醒狀態": {
@@ -254,32 +367,317 @@ class NotionManager:
                     }
                 }
             )
+            self._write_through(response)
+            self._invalidate_cached(response)
             return response
         except Exception as e:
             print(f"更新提醒狀態時出錯: {e}")
             return None
     
-    # 輔助方法，用於從屬性中提取值
-    def _get_title_property(self, property_value):
-        """從標題屬性中提取值"""
-        if property_value["title"]:
-            return property_value["title"][0]["text"]["content"]
-        return ""
+    @traced("NotionManager.update_reminder_statuses")
+    def update_reminder_statuses(self, page_ids, status="已提醒"):
+        """
+        以有上限的工作池並行更新多個活動的提醒狀態，並遵守 Notion 的速率限制
+        
+        參數:
+        page_ids (iterable): 頁面 ID
+        status (str): 新的提醒狀態
+        
+        返回:
+        dict: 頁面 ID 對應是否更新成功
+        """
+        page_ids = list(dict.fromkeys(page_ids))
+        if not page_ids:
+            return {}
+        
+        started = time.perf_counter()
+        
+        # 每個請求都會經過 _call 中共用的限流器
+        def update(page_id):
+            return self.update_reminder_status(page_id, status) is not None
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(page_ids)))) as pool:
+            results = dict(zip(page_ids, pool.map(bind(update), page_ids)))
+        
+        elapsed = time.perf_counter() - started
+        succeeded = sum(results.values())
+        self.last_bulk_update = {
+            "count": len(page_ids),
+            "succeeded": succeeded,
+            "failed": len(page_ids) - succeeded,
+            "elapsed": elapsed
+        }
+        print(f"批次更新提醒狀態：{succeeded}/{len(page_ids)} 成功，耗時 {elapsed:.2f} 秒")
+        return results
+    
+    @traced("NotionManager.sync_mirror")
+    def sync_mirror(self, full=False):
+        """
+        將 Notion 中的變更同步到本地鏡像
+        
+        平時只查詢 last_edited_time 晚於上次同步的頁面；
+        第一次同步或超過 NOTION_MIRROR_FULL_SYNC_HOURS 時做全量同步，並清除已刪除的活動
+        
+        參數:
+        full (bool): 是否強制全量同步
+        
+        返回:
+        int: 本次同步寫入的活動數量，鏡像停用或同步失敗時為 None
+        """
+        if not self.mirror:
+            return None
+        
+        try:
+            started_at = time.time()
+            cursor = self.mirror.get_meta("last_edited_cursor")
+            last_full_sync = float(self.mirror.get_meta("last_full_sync_at", "0"))
+            if cursor is None or started_at - last_full_sync >= self.mirror_full_sync_hours * 3600:
+                full = True
+            
+            query = {}
+            generation = None
+            if full:
+                generation = self.mirror.begin_full_sync()
+            else:
+                # Notion 的 last_edited_time 精確到分鐘，使用 on_or_after 避免漏掉同一分鐘內的修改
+                query["filter"] = {
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {
+                        "on_or_after": cursor
+                    }
+                }
+            
+            batch = []
+            edited_times = {}
+            synced = 0
+            latest_edit = cursor
+            for page in self._iter_pages(**query):
+                event = self._parse_event(page)
+                batch.append(event)
+                edited_times[event["id"]] = page.get("last_edited_time")
+                if page.get("last_edited_time") and (latest_edit is None or page["last_edited_time"] > latest_edit):
+                    latest_edit = page["last_edited_time"]
+                
+                # 每收到一頁就寫入，避免全量同步時佔用大量記憶體
+                if len(batch) >= self.page_size:
+                    self.mirror.upsert(batch, edited_times, generation)
+                    self._invalidate_events(batch)
+                    self._notify(batch)
+                    synced += len(batch)
+                    batch, edited_times = [], {}
+            
+            self.mirror.upsert(batch, edited_times, generation)
+            self._invalidate_events(batch)
+            self._notify(batch)
+            synced += len(batch)
+            
+            if full:
+                removed = self.mirror.prune(generation)
+                if removed:
+                    self.query_cache.clear()
+                self.mirror.set_meta("generation", generation)
+                self.mirror.set_meta("last_full_sync_at", started_at)
+                print(f"鏡像全量同步完成：{synced} 個活動，移除 {removed} 個")
+            elif synced:
+                print(f"鏡像增量同步完成：{synced} 個活動")
+            
+            if latest_edit:
+                self.mirror.set_meta("last_edited_cursor", latest_edit)
+            self.mirror.set_meta("last_synced_at", started_at)
+            return synced
+        
+        except Exception as e:
+            print(f"同步鏡像時出錯: {e}")
+            return None
+    
+    def add_listener(self, listener):
+        """註冊在活動新增或同步時被呼叫的函數，參數為活動資料列表"""
+        self._listeners.append(listener)
+    
+    def _notify(self, events):
+        if not events:
+            return
+        for listener in self._listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                print(f"通知活動變更時出錯: {e}")
+    
+    def _write_through(self, page):
+        """將剛寫入 Notion 的頁面同步更新到本地鏡像"""
+        if not self.mirror or not page:
+            return
+        try:
+            self.mirror.upsert([self._parse_event(page)], {page["id"]: page.get("last_edited_time")})
+        except Exception as e:
+            print(f"更新鏡像時出錯: {e}")
+    
+    def _invalidate_cached(self, page):
+        """清除包含剛寫入 Notion 的頁面的查詢快取"""
+        if page:
+            self._invalidate_events([self._parse_event(page)])
     
-    def _get_date_property(self, property_value):
-        """從日期屬性中提取值"""
-        if property_value["date"]:
-            return property_value["date"]["start"]
+    def _invalidate_events(self, events):
+        for event in events:
+            self.query_cache.invalidate(event.start_ts, event.id)
+    
+    def _mirror_available(self):
+        """鏡像是否至少完成過一次同步"""
+        return bool(self.mirror) and self.mirror.last_synced_at is not None
+    
+    def stats(self):
+        """Notion API 呼叫統計"""
+        with self._stats_lock:
+            stats = dict(self.call_stats)
+        stats["breaker"] = self.breaker.stats()
+        stats["query_cache"] = self.query_cache.stats()
+        return stats
+    
+    def _call(self, func, **kwargs):
+        """
+        經過共用限流器呼叫 Notion API，遇到 429、5xx 或逾時時自動重試
+        
+        429 回應優先依照 Retry-After 等待，其他情況使用帶隨機抖動的指數退避；
+        每次呼叫前先經過斷路器，開啟時直接拋出 CircuitOpenError 而不等待逾時
+        """
+        limiter = get_notion_limiter()
+        method = notion_method(func)
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            waited = limiter.acquire()
+            self._count("calls", throttled=waited > 0)
+            started = time.monotonic()
+            try:
+                with span(f"notion {method}", **{"notion.attempt": attempt, "notion.throttled_seconds": waited}):
+                    response = func(**kwargs)
+            except Exception as e:
+                NOTION_CALL_SECONDS.labels(method=method, status=self._status_label(e)).observe(time.monotonic() - started)
+                if self._is_outage(e):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_probe()
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+                attempt += 1
+                self._count("retried")
+                print(f"Notion API 呼叫失敗 ({e})，{delay:.1f} 秒後第 {attempt} 次重試")
+                time.sleep(delay)
+            else:
+                elapsed = time.monotonic() - started
+                NOTION_CALL_SECONDS.labels(method=method, status="200").observe(elapsed)
+                self.breaker.record_success(elapsed)
+                return response
+    
+    @staticmethod
+    def _status_label(error):
+        """失敗呼叫在指標中的狀態標籤：HTTP 狀態碼或例外類別"""
+        if isinstance(error, HTTPResponseError):
+            return str(error.status)
+        if isinstance(error, (RequestTimeoutError, httpx.TimeoutException)):
+            return "timeout"
+        return type(error).__name__
+    
+    @staticmethod
+    def _is_outage(error):
+        """5xx 與逾時、連線錯誤才計入斷路器；429 與 4xx 代表 Notion 仍正常運作"""
+        if isinstance(error, HTTPResponseError):
+            return error.status >= 500
+        return isinstance(error, (RequestTimeoutError, httpx.TimeoutException, httpx.TransportError))
+    
+    def _retry_delay(self, error, attempt):
+        """返回重試前要等待的秒數，不應重試時返回 None"""
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        
+        if isinstance(error, HTTPResponseError):
+            if error.status == 429:
+                self._count("rate_limited")
+                retry_after = error.headers.get("Retry-After") if error.headers else None
+                try:
+                    return float(retry_after) + random.uniform(0, self.backoff_base)
+                except (TypeError, ValueError):
+                    return backoff
+            if error.status in (500, 502, 503, 504):
+                return backoff
+            return None
+        
+        if isinstance(error, (RequestTimeoutError, httpx.TimeoutException, httpx.TransportError)):
+            return backoff
         return None
     
-    def _get_select_property(self, property_value):
-        """從選擇屬性中提取值"""
-        if property_value["select"]:
-            return property_value["select"]["name"]
-        return ""
+    def _count(self, key, throttled=False):
+        with self._stats_lock:
+            self.call_stats[key] += 1
+            if throttled:
+                self.call_stats["throttled"] += 1
+    
+    def _iter_pages(self, page_size=None, **query):
+        """
+        依照 has_more / next_cursor 逐頁查詢資料庫，逐一產出原始頁面物件
+        
+        已取得資料庫結構時以 filter_properties 只要求活動用到的屬性，減少回應大小與解析時間
+        
+        參數:
+        page_size (int, optional): 每頁筆數 (1-100)，未提供則使用 NOTION_PAGE_SIZE
+        query: 傳給 databases.query 的其他參數 (filter, sorts...)
+        """
+        query["page_size"] = min(max(int(page_size or self.page_size), 1), 100)
+        extractor = self._get_extractor()
+        
+        while True:
+            response = self._call(
+                self._query_database,
+                filter_properties=extractor.property_ids,
+                **query
+            )
+            for page in response["results"]:
+                yield page
+            
+            if not response.get("has_more") or not response.get("next_cursor"):
+                break
+            query["start_cursor"] = response["next_cursor"]
+    
+    def _query_database(self, filter_properties=None, **body):
+        """
+        databases.query 的直接請求版本
+        
+        notion-client 2.0.0 的 databases.query 不會傳遞 filter_properties 查詢參數，
+        因此改用 Client.request 並自行帶上
+        """
+        return self.notion.request(
+            path=f"databases/{self.database_id}/query",
+            method="POST",
+            query={"filter_properties": filter_properties} if filter_properties else None,
+            body=body
+        )
+    
+    # 在指標與追蹤中仍以 databases.query 標示
+    _query_database.notion_method = "databases.query"
+    
+    def _get_extractor(self):
+        """
+        返回頁面解析器；第一次呼叫時讀取資料庫結構並編譯
+        
+        讀取失敗時沿用預設解析器 (不做屬性投影)，NOTION_SCHEMA_RETRY_SECONDS 秒後再試
+        """
+        if self._schema_loaded or not self.project_properties or time.monotonic() < self._schema_retry_at:
+            return self.extractor
+        with self._schema_lock:
+            if self._schema_loaded or time.monotonic() < self._schema_retry_at:
+                return self.extractor
+            try:
+                database = self._call(self.notion.databases.retrieve, database_id=self.database_id)
+                self.extractor = EventExtractor(database["properties"])
+                self._schema_loaded = True
+            except CircuitOpenError:
+                self._schema_retry_at = time.monotonic() + self.breaker.reset_timeout
+            except Exception as e:
+                print(f"讀取 Notion 資料庫結構時出錯，暫不使用屬性投影: {e}")
+                self._schema_retry_at = time.monotonic() + float(os.getenv("NOTION_SCHEMA_RETRY_SECONDS", "300"))
+        return self.extractor
     
-    def _get_text_property(self, property_value):
-        """從文本屬性中提取值"""
-        if property_value["rich_text"]:
-            return property_value["rich_text"][0]["text"]["content"]
-        return "" 
\ No newline at end of file
+    def _parse_event(self, page):
+        """將 Notion 頁面轉換為活動資料 (時間只在這裡解析一次)"""
+        return self.extractor.extract(page) 
\ No newline at end of file
@@ -0,0 +1,81 @@
+from event_model import Event
+
+# 活動欄位對應的 Notion 屬性名稱，以及資料庫結構未知時假設的屬性類型
+EVENT_PROPERTIES = (
+    ("name", "活動名稱", "title"),
+    ("time", "日期時間", "date"),
+    ("category", "分類", "select"),
+    ("importance", "重要性", "select"),
+    ("notes", "備註", "rich_text"),
+    ("reminder_status", "提醒狀態", "select"),
+)
+
+
+def _get_rich_text(value):
+    """從標題或文本屬性的 rich text 陣列中提取第一段文字"""
+    if value:
+        return value[0]["text"]["content"]
+    return ""
+
+
+def _get_date(value):
+    """從日期屬性中提取開始時間"""
+    if value:
+        return value["start"]
+    return None
+
+
+def _get_select(value):
+    """從選擇 (或狀態) 屬性中提取選項名稱"""
+    if value:
+        return value["name"]
+    return ""
+
+
+# 依屬性類型選擇提取函數
+_GETTERS = {
+    "title": _get_rich_text,
+    "rich_text": _get_rich_text,
+    "date": _get_date,
+    "select": _get_select,
+    "status": _get_select,
+}
+
+
+class EventExtractor:
+    """
+    依資料庫結構預先編譯的頁面解析器
+
+    建立時就決定每個欄位要讀取的屬性名稱、屬性類型與提取函數，
+    解析頁面時只需依序查表，不必逐欄判斷。
+    取得資料庫結構後 property_ids 提供 filter_properties 使用的屬性 ID，
+    讓 Notion 只回傳這六個屬性
+    """
+
+    __slots__ = ("_fields", "property_ids")
+
+    def __init__(self, schema=None):
+        """
+        參數:
+        schema (dict, optional): databases.retrieve 返回的 properties；未提供時依 EVENT_PROPERTIES 假設屬性類型
+        """
+        fields = []
+        property_ids = []
+        for field, name, default_type in EVENT_PROPERTIES:
+            prop = (schema or {}).get(name)
+            if schema is not None and prop is None:
+                raise KeyError(f"Notion 資料庫缺少屬性：{name}")
+            prop_type = prop["type"] if prop else default_type
+            if prop_type not in _GETTERS:
+                raise ValueError(f"不支援的屬性類型：{name} ({prop_type})")
+            fields.append((name, prop_type, _GETTERS[prop_type]))
+            if prop:
+                property_ids.append(prop["id"])
+        self._fields = tuple(fields)
+        self.property_ids = property_ids or None
+
+    def extract(self, page):
+        """將 Notion 頁面轉換為 Event"""
+        properties = page["properties"]
+        values = [getter(properties[name][prop_type]) for name, prop_type, getter in self._fields]
+        return Event(page["id"], *values)
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    活動查詢結果的 TTL + LRU 快取
+
+    以 (開始時間, 結束時間, 提醒狀態) 為鍵，時間先正規化為 UTC epoch 秒，
+    因此同一個時間窗口不論以哪個時區表示都會命中同一筆。
+    活動被新增或修改時，只清除時間窗口包含該活動 (或結果中含有該活動) 的項目
+    """
+
+    def __init__(self, ttl=60, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # 鍵 -> (過期時間, Event tuple, 活動 ID 集合)
+        self._version = 0              # 每次失效時遞增，用來捨棄查詢期間已過時的結果
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidated": 0}
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def key(start_date, end_date, reminder_status=None):
+        return (start_date.timestamp(), end_date.timestamp(), reminder_status or None)
+
+    @property
+    def version(self):
+        with self._lock:
+            return self._version
+
+    def get(self, key):
+        """返回快取的活動列表，未命中時返回 None；Event 建立後不再修改，因此不需複製"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            events = entry[1]
+        return list(events)
+
+    def put(self, key, events, version):
+        """
+        寫入查詢結果
+
+        version 為開始查詢前取得的 self.version；查詢期間若有活動異動則不寫入
+        """
+        if not self.enabled:
+            return
+        events = tuple(events)
+        ids = frozenset(event.id for event in events)
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, events, ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, timestamp=None, event_id=None):
+        """
+        清除時間窗口包含 timestamp，或結果中含有 event_id 的項目
+
+        返回:
+        int: 清除的項目數
+        """
+        with self._lock:
+            self._version += 1
+            stale = [
+                key for key, (_, _, ids) in self._entries.items()
+                if (timestamp is not None and key[0] <= timestamp <= key[1]) or event_id in ids
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidated"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
@@ -0,0 +1,201 @@
+import json
+from datetime import datetime, timezone
+from itertools import groupby
+
+from linebot.v3.messaging import FlexContainer, FlexMessage
+
+from flex_templates import build_day_bubble
+
+# LINE 文字訊息最多 5000 字，一次回覆最多 5 則訊息
+TEXT_LIMIT = 5000
+MAX_MESSAGES = 5
+MORE_HINT = "還有更多活動，請點選「下一頁」繼續查看"
+# LINE carousel 最多 12 張 bubble，JSON 最大 50KB
+MAX_BUBBLES = 12
+CAROUSEL_MAX_BYTES = 50000
+# 標題的「的活動（第 1234-5678 項）：」部分預留的長度
+HEADER_RESERVE = 40
+
+
+def format_range(start_date, end_date):
+    """查詢結果標題的日期範圍，例如「📅 2025/01/01 到 2025/12/31 」"""
+    title = f"📅 {start_date.strftime('%Y/%m/%d')} "
+    if end_date.date() != start_date.date():
+        title += f"到 {end_date.strftime('%Y/%m/%d')} "
+    return title
+
+
+def format_event(event):
+    """單一活動的簡潔格式 (含結尾空行)"""
+    parts = [
+        f"{event.name}     {event.start.strftime('%Y/%m/%d %H:%M')} ({event.importance_name})\n",
+        f"[{event.category}]"
+    ]
+    if event.notes:
+        parts.append(f" {event.notes}")
+    parts.append("\n\n")
+    return "".join(parts)
+
+
+def render_query_results(events, title, cursor=None, offset=0, limit=TEXT_LIMIT, max_messages=MAX_MESSAGES):
+    """
+    將活動逐筆排入長度受限的訊息
+
+    參數:
+    events (iterable): 依時間排序的 Event (例如 NotionManager.iter_events 的生成器)
+    title (str): format_range 產生的標題開頭
+    cursor (tuple, optional): 上一頁返回的游標 (時間戳, 該時間已顯示的活動數)，用來略過已顯示的活動
+    offset (int): 前面頁面已顯示的活動數，用於標示項次
+    limit (int): 每則訊息的長度上限
+    max_messages (int): 訊息數上限
+
+    返回:
+    tuple: (訊息文字列表, 本頁活動數, 下一頁游標或 None)
+
+    events 只會讀到排不下的第一筆為止，之後的 Notion 分頁不會被查詢。
+    同一時間的活動以 ID 排序後才計算游標，Notion 與本地鏡像回傳的先後不同也不會跨頁重複或遺漏
+    """
+    chunks = [[]]
+    sizes = [len(title) + HEADER_RESERVE]
+    count = 0
+    next_cursor = None
+    # 游標時間與該時間已顯示的活動數 (同一時間的活動可能跨頁)
+    last_ts, same_time = cursor if cursor else (None, 0)
+    pending_skip = same_time
+    # 單一活動過長 (例如很長的備註) 時截斷，確保任何一則訊息都放得下
+    max_block = limit - len(title) - HEADER_RESERVE - len(MORE_HINT) - 2
+
+    for event in _tie_ordered(events):
+        event_ts = int(event.start_ts)
+        if pending_skip and event_ts == last_ts:
+            pending_skip -= 1
+            continue
+        pending_skip = 0
+
+        # 最後一則訊息需保留「下一頁」提示的空間
+        reserve = len(MORE_HINT) + 2 if len(chunks) == max_messages else 0
+        block = format_event(event)[:max_block]
+        if sizes[-1] + len(block) > limit - reserve:
+            if len(chunks) == max_messages:
+                next_cursor = (event_ts, same_time if event_ts == last_ts else 0)
+                break
+            chunks.append([])
+            sizes.append(0)
+        chunks[-1].append(block)
+        sizes[-1] += len(block)
+        count += 1
+
+        if event_ts == last_ts:
+            same_time += 1
+        else:
+            last_ts, same_time = event_ts, 1
+
+    if not count:
+        return [title + ("沒有更多活動" if offset else "沒有找到任何活動")], 0, None
+
+    if next_cursor is None and not offset:
+        header = f"{title}的活動（共 {count} 項）：\n\n"
+    else:
+        header = f"{title}的活動（第 {offset + 1}-{offset + count} 項）：\n\n"
+    messages = ["".join(blocks).rstrip() for blocks in chunks]
+    messages[0] = header + messages[0]
+    if next_cursor:
+        messages[-1] += "\n\n" + MORE_HINT
+    return messages, count, next_cursor
+
+
+def _tie_ordered(events):
+    """
+    將依時間排序的活動中同一時間 (秒) 的活動改為依 ID 排序
+
+    Notion 只依「日期時間」排序，同一時間的活動每次查詢的先後不一定相同；
+    游標以「該時間已顯示的活動數」略過活動，因此需要固定的順序 (與 EventIndex 相同以 ID 排序)
+    """
+    for _, same_time in groupby(events, key=lambda event: int(event.start_ts)):
+        yield from sorted(same_time, key=lambda event: event.id)
+
+
+def make_page_data(start_date, end_date, cursor, offset):
+    """「下一頁」postback 的 data (LINE 限制 300 字)"""
+    after, skip = cursor
+    return (
+        f"action=query_page&from={start_date.strftime('%Y%m%d')}&to={end_date.strftime('%Y%m%d')}"
+        f"&after={after}&skip={skip}&offset={offset}"
+    )
+
+
+def parse_page_data(params):
+    """
+    解析「下一頁」postback 的參數
+
+    返回:
+    tuple: (開始日期, 結束日期, 游標, 已顯示的活動數)，格式不正確時拋出 ValueError
+    """
+    try:
+        start_date = datetime.strptime(params["from"], "%Y%m%d").replace(tzinfo=timezone.utc)
+        end_date = datetime.strptime(params["to"], "%Y%m%d").replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+        cursor = (int(params["after"]), int(params.get("skip", 0)))
+    except KeyError as e:
+        raise ValueError(f"缺少參數: {e}")
+    return start_date, end_date, cursor, int(params.get("offset", 0))
+
+
+def render_day_carousel(events, title, max_bubbles=MAX_BUBBLES):
+    """
+    將活動依日期 (UTC) 分組，每天一張卡片組成 carousel
+
+    參數:
+    events (iterable): 依時間排序的 Event (例如 NotionManager.iter_events 的生成器)
+    title (str): format_range 產生的標題開頭，作為通知的替代文字
+
+    返回:
+    tuple: (FlexMessage 或 None (沒有活動), 下一張卡片的日期或 None)
+
+    卡片逐天建立；讀到第 max_bubbles + 1 天的第一筆活動 (或卡片總大小將超過 50KB) 就停止，
+    之後的日期不會建立卡片，也不會查詢之後的 Notion 分頁
+    """
+    bubbles = []
+    size = 0
+    next_day = None
+    dated = (event for event in events if event.day is not None)
+    for day, day_events in groupby(dated, key=lambda event: event.day):
+        if len(bubbles) == max_bubbles:
+            next_day = day
+            break
+        bubble = build_day_bubble(day, day_events)
+        bubble_size = len(json.dumps(bubble, ensure_ascii=False).encode("utf-8"))
+        if bubbles and size + bubble_size > CAROUSEL_MAX_BYTES:
+            # 超過 carousel 大小上限，這一天留到「更多」再顯示
+            next_day = day
+            break
+        bubbles.append(bubble)
+        size += bubble_size
+
+    if not bubbles:
+        return None, None
+    message = FlexMessage(
+        alt_text=f"{title}的活動",
+        contents=FlexContainer.from_dict({"type": "carousel", "contents": bubbles})
+    )
+    return message, next_day
+
+
+def make_cards_data(start_date, end_date):
+    """「卡片檢視」與「更多」postback 的 data"""
+    return f"action=query_cards&from={start_date.strftime('%Y%m%d')}&to={end_date.strftime('%Y%m%d')}"
+
+
+def parse_cards_data(params):
+    """
+    解析「卡片檢視」與「更多」postback 的參數
+
+    返回:
+    tuple: (開始日期, 結束日期)，格式不正確時拋出 ValueError
+    """
+    try:
+        start_date = datetime.strptime(params["from"], "%Y%m%d").replace(tzinfo=timezone.utc)
+        end_date = datetime.strptime(params["to"], "%Y%m%d").replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+    except KeyError as e:
+        raise ValueError(f"缺少參數: {e}")
+    return start_date, end_date
+
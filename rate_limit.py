@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    執行緒安全的權杖桶限流器
+
+    每秒補充 rate 個權杖，最多累積 capacity 個；acquire() 在權杖不足時等待
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        取得權杖，不足時等待
+
+        返回:
+        float: 等待的秒數
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_notion_limiter = None
+_notion_limiter_lock = threading.Lock()
+
+
+def get_notion_limiter():
+    """
+    整個行程共用的 Notion 限流器
+
+    NOTION_RATE_LIMIT: 每秒請求數 (Notion 建議平均約 3 次/秒)
+    NOTION_RATE_BURST: 可累積的突發請求數
+    """
+    global _notion_limiter
+    with _notion_limiter_lock:
+        if _notion_limiter is None:
+            rate = float(os.getenv("NOTION_RATE_LIMIT", "3"))
+            burst = float(os.getenv("NOTION_RATE_BURST", str(rate)))
+            _notion_limiter = TokenBucket(rate, burst)
+        return _notion_limiter
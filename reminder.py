@@ -1,158 +1,337 @@
 import os
+import threading
 from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from notion_manager import NotionManager
-from linebot.v3.messaging import MessagingApi, ApiClient, Configuration, TextMessage, PushMessageRequest
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from notion_manager import NotionManager, NotionQueryError
+from circuit_breaker import CircuitOpenError
+from event_model import Importance
+from reminder_schedule import ReminderSchedule
+from linebot.v3.messaging import TextMessage, PushMessageRequest, MulticastRequest
+from http_pool import get_messaging_api
+from metrics import timed_job
+from tracing import traced
 from dotenv import load_dotenv
 
 # 載入環境變數
 load_dotenv()
 
 class EventReminder:
-    def __init__(self):
-        self.notion_manager = NotionManager()
-        configuration = Configuration(access_token=os.getenv("LINE_CHANNEL_ACCESS_TOKEN"))
-        api_client = ApiClient(configuration)
-        self.line_bot_api = MessagingApi(api_client)
+    # LINE multicast 每次最多 500 位收件者
+    MULTICAST_BATCH_SIZE = 500
+    
+    def __init__(self, notion_manager=None, line_bot_api=None):
+        # 與 main.py 共用同一個 NotionManager 與 LINE 連線池
+        self.notion_manager = notion_manager or NotionManager()
+        self.line_bot_api = line_bot_api or get_messaging_api()
         self.scheduler = BackgroundScheduler()
+        
+        # 提醒模式：daily 每天早上掃描未來 7 天；precise 依每個活動的提醒時刻觸發
+        self.mode = os.getenv("REMINDER_MODE", "daily").lower()
+        # 將提醒時間從早上9點改為早上6點
+        self.reminder_hour = int(os.getenv("REMINDER_HOUR", "6"))
+        self.reminder_schedule = ReminderSchedule(self.reminder_hour) if self.mode == "precise" else None
+        self._arm_lock = threading.Lock()
     
     def start(self):
         """啟動排程器"""
-        # 將提醒時間從早上9點改為早上6點
-        self.scheduler.add_job(
-            self.check_and_remind,
-            CronTrigger(hour=6, minute=0),
-            id='daily_reminder'
-        )
+        if self.reminder_schedule is not None:
+            # 新增或同步的活動立即計算提醒時刻；定期重新載入未來 8 天，補上直接在 Notion 修改的活動
+            self.notion_manager.add_listener(self.schedule_events)
+            refresh_hours = float(os.getenv("REMINDER_REFRESH_HOURS", "6"))
+            self.scheduler.add_job(
+                timed_job('reminder_refresh', self.load_upcoming),
+                IntervalTrigger(hours=refresh_hours),
+                id='reminder_refresh',
+                next_run_time=datetime.now(timezone.utc),
+                max_instances=1,
+                coalesce=True
+            )
+        else:
+            self.scheduler.add_job(
+                timed_job('daily_reminder', self.check_and_remind),
+                CronTrigger(hour=self.reminder_hour, minute=0),
+                id='daily_reminder'
+            )
+        
+        # 啟用本地鏡像時，定期以 last_edited_time 增量同步
+        if self.notion_manager.mirror:
+            sync_seconds = int(os.getenv("NOTION_MIRROR_SYNC_SECONDS", "60"))
+            self.scheduler.add_job(
+                timed_job('mirror_sync', self.notion_manager.sync_mirror),
+                IntervalTrigger(seconds=sync_seconds),
+                id='mirror_sync',
+                next_run_time=datetime.now(timezone.utc),
+                max_instances=1,
+                coalesce=True
+            )
+            print(f"Notion 鏡像同步已啟動 - 每 {sync_seconds} 秒同步一次")
         
         # 啟動排程器
         self.scheduler.start()
-        print("提醒排程器已啟動 - 設定為每天早上6點執行")
+        if self.reminder_schedule is not None:
+            print(f"提醒排程器已啟動 - 精準模式，依活動重要性在提醒日的 {self.reminder_hour} 點發送")
+        else:
+            print(f"提醒排程器已啟動 - 設定為每天早上{self.reminder_hour}點執行")
     
     def stop(self):
         """停止排程器"""
         self.scheduler.shutdown()
         print("提醒排程器已停止")
     
+    @traced("EventReminder.check_and_remind")
     def check_and_remind(self):
         """檢查即將到來的活動並根據重要性發送提醒"""
         try:
             # 使用帶時區的日期時間，解決時區問題
             today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
             
-            # 獲取未來7天內的所有活動（為了高重要性的每天提醒）
-            all_events = self.notion_manager.query_events(today, today + timedelta(days=7))
-            
-            if not all_events:
-                print("未找到需要提醒的活動")
-                return
+            # 逐頁取得未來7天內的所有活動（為了高重要性的每天提醒），邊取邊篩選
+            all_events = self.notion_manager.iter_events(today, today + timedelta(days=7))
             
             # 篩選不同重要性的活動
             events_to_remind = []
+            found_any = False
             
             for event in all_events:
-                # 確保使用相同時區格式的日期時間進行比較
-                event_time = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
-                event_date = event_time.replace(hour=0, minute=0, second=0, microsecond=0)
+                found_any = True
                 
-                # 計算日期差異時確保兩個日期時間都帶有時區信息
-                days_until_event = (event_date - today).days
-                importance = event["importance"]
+                # Event 建立時已解析出 UTC 日期，直接比較
+                if event.day is None:
+                    continue
+                days_until_event = (event.day - today.date()).days
+                importance = event.importance
                 
                 # 高重要性：每天提醒
-                if importance == "高":
+                if importance == Importance.HIGH:
                     # 活動日期在未來7天內都要提醒
                     if 0 <= days_until_event <= 7:
                         events_to_remind.append(event)
                 
                 # 中重要性：當天和3天前提醒
-                elif importance == "中":
+                elif importance == Importance.MEDIUM:
                     # 當天或剛好3天前
                     if days_until_event == 0 or days_until_event == 3:
                         events_to_remind.append(event)
                 
                 # 低重要性：僅當天提醒
-                elif importance == "低":
+                elif importance == Importance.LOW:
                     # 僅當天
                     if days_until_event == 0:
                         events_to_remind.append(event)
             
+            if not found_any:
+                print("未找到需要提醒的活動")
+                return
+            
             if not events_to_remind:
                 print("今天沒有需要提醒的活動")
                 return
             
             print(f"根據重要性篩選後，找到 {len(events_to_remind)} 個需要提醒的活動")
             
-            # 向所有需要提醒的用戶發送消息
-            for user_id in self.get_reminder_recipients():
-                self.send_reminders(user_id, events_to_remind)
+            # 向所有需要提醒的用戶發送消息（相同內容合併為 multicast）
+            self.deliver_reminders({
+                user_id: events_to_remind for user_id in self.get_reminder_recipients()
+            })
             
             # 僅更新當天活動的提醒狀態為"已提醒"
+            todays_event_ids = []
             for event in events_to_remind:
-                event_time = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
-                event_date = event_time.replace(hour=0, minute=0, second=0, microsecond=0)
-                
                 # 只有當天的活動才標記為已提醒，因為高重要性的活動需要每天提醒
-                if (event_date - today).days == 0:
-                    self.notion_manager.update_reminder_status(event["id"], "已提醒")
+                if event.day == today.date():
+                    todays_event_ids.append(event.id)
+            
+            # 並行更新，避免數百個活動逐一等待 pages.update
+            results = self.notion_manager.update_reminder_statuses(todays_event_ids, "已提醒")
+            failed = [page_id for page_id, ok in results.items() if not ok]
+            if failed:
+                print(f"以下活動的提醒狀態更新失敗: {failed}")
         
         except Exception as e:
             print(f"提醒過程中出錯: {e}")
     
+    def schedule_events(self, events):
+        """計算活動的提醒時刻並放入排程 (NotionManager 新增或同步活動時呼叫)"""
+        queued = 0
+        for event in events:
+            try:
+                queued += self.reminder_schedule.schedule(event)
+            except (KeyError, ValueError) as e:
+                print(f"無法排程活動 {event.get('id')} 的提醒: {e}")
+        self._arm()
+        return queued
+    
+    @traced("EventReminder.load_upcoming")
+    def load_upcoming(self):
+        """載入未來 8 天內的活動並排程提醒 (高重要性活動最早在 7 天前提醒)"""
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        window_end = today + timedelta(days=8)
+        before = self.reminder_schedule.version
+        try:
+            events = self.notion_manager.query_events(today, window_end)
+        except (CircuitOpenError, NotionQueryError) as e:
+            # 查詢不完整時保留現有排程，不能把沒查到的活動當作已刪除
+            print(f"精準提醒排程重新載入失敗，保留現有排程: {e}")
+            return
+        queued = self.schedule_events(events)
+        
+        # 窗口內已排程、但這次查詢沒有出現的活動已在 Notion 刪除或改期，移除其提醒
+        removed = self.reminder_schedule.prune(today, window_end, {event.id for event in events}, before)
+        if removed:
+            self._arm()
+        print(
+            f"精準提醒排程：{len(self.reminder_schedule)} 個活動，本次排入 {queued} 個提醒時刻，"
+            f"移除 {len(removed)} 個已刪除或改期的活動"
+        )
+    
+    @traced("EventReminder.send_due_reminders")
+    def send_due_reminders(self, now=None):
+        """
+        只發送已到期的提醒，並將活動當天的提醒標記為已提醒
+        
+        參數:
+        now (datetime, optional): 視為現在的時間，提前發送提醒時使用
+        
+        返回:
+        int: 發送提醒的活動數
+        """
+        try:
+            due = self.reminder_schedule.pop_due(now)
+            if not due:
+                return 0
+            
+            events = sorted((event for event, _ in due), key=lambda event: event.start_ts)
+            print(f"精準提醒：{len(events)} 個活動到期")
+            self.deliver_reminders({
+                user_id: events for user_id in self.get_reminder_recipients()
+            })
+            
+            todays_event_ids = [event.id for event, event_day in due if event_day]
+            results = self.notion_manager.update_reminder_statuses(todays_event_ids, "已提醒")
+            failed = [page_id for page_id, ok in results.items() if not ok]
+            if failed:
+                print(f"以下活動的提醒狀態更新失敗: {failed}")
+            return len(events)
+        
+        except Exception as e:
+            print(f"精準提醒過程中出錯: {e}")
+            return 0
+        finally:
+            self._arm()
+    
+    def _arm(self):
+        """將 precise_reminder 工作設定在下一個提醒時刻執行"""
+        with self._arm_lock:
+            next_due = self.reminder_schedule.next_due()
+            job = self.scheduler.get_job('precise_reminder')
+            if next_due is None:
+                if job:
+                    job.remove()
+                return
+            if job and getattr(job, "next_run_time", None) == next_due:
+                return
+            self.scheduler.add_job(
+                timed_job('precise_reminder', self.send_due_reminders),
+                DateTrigger(run_date=next_due),
+                id='precise_reminder',
+                replace_existing=True,
+                misfire_grace_time=3600
+            )
+    
+    @traced("EventReminder.deliver_reminders")
+    def deliver_reminders(self, recipients):
+        """
+        將提醒發送給多位用戶
+        
+        相同活動清單的提醒只產生一次訊息，收件者依內容分組後以 multicast 每批最多 500 人發送
+        
+        參數:
+        recipients (dict): 用戶 ID 對應要提醒的活動列表
+        
+        返回:
+        int: 呼叫 LINE API 的次數
+        """
+        # 依活動清單分組，同一份清單只產生一次訊息
+        groups = {}
+        for user_id, events in recipients.items():
+            if not events:
+                continue
+            key = tuple(event.id for event in events)
+            if key not in groups:
+                groups[key] = (self.render_reminder_message(events), [])
+            groups[key][1].append(user_id)
+        
+        api_calls = 0
+        for message, user_ids in groups.values():
+            for i in range(0, len(user_ids), self.MULTICAST_BATCH_SIZE):
+                batch = user_ids[i:i + self.MULTICAST_BATCH_SIZE]
+                self._send_message(batch, message)
+                api_calls += 1
+        
+        if api_calls:
+            print(f"已向 {sum(len(user_ids) for _, user_ids in groups.values())} 位用戶發送提醒，共 {api_calls} 次 API 呼叫")
+        return api_calls
+    
     def send_reminders(self, user_id, events):
         """向指定用戶發送活動提醒"""
-        try:
-            # 創建提醒消息
-            message = "📅 活動提醒：\n\n"
+        self._send_message([user_id], self.render_reminder_message(events))
+    
+    def render_reminder_message(self, events):
+        """將活動列表依日期分組，產生提醒訊息文字"""
+        parts = ["📅 活動提醒：\n\n"]
+        
+        # 將活動按照日期分組
+        events_by_date = {}
+        for event in events:
+            events_by_date.setdefault(event.start.strftime("%Y/%m/%d"), []).append(event)
+        
+        # 按日期順序顯示活動
+        for date in sorted(events_by_date.keys()):
+            parts.append(f"📆 {date}:\n")
             
-            # 將活動按照日期分組
-            events_by_date = {}
-            for event in events:
-                # 確保使用一致的時區格式
-                event_time = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
-                event_date = event_time.strftime("%Y/%m/%d")
+            for event in events_by_date[date]:
+                parts.append(f"- {event.name} ({event.start.strftime('%H:%M')})\n")
+                parts.append(f"  [{event.category}] ")
                 
-                if event_date not in events_by_date:
-                    events_by_date[event_date] = []
+                # 顯示重要性
+                if event.importance == Importance.HIGH:
+                    parts.append("🔴 高重要性")
+                elif event.importance == Importance.MEDIUM:
+                    parts.append("🟡 中重要性")
+                else:
+                    parts.append("🟢 低重要性")
                 
-                events_by_date[event_date].append(event)
-            
-            # 按日期順序顯示活動
-            for date in sorted(events_by_date.keys()):
-                message += f"📆 {date}:\n"
+                parts.append("\n")
                 
-                for event in events_by_date[date]:
-                    # 確保使用一致的時區格式
-                    event_time = datetime.fromisoformat(event["time"].replace("Z", "+00:00"))
-                    formatted_time = event_time.strftime("%H:%M")
-                    
-                    message += f"- {event['name']} ({formatted_time})\n"
-                    message += f"  [{event['category']}] "
-                    
-                    # 顯示重要性
-                    if event["importance"] == "高":
-                        message += "🔴 高重要性"
-                    elif event["importance"] == "中":
-                        message += "🟡 中重要性"
-                    else:
-                        message += "🟢 低重要性"
-                    
-                    message += "\n"
-                    
-                    if event["notes"]:
-                        message += f"  備註：{event['notes']}\n"
-                    
-                    message += "\n"
-            
-            # 發送消息
-            push_message_request = PushMessageRequest(
-                to=user_id,
-                messages=[TextMessage(text=message)]
-            )
-            self.line_bot_api.push_message(push_message_request)
-            
-            print(f"已向用戶 {user_id} 發送提醒")
+                if event.notes:
+                    parts.append(f"  備註：{event.notes}\n")
+                
+                parts.append("\n")
+        
+        return "".join(parts)
+    
+    def _send_message(self, user_ids, message):
+        """發送訊息，單一收件者使用 push，多位收件者使用 multicast"""
+        try:
+            if len(user_ids) == 1:
+                self.line_bot_api.push_message(
+                    PushMessageRequest(
+                        to=user_ids[0],
+                        messages=[TextMessage(text=message)]
+                    )
+                )
+                print(f"已向用戶 {user_ids[0]} 發送提醒")
+            else:
+                self.line_bot_api.multicast(
+                    MulticastRequest(
+                        to=user_ids,
+                        messages=[TextMessage(text=message)]
+                    )
+                )
+                print(f"已以 multicast 向 {len(user_ids)} 位用戶發送提醒")
         
         except Exception as e:
             print(f"發送提醒時出錯: {e}")
@@ -161,18 +340,39 @@ class EventReminder:
         """獲取需要接收提醒的用戶 ID 列表"""
         # 這裡可以從配置文件或資料庫中獲取用戶 ID
         # 暫時返回一個硬編碼的列表，您需要根據實際情況修改
-        admin_id = os.getenv("ADMIN_USER_ID", "")
-        if admin_id == "您的_LINE_用戶_ID" or not admin_id:
+        # ADMIN_USER_ID 可填入多個以逗號分隔的用戶 ID
+        admin_ids = os.getenv("ADMIN_USER_ID", "")
+        recipients = []
+        for admin_id in admin_ids.split(","):
+            admin_id = admin_id.strip()
+            if admin_id and admin_id != "您的_LINE_用戶_ID" and admin_id not in recipients:
+                recipients.append(admin_id)
+        if not recipients:
             print("警告：ADMIN_USER_ID 未設置，提醒將不會發送")
-            return []
-        return [admin_id]
+        return recipients
     
     def manual_remind(self, user_id):
         """手動觸發提醒"""
         try:
+            if self.reminder_schedule is not None:
+                return self._manual_remind_precise()
             # 手動提醒模式下，直接使用重要性邏輯進行提醒
             self.check_and_remind()
             return "已手動觸發活動提醒，根據重要性發送了不同時間的提醒"
         except Exception as e:
             print(f"手動提醒時出錯: {e}")
-            return "提醒發送過程中出錯，請稍後再試" 
\ No newline at end of file
+            return "提醒發送過程中出錯，請稍後再試" 
+    
+    def _manual_remind_precise(self):
+        """
+        精準模式的手動提醒：重新載入排程後，提前發送今天提醒時刻 (含) 以前的提醒
+        
+        與排程共用已提醒紀錄，手動發送過的提醒到了提醒時刻不會再發送一次；
+        若改用每日掃描，排程仍會在提醒時刻重複發送同一批提醒
+        """
+        self.load_upcoming()
+        reminder_time = datetime.now().replace(hour=self.reminder_hour, minute=0, second=0, microsecond=0).astimezone()
+        sent = self.send_due_reminders(max(reminder_time, datetime.now(timezone.utc)))
+        if not sent:
+            return "今天沒有尚未發送的活動提醒"
+        return f"已手動觸發活動提醒，提前發送了 {sent} 個活動的今日提醒"
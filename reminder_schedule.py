@@ -0,0 +1,185 @@
+import heapq
+import itertools
+import threading
+from datetime import datetime, time, timedelta, timezone
+
+from event_model import Importance
+
+# 依重要性決定在活動前幾天提醒 (天數規則與每日掃描相同，但以伺服器本地日期計算)
+# 高：活動前 7 天起每天；中：活動前 3 天與當天；低：僅當天
+REMINDER_DAYS_BEFORE = {
+    Importance.HIGH: tuple(range(7, -1, -1)),
+    Importance.MEDIUM: (3, 0),
+    Importance.LOW: (0,),
+}
+
+
+class ReminderSchedule:
+    """
+    每個活動的提醒時刻組成的最小堆積
+
+    活動新增或同步時計算其提醒時刻 (提醒日的 reminder_hour 點，伺服器本地時間) 放入堆積，
+    到期時只取出到期的提醒，工作量與發送的提醒數成正比，而非資料庫中的活動數。
+    同一活動再次排程時，舊的時刻以版本號作廢 (惰性刪除)
+    """
+
+    def __init__(self, reminder_hour=6):
+        self.reminder_hour = reminder_hour
+        self._heap = []             # (觸發時間戳, 序號, 活動 ID, 版本, 提醒時間戳, 是否為活動當天)
+        self._events = {}           # 活動 ID -> (版本, 活動資料)
+        self._fired = {}            # (活動 ID, 提醒時間戳) -> 提醒時間戳，避免重新排程後重複提醒
+        self._version = 0           # 最近一次排程的版本號
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._events)
+
+    def reminder_instants(self, event, now=None):
+        """
+        計算活動尚未觸發的提醒時刻
+
+        活動當天的提醒時刻已過但活動尚未開始時 (例如早上 6 點後才新增當天的活動)，
+        仍保留該時刻，排程時會改為立即提醒
+
+        返回:
+        list: [(提醒時間 datetime, 是否為活動當天)]
+        """
+        now = now or datetime.now(timezone.utc)
+        days_before = REMINDER_DAYS_BEFORE.get(event.importance)
+        if not days_before or event.start is None:
+            return []
+
+        # 提醒日以活動在伺服器本地時區的日期計算，與 reminder_hour 的時區一致；
+        # 若用 UTC 日期 (event.day)，本地凌晨的活動 (例如 +08:00 的 00:00-08:00) 會提早一天提醒並標記已提醒
+        event_time = event.start
+        event_day = event_time.astimezone().date()
+        instants = []
+        for days in days_before:
+            # 提醒日的 reminder_hour 點 (伺服器本地時間)
+            at = datetime.combine(event_day - timedelta(days=days), time(self.reminder_hour)).astimezone()
+            if at > now:
+                instants.append((at, days == 0))
+            elif days == 0 and event_time > now and now - at < timedelta(days=1):
+                instants.append((at, True))
+        return instants
+
+    def schedule(self, event, now=None):
+        """
+        排程 (或重新排程) 活動的提醒，取代該活動先前的提醒時刻
+
+        返回:
+        int: 排入的提醒時刻數
+        """
+        now = now or datetime.now(timezone.utc)
+        instants = self.reminder_instants(event, now)
+        with self._lock:
+            # 以提醒時刻 (而非實際觸發時間) 判斷是否已提醒過，補發的當天提醒也不會重複
+            pending = [
+                (at.timestamp(), event_day) for at, event_day in instants
+                if (event.id, at.timestamp()) not in self._fired
+            ]
+            if not pending:
+                self._events.pop(event.id, None)
+                return 0
+            self._version += 1
+            version = self._version
+            self._events[event.id] = (version, event)
+            now_ts = now.timestamp()
+            for timestamp, event_day in pending:
+                heapq.heappush(
+                    self._heap,
+                    (max(timestamp, now_ts), next(self._sequence), event.id, version, timestamp, event_day)
+                )
+            # 同一活動反覆重新排程時，作廢的時刻過多就重建堆積
+            if len(self._heap) > 4 * max(len(self._events) * len(REMINDER_DAYS_BEFORE[Importance.HIGH]), 256):
+                self._heap = [
+                    entry for entry in self._heap
+                    if self._events.get(entry[2], (None,))[0] == entry[3]
+                ]
+                heapq.heapify(self._heap)
+            return len(pending)
+
+    def remove(self, event_id):
+        with self._lock:
+            self._events.pop(event_id, None)
+
+    @property
+    def version(self):
+        """最近一次排程的版本號，之後才排入的活動版本號都比它大"""
+        with self._lock:
+            return self._version
+
+    def prune(self, start, end, keep_ids, up_to_version):
+        """
+        移除活動時間在 start 到 end 之間、但不在 keep_ids 中的活動 (已刪除或已改到其他時間)
+
+        參數:
+        start (datetime): 查詢窗口的開始時間
+        end (datetime): 查詢窗口的結束時間
+        keep_ids (set): 該窗口完整查詢結果中的活動 ID
+        up_to_version (int): 查詢開始前的 version；之後才由新增或同步排入的活動不會被移除
+
+        返回:
+        list: 被移除的活動 ID
+        """
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        with self._lock:
+            stale = [
+                event_id for event_id, (version, event) in self._events.items()
+                if version <= up_to_version
+                and event_id not in keep_ids
+                and event.start_ts is not None
+                and start_ts <= event.start_ts <= end_ts
+            ]
+            for event_id in stale:
+                del self._events[event_id]
+        return stale
+
+    def next_due(self):
+        """最早的有效提醒時間，沒有任何提醒時返回 None"""
+        with self._lock:
+            self._drop_stale()
+            if not self._heap:
+                return None
+            return datetime.fromtimestamp(self._heap[0][0], timezone.utc)
+
+    def pop_due(self, now=None):
+        """
+        取出所有已到期的提醒
+
+        返回:
+        list: [(活動資料, 是否為活動當天)]，同一活動只出現一次
+        """
+        now_ts = (now or datetime.now(timezone.utc)).timestamp()
+        due = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_ts:
+                _, _, event_id, version, timestamp, event_day = heapq.heappop(self._heap)
+                current = self._events.get(event_id)
+                if current is None or current[0] != version:
+                    continue
+                self._fired[(event_id, timestamp)] = timestamp
+                _, was_event_day = due.get(event_id, (None, False))
+                due[event_id] = (current[1], was_event_day or event_day)
+
+            # 活動當天提醒後就不會再有提醒時刻
+            for event_id, (_, event_day) in due.items():
+                if event_day:
+                    self._events.pop(event_id, None)
+
+            # 只需記住一天內觸發過的時刻
+            horizon = now_ts - 86400
+            for key in [key for key, timestamp in self._fired.items() if timestamp < horizon]:
+                del self._fired[key]
+        return list(due.values())
+
+    def _drop_stale(self):
+        """需持有 self._lock：丟棄堆頂已作廢的時刻"""
+        while self._heap:
+            event_id, version = self._heap[0][2:4]
+            current = self._events.get(event_id)
+            if current is not None and current[0] == version:
+                return
+            heapq.heappop(self._heap)
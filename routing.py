@@ -0,0 +1,244 @@
+from urllib.parse import unquote_plus
+
+from metrics import HANDLER_SECONDS, track
+from tracing import span
+
+
+class PostbackContext:
+    """單一 postback 事件的處理資訊"""
+
+    __slots__ = ("event", "user_id", "reply_token", "data", "params", "picker")
+
+    def __init__(self, event, user_id, reply_token, data, params, picker):
+        self.event = event
+        self.user_id = user_id
+        self.reply_token = reply_token
+        # 原始 postback data，例如 "action=select_importance_flex&value=高"
+        self.data = data
+        # 解析後的 data 參數，例如 {"action": "select_importance_flex", "value": "高"}
+        self.params = params
+        # 日期時間選擇器回傳的值，例如 {"datetime": "2025-01-01T10:00"}
+        self.picker = picker or {}
+
+
+class PostbackRouter:
+    """
+    postback 動作的分派表
+
+    data 以 query string 格式解析一次，再依 action 名稱以 dict 查找處理函數：
+
+        @postback_router.route("query_today")
+        def postback_query_today(ctx):
+            ...
+    """
+
+    def __init__(self):
+        self._routes = {}
+
+    def route(self, *actions):
+        """註冊處理一個或多個 action 的函數"""
+        def decorator(func):
+            for action in actions:
+                if action in self._routes:
+                    raise ValueError(f"postback action 重複註冊: {action}")
+                self._routes[action] = func
+            return func
+        return decorator
+
+    @property
+    def actions(self):
+        return list(self._routes)
+
+    @staticmethod
+    def parse(data):
+        """
+        將 "action=xxx&value=yyy" 解析為 dict
+
+        postback data 幾乎都是未編碼的短字串，只有含 % 或 + 時才進行 URL 解碼
+        """
+        params = {}
+        if not data:
+            return params
+        for part in data.split("&"):
+            if not part:
+                continue
+            key, _, value = part.partition("=")
+            if "%" in part or "+" in part:
+                key, value = unquote_plus(key), unquote_plus(value)
+            params[key] = value
+        return params
+
+    def resolve(self, data):
+        """
+        解析 postback data 並找出處理函數
+
+        返回:
+        tuple: (處理函數或 None, 解析後的參數)
+        """
+        params = self.parse(data)
+        return self._routes.get(params.get("action")), params
+
+    def dispatch(self, event, user_id, reply_token):
+        """
+        將 postback 事件交給對應的處理函數
+
+        返回:
+        bool: 是否找到處理函數
+        """
+        data = event.postback.data
+        func, params = self.resolve(data)
+        if func is None:
+            print(f"未知的 postback 動作: {data}")
+            return False
+
+        action = params["action"]
+        with track(HANDLER_SECONDS, kind="postback", action=action), span(f"postback {action}"):
+            func(PostbackContext(event, user_id, reply_token, data, params, event.postback.params))
+        return True
+
+
+class MessageContext:
+    """單一文字訊息的處理資訊"""
+
+    __slots__ = ("event", "user_id", "reply_token", "text", "arg")
+
+    def __init__(self, event, user_id, reply_token, text, arg):
+        self.event = event
+        self.user_id = user_id
+        self.reply_token = reply_token
+        # 使用者輸入的完整文字 (已去除前後空白)
+        self.text = text
+        # 前綴指令之後的內容，例如 "分類:會議" -> "會議"；其他情況與 text 相同
+        self.arg = arg
+
+
+class _CommandRoute:
+    __slots__ = ("func", "prefix", "when", "order")
+
+    def __init__(self, func, prefix, when, order):
+        self.func = func
+        self.prefix = prefix
+        self.when = when
+        self.order = order
+
+
+class _TrieNode:
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []
+
+
+class CommandRouter:
+    """
+    文字訊息的指令分派器
+
+    - command(): 以前綴樹註冊完全相符或前綴指令，可附帶依使用者狀態判斷的 when 條件
+    - step(): 依使用者目前所在的表單步驟 (表單名稱, step) 分派自由輸入的文字
+
+    解析順序與原本的 if/elif 鏈相同：
+    無條件指令 -> 表單步驟 -> 有條件的前綴指令 -> fallback
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._steps = {}
+        self._fallback = None
+        self._order = 0
+
+    def command(self, *keywords, prefix=False, when=None):
+        """
+        註冊指令
+
+        參數:
+        keywords (str): 指令文字，例如 "手動提醒" 或 "分類:"
+        prefix (bool): 是否為前綴指令 (之後的文字放在 ctx.arg)
+        when (callable, optional): 接收使用者狀態 dict，返回 True 時才套用此指令
+        """
+        def decorator(func):
+            for keyword in keywords:
+                node = self._root
+                for char in keyword:
+                    node = node.children.setdefault(char, _TrieNode())
+                node.routes.append(_CommandRoute(func, prefix, when, self._next_order()))
+            return func
+        return decorator
+
+    def step(self, form, *steps):
+        """註冊在使用者狀態 state[form]['step'] 為指定步驟時處理自由輸入文字的函數"""
+        def decorator(func):
+            for step in steps:
+                self._steps[(form, step)] = (self._next_order(), func)
+            return func
+        return decorator
+
+    def fallback(self, func):
+        """註冊沒有任何指令相符時的處理函數"""
+        self._fallback = func
+        return func
+
+    def resolve(self, text, state=None):
+        """
+        找出處理文字訊息的函數
+
+        參數:
+        text (str): 使用者輸入的文字
+        state (dict, optional): 使用者目前的狀態
+
+        返回:
+        tuple: (處理函數或 None, ctx.arg)
+        """
+        state = state or {}
+
+        # 沿前綴樹走一次，收集所有相符的指令 (較長的優先)
+        matches = []
+        node = self._root
+        last = len(text) - 1
+        for position, char in enumerate(text):
+            node = node.children.get(char)
+            if node is None:
+                break
+            for route in node.routes:
+                if route.prefix or position == last:
+                    matches.append((position + 1, route))
+        matches.reverse()
+
+        for length, route in matches:
+            if route.when is None:
+                return route.func, text[length:] if route.prefix else text
+
+        # 使用者所在的表單步驟，同時位於多個表單時取最先註冊的步驟
+        best = None
+        for form, form_state in state.items():
+            if isinstance(form_state, dict):
+                found = self._steps.get((form, form_state.get("step")))
+                if found and (best is None or found[0] < best[0]):
+                    best = found
+        if best:
+            return best[1], text
+
+        for length, route in matches:
+            if route.when is not None and route.when(state):
+                return route.func, text[length:] if route.prefix else text
+
+        return self._fallback, text
+
+    def dispatch(self, event, user_id, reply_token, text, state=None):
+        """
+        將文字訊息交給對應的處理函數
+
+        返回:
+        bool: 是否找到處理函數
+        """
+        func, arg = self.resolve(text, state)
+        if func is None:
+            return False
+        # 自由輸入的文字無法當作標籤，以處理函數名稱區分
+        with track(HANDLER_SECONDS, kind="message", action=func.__name__), span(f"message {func.__name__}"):
+            func(MessageContext(event, user_id, reply_token, text, arg))
+        return True
+
+    def _next_order(self):
+        self._order += 1
+        return self._order
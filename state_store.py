@@ -0,0 +1,367 @@
+import abc
+import copy
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from functools import wraps
+
+
+class StateStore(MutableMapping):
+    """
+    使用者對話狀態的儲存介面
+
+    以 dict 的方式使用：user_states[user_id] = {...}。
+    在 session() 內讀取的狀態會留在目前執行緒的工作區 (副本)，
+    巢狀修改 (user_states[user_id]['flex_form']['name'] = ...) 會在 session 結束時一次寫回後端；
+    狀態超過 ttl 秒未被使用就會自動過期，避免未完成的表單永久佔用空間。
+
+    寫回時比對讀取時的版本號 (compare-and-swap)：若同一用戶的另一個 session
+    (例如另一個 worker 行程) 已先寫入，重新讀取最新狀態，只套用本次 session
+    實際修改過的頂層欄位後再寫入，不會覆蓋對方的修改
+    """
+
+    # 寫回時版本衝突的最多重試次數
+    MAX_WRITE_RETRIES = 5
+
+    def __init__(self, ttl=1800):
+        self.ttl = ttl
+        # 寫回時發生版本衝突 (需要合併) 的次數
+        self.conflicts = 0
+        self._local = threading.local()
+
+    # 後端需實作的方法
+    @abc.abstractmethod
+    def _load(self, user_id):
+        """讀取未過期的狀態 (副本)，返回 (狀態, 版本號)；不存在時返回 (None, None)"""
+
+    @abc.abstractmethod
+    def _save(self, user_id, state, version):
+        """
+        目前版本與 version 相同時寫入狀態並重新計算過期時間 (version 為 None 表示預期目前不存在)
+
+        返回:
+        bool: 是否寫入；版本不符時返回 False
+        """
+
+    @abc.abstractmethod
+    def _delete(self, user_id, version):
+        """目前版本與 version 相同時刪除狀態，返回是否刪除"""
+
+    @abc.abstractmethod
+    def _keys(self):
+        """所有未過期的使用者 ID"""
+
+    @abc.abstractmethod
+    def purge_expired(self):
+        """清除已過期的狀態，返回清除的數量"""
+
+    # session 工作區
+    @contextmanager
+    def session(self):
+        """在目前執行緒開啟工作區，結束時把讀寫過的狀態寫回後端；可巢狀使用"""
+        if getattr(self._local, "workspace", None) is not None:
+            yield
+            return
+
+        self._local.workspace = {}
+        # user_id -> (讀取時的狀態, 版本號)，寫回時用來比對與合併
+        self._local.loaded = {}
+        try:
+            yield
+        finally:
+            workspace, loaded = self._local.workspace, self._local.loaded
+            self._local.workspace = None
+            self._local.loaded = None
+            for user_id, state in workspace.items():
+                base, version = loaded[user_id]
+                self._write_back(user_id, base, state, version)
+
+    def in_session(self, func):
+        """裝飾器：在 session 中執行處理函數"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.session():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _write_back(self, user_id, base, state, version):
+        """以版本號寫回 session 的狀態，版本不符時與最新狀態合併後重試"""
+        for _ in range(self.MAX_WRITE_RETRIES):
+            if state:
+                if self._save(user_id, state, version):
+                    return
+            elif version is None or self._delete(user_id, version):
+                # 讀取時就不存在且沒有寫入，或已刪除
+                return
+
+            self.conflicts += 1
+            current, version = self._load(user_id)
+            state = merge_state(base, state, current)
+            base = copy.deepcopy(current)
+        print(f"使用者 {user_id} 的狀態持續發生寫入衝突，放棄本次修改")
+
+    def _workspace_load(self, workspace, user_id):
+        state, version = self._load(user_id)
+        workspace[user_id] = state
+        self._local.loaded[user_id] = (copy.deepcopy(state), version)
+        return state
+
+    # MutableMapping 介面
+    def __getitem__(self, user_id):
+        workspace = getattr(self._local, "workspace", None)
+        if workspace is None:
+            state = self._load(user_id)[0]
+        elif user_id in workspace:
+            state = workspace[user_id]
+        else:
+            state = self._workspace_load(workspace, user_id)
+
+        if state is None:
+            raise KeyError(user_id)
+        return state
+
+    def __setitem__(self, user_id, state):
+        workspace = getattr(self._local, "workspace", None)
+        if workspace is None:
+            # session 外直接覆寫 (以最新版本為準)
+            for _ in range(self.MAX_WRITE_RETRIES):
+                if self._save(user_id, state, self._load(user_id)[1]):
+                    return
+            print(f"使用者 {user_id} 的狀態持續發生寫入衝突，放棄本次修改")
+        else:
+            if user_id not in workspace:
+                self._workspace_load(workspace, user_id)
+            workspace[user_id] = state
+
+    def __delitem__(self, user_id):
+        self[user_id]
+        workspace = getattr(self._local, "workspace", None)
+        if workspace is None:
+            self._delete(user_id, self._load(user_id)[1])
+        else:
+            workspace[user_id] = None
+
+    def __contains__(self, user_id):
+        try:
+            self[user_id]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+
+def merge_state(base, mine, theirs):
+    """
+    三方合併頂層欄位：以最新狀態 (theirs) 為準，套用本次 session 相對於讀取時 (base) 修改過的欄位
+
+    兩邊都修改了同一欄位時以本次 session 為準；返回 None 表示合併後沒有任何欄位
+    """
+    base, mine = base or {}, mine or {}
+    merged = dict(theirs or {})
+    for key in set(base) | set(mine):
+        if key not in mine:
+            if key in base:
+                merged.pop(key, None)
+        elif key not in base or base[key] != mine[key]:
+            merged[key] = mine[key]
+    return merged or None
+
+
+def new_version():
+    """隨機版本號，刪除後重新建立的狀態不會與舊版本號相同"""
+    return random.getrandbits(62)
+
+
+class MemoryStateStore(StateStore):
+    """行程內的 LRU + TTL 狀態儲存，僅適用單一 worker 行程"""
+
+    def __init__(self, ttl=1800, max_users=10000):
+        super().__init__(ttl)
+        self.max_users = max_users
+        self._states = OrderedDict()  # user_id -> (過期時間, 版本號, 狀態)
+        self._lock = threading.Lock()
+
+    def _current(self, user_id):
+        """需持有 self._lock；返回未過期的項目"""
+        entry = self._states.get(user_id)
+        if entry is not None and entry[0] <= time.time():
+            del self._states[user_id]
+            entry = None
+        return entry
+
+    def _load(self, user_id):
+        with self._lock:
+            entry = self._current(user_id)
+            if entry is None:
+                return None, None
+            self._states.move_to_end(user_id)
+            # 返回副本，session 內的修改在寫回前不會影響其他執行緒
+            return copy.deepcopy(entry[2]), entry[1]
+
+    def _save(self, user_id, state, version):
+        with self._lock:
+            entry = self._current(user_id)
+            if (entry[1] if entry else None) != version:
+                return False
+            self._states[user_id] = (time.time() + self.ttl, new_version(), state)
+            self._states.move_to_end(user_id)
+            # 超過上限時淘汰最久未使用的使用者
+            while len(self._states) > self.max_users:
+                self._states.popitem(last=False)
+            return True
+
+    def _delete(self, user_id, version):
+        with self._lock:
+            entry = self._current(user_id)
+            if entry is None or entry[1] != version:
+                return entry is None and version is None
+            del self._states[user_id]
+            return True
+
+    def _keys(self):
+        self.purge_expired()
+        with self._lock:
+            return list(self._states)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [user_id for user_id, entry in self._states.items() if entry[0] <= now]
+            for user_id in expired:
+                del self._states[user_id]
+        return len(expired)
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite (WAL) 狀態儲存，多個 worker 行程可共用同一個檔案 (以版本號避免互相覆蓋)"""
+
+    # 每寫入多少次順便清除一次過期狀態
+    PURGE_EVERY = 100
+
+    def __init__(self, path, ttl=1800):
+        super().__init__(ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_states (
+                user_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        # 舊版建立的資料表沒有 version 欄位
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(user_states)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE user_states ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_user_states_expires ON user_states (expires_at)")
+        self._conn.commit()
+
+    def _load(self, user_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version FROM user_states WHERE user_id = ? AND expires_at > ?",
+                (user_id, time.time())
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def _save(self, user_id, state, version):
+        data = json.dumps(state, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            if version is None:
+                # 預期不存在：只有沒有資料或已過期時才寫入
+                cursor = self._conn.execute(
+                    """
+                    INSERT INTO user_states (user_id, data, expires_at, version) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        data = excluded.data, expires_at = excluded.expires_at, version = excluded.version
+                    WHERE user_states.expires_at <= ?
+                    """,
+                    (user_id, data, now + self.ttl, new_version(), now)
+                )
+            else:
+                cursor = self._conn.execute(
+                    """
+                    UPDATE user_states SET data = ?, expires_at = ?, version = ?
+                    WHERE user_id = ? AND version = ? AND expires_at > ?
+                    """,
+                    (data, now + self.ttl, new_version(), user_id, version, now)
+                )
+            self._conn.commit()
+            saved = cursor.rowcount > 0
+            if saved:
+                self._writes += 1
+            should_purge = saved and self._writes % self.PURGE_EVERY == 0
+        if should_purge:
+            self.purge_expired()
+        return saved
+
+    def _delete(self, user_id, version):
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM user_states WHERE user_id = ? AND version = ?",
+                (user_id, version)
+            )
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def _keys(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM user_states WHERE expires_at > ?",
+                (time.time(),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM user_states WHERE expires_at > ?",
+                (time.time(),)
+            ).fetchone()[0]
+
+    def purge_expired(self):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM user_states WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+def create_state_store():
+    """
+    依環境變數建立狀態儲存
+
+    STATE_STORE: memory (預設) 或 sqlite
+    STATE_STORE_PATH: SQLite 檔案路徑
+    STATE_TTL_SECONDS: 狀態閒置多久後過期
+    STATE_MAX_USERS: memory 模式下最多保留的使用者數
+    """
+    backend = os.getenv("STATE_STORE", "memory").lower()
+    ttl = int(os.getenv("STATE_TTL_SECONDS", "1800"))
+
+    if backend == "sqlite":
+        path = os.getenv("STATE_STORE_PATH", "user_states.db")
+        print(f"使用者狀態儲存：SQLite ({path})，閒置 {ttl} 秒後過期")
+        return SQLiteStateStore(path, ttl=ttl)
+
+    max_users = int(os.getenv("STATE_MAX_USERS", "10000"))
+    print(f"使用者狀態儲存：記憶體 (最多 {max_users} 位使用者)，閒置 {ttl} 秒後過期")
+    return MemoryStateStore(ttl=ttl, max_users=max_users)
@@ -0,0 +1,245 @@
+import contextvars
+import hashlib
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# 目前執行中的 span (依執行緒 / context 各自獨立)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    單一計時區段，輸出格式與 OpenTelemetry ConsoleSpanExporter 相同
+
+    trace_id 為 32 位十六進位、span_id 為 16 位十六進位，可直接匯入 OTLP 相容的收集器
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "UNSET"
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, error):
+        self.status = "ERROR"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        status = {"status_code": self.status}
+        if self.error:
+            status["description"] = self.error
+        return {
+            "name": self.name,
+            "context": {
+                "trace_id": f"0x{self.trace_id}",
+                "span_id": f"0x{self.span_id}"
+            },
+            "parent_id": f"0x{self.parent_id}" if self.parent_id else None,
+            "start_time": _format_ns(self.start_ns),
+            "end_time": _format_ns(self.end_ns),
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """追蹤停用時使用，所有操作皆不做事"""
+
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, error):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Exporter:
+    """將結束的 span 以 JSON 逐行寫到 console (stdout) 或檔案"""
+
+    def __init__(self, target, path=None):
+        self.target = target
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if target == "file" else None
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self._lock:
+            if self._file:
+                self._file.write(line + "\n")
+                self._file.flush()
+            else:
+                sys.stdout.write(line + "\n")
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+_enabled = None
+
+
+def _get_exporter():
+    """
+    依環境變數建立輸出目標
+
+    TRACE_EXPORTER: none (預設，停用)、console 或 file
+    TRACE_FILE: file 模式下的 JSON Lines 檔案路徑
+    """
+    global _exporter, _enabled
+    if _enabled is None:
+        with _exporter_lock:
+            if _enabled is None:
+                target = os.getenv("TRACE_EXPORTER", "none").lower()
+                if target in ("console", "file"):
+                    _exporter = _Exporter(target, os.getenv("TRACE_FILE", "traces.jsonl"))
+                _enabled = _exporter is not None
+    return _exporter
+
+
+def trace_id_for(key):
+    """由 LINE webhook 事件 ID 等關聯鍵導出固定的 trace_id，同一事件的所有 span 會歸在同一個 trace"""
+    return hashlib.sha256(str(key).encode("utf-8")).hexdigest()[:32]
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, trace_key=None, **attributes):
+    """
+    建立 span 並設為目前的 span；巢狀使用時自動成為上一層的子 span
+
+    參數:
+    name (str): span 名稱
+    trace_key (str, optional): 關聯鍵 (LINE webhook 事件 ID)，同一鍵的 span 共用 trace_id
+    attributes: span 屬性
+    """
+    exporter = _get_exporter()
+    if exporter is None:
+        yield _NOOP
+        return
+
+    parent = _current_span.get()
+    if trace_key is not None:
+        trace_id = trace_id_for(trace_key)
+        if parent is not None and parent.trace_id != trace_id:
+            parent = None
+    else:
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+
+    current = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        if current.status == "UNSET":
+            current.status = "OK"
+        exporter.export(current)
+
+
+def traced(name=None):
+    """
+    裝飾器：以 span 包住函數；產生器函數的 span 涵蓋整個迭代過程，
+    但只在產生器內部執行時才設為目前的 span，避免呼叫端的後續 span 被誤掛在底下
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if _get_exporter() is None:
+                    yield from func(*args, **kwargs)
+                    return
+                context = contextvars.copy_context()
+                manager = span(span_name)
+                current = context.run(manager.__enter__)
+                inner = func(*args, **kwargs)
+                count = 0
+                try:
+                    while True:
+                        try:
+                            item = context.run(next, inner)
+                        except StopIteration:
+                            break
+                        count += 1
+                        yield item
+                except GeneratorExit:
+                    # 呼叫端提前停止迭代不算錯誤
+                    context.run(inner.close)
+                    current.set_attribute("items", count)
+                    context.run(manager.__exit__, None, None, None)
+                    raise
+                except BaseException as e:
+                    current.set_attribute("items", count)
+                    context.run(manager.__exit__, type(e), e, e.__traceback__)
+                    raise
+                current.set_attribute("items", count)
+                context.run(manager.__exit__, None, None, None)
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_event(name):
+    """裝飾器：webhook 事件處理函數的根 span，以事件的 webhook_event_id 作為 trace 關聯鍵"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(event, *args, **kwargs):
+            event_id = getattr(event, "webhook_event_id", None)
+            with span(name, trace_key=event_id, **{"line.webhook_event_id": event_id or ""}) as current:
+                source = getattr(event, "source", None)
+                if source is not None and getattr(source, "user_id", None):
+                    current.set_attribute("line.user_id", source.user_id)
+                return func(event, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(func):
+    """讓 func 在其他執行緒 (例如 ThreadPoolExecutor) 中執行時，仍掛在目前的 span 底下"""
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def _format_ns(ns):
+    seconds, remainder = divmod(ns, 1_000_000_000)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{remainder:09d}Z"
@@ -0,0 +1,160 @@
+import queue
+import threading
+import time
+from collections import deque
+
+
+def source_key(event):
+    """事件來源的用戶 (或群組、聊天室) ID，同一來源的事件依序處理"""
+    source = getattr(event, "source", None)
+    return (
+        getattr(source, "user_id", None)
+        or getattr(source, "group_id", None)
+        or getattr(source, "room_id", None)
+    )
+
+
+class WebhookDispatcher:
+    """
+    Webhook 事件的背景處理池
+
+    /callback 驗證簽名後把事件放入有界佇列並立即回覆 200，
+    由固定數量的工作執行緒取出事件並呼叫 dispatch 處理。
+
+    同一用戶的事件 (例如 設定活動 → 選日期 → 選時間) 依收到的順序逐一處理，不會同時執行：
+    工作執行緒取出的事件若該用戶已有事件在處理，就排到該用戶的等待列，
+    由正在處理的執行緒處理完後依序接著處理；不同用戶的事件仍由空閒的執行緒並行處理，
+    用戶不會固定由某個工作執行緒處理。
+    尚未處理完的事件 (佇列中與用戶等待列中) 合計最多 max_queue 個，
+    已滿時 submit 會等待空位 (讓 LINE 稍候)，而不是在請求中另外處理而打亂順序
+    """
+
+    def __init__(self, dispatch, workers=4, max_queue=1000, key=source_key):
+        """
+        參數:
+        dispatch (callable): 處理單一 webhook 事件的函數
+        workers (int): 工作執行緒數量
+        max_queue (int): 尚未處理完的事件上限 (含用戶等待列)，滿了之後 submit 會等待空位
+        key (callable): 取出事件來源 (用戶 ID) 的函數；返回 None 的事件不限制順序
+        """
+        self._dispatch = dispatch
+        self._key = key
+        self._queue = queue.Queue()
+        # 每個事件從 submit 到處理完成佔用一個名額，排在用戶等待列中的事件同樣計入上限
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._workers = []
+        self._lock = threading.Lock()
+        # 正在處理中的用戶 -> 排在後面的事件
+        self._active = {}
+
+        self.worker_count = workers
+        self.max_queue = max_queue
+        self.processed = 0
+        self.failed = 0
+        self.blocked = 0
+        self.busy = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_wait = 0.0
+
+    def start(self):
+        """啟動工作執行緒"""
+        for i in range(self.worker_count):
+            worker = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"Webhook 背景處理已啟動 - {self.worker_count} 個工作執行緒，佇列上限 {self.max_queue}")
+
+    def stop(self, timeout=None):
+        """等待佇列清空後停止工作執行緒"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def submit(self, events):
+        """
+        將事件依序排入佇列；尚未處理完的事件已達上限時等待工作執行緒處理完騰出空位
+
+        參數:
+        events (list): 已驗證簽名並解析的 webhook 事件
+        """
+        for event in events:
+            if not self._slots.acquire(blocking=False):
+                with self._lock:
+                    self.blocked += 1
+                self._slots.acquire()
+            self._queue.put((event, time.monotonic()))
+
+    def stats(self):
+        """目前的佇列深度與等待時間統計"""
+        with self._lock:
+            handled = self.processed + self.failed
+            return {
+                "workers": self.worker_count,
+                "busy_workers": self.busy,
+                "queue_depth": self._queue.qsize(),
+                "waiting_for_user": sum(len(pending) for pending in self._active.values()),
+                "max_queue": self.max_queue,
+                "processed": self.processed,
+                "failed": self.failed,
+                "blocked": self.blocked,
+                "avg_wait_ms": round(self._wait_total / handled * 1000, 2) if handled else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+                "last_wait_ms": round(self._last_wait * 1000, 2)
+            }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            key = self._key(item[0])
+            if key is not None:
+                with self._lock:
+                    if key in self._active:
+                        # 同一用戶的前一個事件還在處理，排在它後面
+                        self._active[key].append(item)
+                        continue
+                    self._active[key] = deque()
+
+            # 處理這個事件，再依序處理處理期間排到同一用戶後面的事件
+            while item is not None:
+                self._handle(*item)
+                if key is None:
+                    break
+                with self._lock:
+                    pending = self._active[key]
+                    if pending:
+                        item = pending.popleft()
+                    else:
+                        del self._active[key]
+                        item = None
+
+    def _handle(self, event, enqueued_at):
+        wait = time.monotonic() - enqueued_at
+        with self._lock:
+            self.busy += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._last_wait = wait
+
+        succeeded = False
+        try:
+            self._dispatch(event)
+            succeeded = True
+        except Exception as e:
+            print(f"背景處理 webhook 事件時出錯: {e}")
+        finally:
+            with self._lock:
+                self.busy -= 1
+                if succeeded:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+            # 處理完成才釋出名額
+            self._slots.release()
+            self._queue.task_done()